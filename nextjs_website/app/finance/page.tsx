@@ -2,15 +2,19 @@
 
 import { useState, useEffect } from 'react'
 import Link from 'next/link'
-import { getTransactions, createTransaction, deleteTransaction, getTransactionTotals, getWallets, type Transaction, type Wallet } from '@/lib/api'
+import { getTransactionsPage, createTransaction, deleteTransaction, getTransactionTotals, getWallets, type Transaction, type Wallet } from '@/lib/api'
 import { Input } from '@/components/ui/Input'
 import { Select } from '@/components/ui/Select'
 import { Button } from '@/components/ui/Button'
 import { FontAwesomeIcon } from '@fortawesome/react-fontawesome'
 import { icons } from '@/lib/icons'
 
+const PAGE_SIZE = 50
+
 export default function FinancePage() {
   const [transactions, setTransactions] = useState<Transaction[]>([])
+  const [nextCursor, setNextCursor] = useState<string | null>(null)
+  const [loadingMore, setLoadingMore] = useState(false)
   const [wallets, setWallets] = useState<Wallet[]>([])
   const [loading, setLoading] = useState(true)
   const [showAddForm, setShowAddForm] = useState(false)
@@ -34,8 +38,9 @@ export default function FinancePage() {
   const loadTransactions = async () => {
     try {
       setLoading(true)
-      const data = await getTransactions()
-      setTransactions(data)
+      const page = await getTransactionsPage({ limit: PAGE_SIZE })
+      setTransactions(page.items)
+      setNextCursor(page.nextCursor)
     } catch (error) {
       console.error('Failed to load transactions:', error)
       alert('Failed to load transactions. Please check if the server is running.')
@@ -44,6 +49,20 @@ export default function FinancePage() {
     }
   }
 
+  const loadMoreTransactions = async () => {
+    if (!nextCursor) return
+    try {
+      setLoadingMore(true)
+      const page = await getTransactionsPage({ limit: PAGE_SIZE, cursor: nextCursor })
+      setTransactions((current) => [...current, ...page.items])
+      setNextCursor(page.nextCursor)
+    } catch (error) {
+      console.error('Failed to load more transactions:', error)
+    } finally {
+      setLoadingMore(false)
+    }
+  }
+
   const loadTotals = async () => {
     try {
       const data = await getTransactionTotals()
@@ -386,6 +405,13 @@ export default function FinancePage() {
                   ))}
                 </tbody>
               </table>
+              {nextCursor && (
+                <div className="text-center mt-4">
+                  <Button onClick={loadMoreTransactions} variant="secondary" disabled={loadingMore}>
+                    {loadingMore ? 'Loading...' : 'Load more'}
+                  </Button>
+                </div>
+              )}
             </div>
           )}
         </div>
@@ -2,7 +2,7 @@
 
 import { useState, useEffect } from 'react'
 import Link from 'next/link'
-import { getAllMarketData, type AllMarketData, type MarketData } from '@/lib/api'
+import { getAllMarketData, subscribeMarketData, type AllMarketData, type MarketData } from '@/lib/api'
 import { FontAwesomeIcon } from '@fortawesome/react-fontawesome'
 import { icons } from '@/lib/icons'
 
@@ -13,9 +13,23 @@ export default function MarketsPage() {
 
   useEffect(() => {
     loadMarketData()
-    // Auto-refresh every 30 seconds
-    const interval = setInterval(loadMarketData, 30000)
-    return () => clearInterval(interval)
+    let interval: ReturnType<typeof setInterval> | null = null
+    // Live updates pushed by the server; fall back to polling every 30 seconds
+    // if the stream is unavailable
+    const unsubscribe = subscribeMarketData(
+      (update) => {
+        setMarketData((current) => ({ ...current, ...update } as AllMarketData))
+        setLastUpdate(new Date())
+      },
+      () => {
+        unsubscribe()
+        if (!interval) interval = setInterval(loadMarketData, 30000)
+      }
+    )
+    return () => {
+      unsubscribe()
+      if (interval) clearInterval(interval)
+    }
   }, [])
 
   const loadMarketData = async () => {
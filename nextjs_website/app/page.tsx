@@ -2,7 +2,7 @@
 
 import { useState, useEffect } from 'react'
 import Link from 'next/link'
-import { getTransactions, getTransactionTotals, getAllMarketData, type Transaction, type AllMarketData } from '@/lib/api'
+import { getTransactionsPage, getTransactionTotals, getAllMarketData, type Transaction, type AllMarketData } from '@/lib/api'
 import { FontAwesomeIcon } from '@fortawesome/react-fontawesome'
 import Image from 'next/image'
 import {
@@ -35,11 +35,11 @@ export default function Home() {
     try {
       setLoading(true)
       const [transData, totalsData, marketDataResult] = await Promise.all([
-        getTransactions(),
+        getTransactionsPage({ limit: 5 }),
         getTransactionTotals(),
         getAllMarketData().catch(() => null) // Don't fail if market data unavailable
       ])
-      setTransactions(transData.slice(0, 5)) // Show only recent 5
+      setTransactions(transData.items) // Show only recent 5
       setTotals(totalsData)
       setMarketData(marketDataResult)
     } catch (error) {
@@ -9,6 +9,7 @@ export interface Transaction {
   category: string
   wallet_id: number | null
   date: string
+  transfer_id?: number | null
   created_at: string
 }
 
@@ -21,10 +22,34 @@ export interface TransactionCreate {
   date: string
 }
 
+// Newest page only; use getTransactionsPage to follow the cursor
 export async function getTransactions(): Promise<Transaction[]> {
-  const response = await fetch(`${API_BASE_URL}/api/transactions`)
+  return (await getTransactionsPage()).items
+}
+
+export interface TransactionQuery {
+  limit?: number
+  cursor?: string | null
+  wallet_id?: number
+  type?: 'income' | 'expense'
+  category?: string
+  from?: string
+  to?: string
+}
+
+export interface TransactionPage {
+  items: Transaction[]
+  nextCursor: string | null
+}
+
+export async function getTransactionsPage(query: TransactionQuery = {}): Promise<TransactionPage> {
+  const params = new URLSearchParams()
+  Object.entries(query).forEach(([key, value]) => {
+    if (value !== undefined && value !== null && value !== '') params.set(key, String(value))
+  })
+  const response = await fetch(`${API_BASE_URL}/api/transactions?${params}`)
   if (!response.ok) throw new Error('Failed to fetch transactions')
-  return response.json()
+  return { items: await response.json(), nextCursor: response.headers.get('X-Next-Cursor') }
 }
 
 export async function createTransaction(data: TransactionCreate): Promise<Transaction> {
@@ -37,6 +62,27 @@ export async function createTransaction(data: TransactionCreate): Promise<Transa
   return response.json()
 }
 
+export interface TransactionImportReport {
+  rows: number
+  inserted: number
+  failed: number
+  batches: number
+  failed_batches: number
+  errors: Array<{ row: number; error: string }>
+  errors_truncated: boolean
+}
+
+export async function importTransactions(file: File): Promise<TransactionImportReport> {
+  const format = file.name.toLowerCase().endsWith('.csv') ? 'csv' : 'ndjson'
+  const response = await fetch(`${API_BASE_URL}/api/transactions/bulk?format=${format}`, {
+    method: 'POST',
+    headers: { 'Content-Type': format === 'csv' ? 'text/csv' : 'application/x-ndjson' },
+    body: file
+  })
+  if (!response.ok) throw new Error('Failed to import transactions')
+  return response.json()
+}
+
 export async function deleteTransaction(id: number): Promise<void> {
   const response = await fetch(`${API_BASE_URL}/api/transactions/${id}`, {
     method: 'DELETE'
@@ -44,6 +90,35 @@ export async function deleteTransaction(id: number): Promise<void> {
   if (!response.ok) throw new Error('Failed to delete transaction')
 }
 
+export interface TransactionAnalytics {
+  group_by: Array<'month' | 'category' | 'wallet'>
+  source: 'rollups' | 'transactions'
+  rows: number
+  month?: string[]
+  category?: string[]
+  wallet?: Array<number | null>
+  income: number[]
+  expense: number[]
+  net: number[]
+  count: number[]
+}
+
+export async function getTransactionAnalytics(query: {
+  group_by: string
+  from?: string
+  to?: string
+  wallet_id?: number
+  category?: string
+}): Promise<TransactionAnalytics> {
+  const params = new URLSearchParams()
+  Object.entries(query).forEach(([key, value]) => {
+    if (value !== undefined && value !== null && value !== '') params.set(key, String(value))
+  })
+  const response = await fetch(`${API_BASE_URL}/api/transactions/analytics?${params}`)
+  if (!response.ok) throw new Error('Failed to fetch transaction analytics')
+  return response.json()
+}
+
 export async function getTransactionTotals() {
   const response = await fetch(`${API_BASE_URL}/api/transactions/summary/totals`)
   if (!response.ok) throw new Error('Failed to fetch transaction totals')
@@ -107,6 +182,54 @@ export async function getWalletTotals() {
   return response.json()
 }
 
+export interface NetWorthSeries {
+  from: string
+  to: string
+  base_currency: string
+  date: string[]
+  net_worth: number[]
+  wallets: number[]
+  assets: number[]
+  by_wallet_type: Record<string, number[]>
+  by_asset_type: Record<string, number[]>
+  unconverted_currencies: string[]
+}
+
+export async function getNetWorth(from?: string, to?: string): Promise<NetWorthSeries> {
+  const params = new URLSearchParams()
+  if (from) params.set('from', from)
+  if (to) params.set('to', to)
+  const response = await fetch(`${API_BASE_URL}/api/net-worth?${params}`)
+  if (!response.ok) throw new Error('Failed to fetch net worth')
+  return response.json()
+}
+
+export interface WalletReturns {
+  wallet_id: number
+  from: string
+  to: string
+  days: number
+  start_value: number
+  end_value: number
+  net_flows: number
+  gain: number
+  twr: number
+  twr_annualized: number | null
+  irr: number | null
+  cached: boolean
+  series?: { date: string[]; value: number[]; flow: number[]; twr: number[] }
+}
+
+export async function getWalletReturns(id: number, from?: string, to?: string, series = false): Promise<WalletReturns> {
+  const params = new URLSearchParams()
+  if (from) params.set('from', from)
+  if (to) params.set('to', to)
+  if (series) params.set('series', 'true')
+  const response = await fetch(`${API_BASE_URL}/api/wallets/${id}/returns?${params}`)
+  if (!response.ok) throw new Error('Failed to fetch wallet returns')
+  return response.json()
+}
+
 // Note API
 export interface Note {
   id: number
@@ -166,6 +289,7 @@ export interface Stock {
   sell_date: string | null
   is_holding: boolean
   margin: number | null
+  remaining_volume?: number | null
   created_at: string
 }
 
@@ -204,6 +328,110 @@ export async function deleteStock(id: number): Promise<void> {
   if (!response.ok) throw new Error('Failed to delete stock')
 }
 
+export interface StockTrade {
+  id: number
+  wallet_id: number | null
+  code: string
+  side: 'buy' | 'sell'
+  volume: number
+  price: number
+  fee: number
+  realized_pnl: number | null
+  stock_id: number | null
+  date: string
+  created_at: string
+}
+
+export interface StockTradeCreate {
+  wallet_id: number
+  code: string
+  side: 'buy' | 'sell'
+  volume: number
+  price: number
+  fee?: number
+  date?: string
+}
+
+export async function createStockTrade(data: StockTradeCreate): Promise<StockTrade> {
+  const response = await fetch(`${API_BASE_URL}/api/stocks/trades`, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify(data)
+  })
+  if (!response.ok) throw new Error('Failed to record trade')
+  return response.json()
+}
+
+export interface StockPosition {
+  code: string
+  volume: number
+  average_cost: number
+  cost_basis: number
+  price: number | null
+  market_value: number
+  unrealized_pnl: number
+  realized_pnl: number
+}
+
+export interface StockPositions {
+  wallet_id: number | null
+  positions: StockPosition[]
+  totals: { cost_basis: number; market_value: number; unrealized_pnl: number; realized_pnl: number }
+  unpriced: string[]
+  timestamp: string
+}
+
+export async function getStockPositions(walletId?: number, includeClosed = false): Promise<StockPositions> {
+  const params = new URLSearchParams()
+  if (walletId) params.set('wallet_id', String(walletId))
+  if (includeClosed) params.set('include_closed', 'true')
+  const response = await fetch(`${API_BASE_URL}/api/stocks/positions?${params}`)
+  if (!response.ok) throw new Error('Failed to fetch positions')
+  return response.json()
+}
+
+export interface PortfolioPosition {
+  code: string
+  lots: number
+  volume: number
+  average_cost: number
+  price: number | null
+  cost: number
+  value: number
+  pnl: number
+  pnl_percent: number
+  weight: number
+  day_change: number
+  day_change_percent: number
+}
+
+export interface Portfolio {
+  wallet_id: number | null
+  positions: PortfolioPosition[]
+  totals: {
+    lots: number
+    cost: number
+    value: number
+    pnl: number
+    pnl_percent: number
+    day_change: number
+    day_change_percent: number
+    cash: number
+    net_asset_value: number
+  }
+  unpriced: string[]
+  timestamp: string
+}
+
+export async function getPortfolio(walletId?: number): Promise<Portfolio> {
+  const url = walletId
+    ? `${API_BASE_URL}/api/stocks/portfolio?wallet_id=${walletId}`
+    : `${API_BASE_URL}/api/stocks/portfolio`
+  const response = await fetch(url)
+  if (!response.ok) throw new Error('Failed to fetch portfolio')
+  return response.json()
+}
+
 // Budget Plan API
 export interface BudgetPlan {
   id: number
@@ -255,16 +483,69 @@ export interface MoneyTransfer {
   description?: string | null
 }
 
-export async function transferMoney(data: MoneyTransfer) {
+// Pass the same idempotencyKey when retrying so the transfer cannot apply twice
+export async function transferMoney(data: MoneyTransfer, idempotencyKey?: string) {
   const response = await fetch(`${API_BASE_URL}/api/transfers`, {
     method: 'POST',
-    headers: { 'Content-Type': 'application/json' },
+    headers: {
+      'Content-Type': 'application/json',
+      ...(idempotencyKey ? { 'Idempotency-Key': idempotencyKey } : {})
+    },
     body: JSON.stringify(data)
   })
   if (!response.ok) throw new Error('Failed to transfer money')
   return response.json()
 }
 
+export interface Transfer {
+  id: number
+  from_wallet_id: number | null
+  from_wallet_name: string | null
+  to_wallet_id: number | null
+  to_wallet_name: string | null
+  amount: number
+  description: string | null
+  date: string
+  expense_transaction_id: number | null
+  income_transaction_id: number | null
+}
+
+export interface TransferPage {
+  items: Transfer[]
+  nextCursor: string | null
+}
+
+export async function getTransfers(
+  query: { limit?: number; cursor?: string | null; wallet_id?: number } = {}
+): Promise<TransferPage> {
+  const params = new URLSearchParams()
+  if (query.limit) params.set('limit', String(query.limit))
+  if (query.cursor) params.set('cursor', query.cursor)
+  if (query.wallet_id !== undefined) params.set('wallet_id', String(query.wallet_id))
+  const response = await fetch(`${API_BASE_URL}/api/transfers?${params}`)
+  if (!response.ok) throw new Error('Failed to fetch transfers')
+  return { items: await response.json(), nextCursor: response.headers.get('X-Next-Cursor') }
+}
+
+export interface TransferBatchResult {
+  message: string
+  count: number
+  wallets: { wallet_id: number; balance: number; cash: number | null; loan: number | null }[]
+}
+
+export async function transferMoneyBatch(
+  transfers: MoneyTransfer[],
+  idempotencyKey: string = crypto.randomUUID()
+): Promise<TransferBatchResult> {
+  const response = await fetch(`${API_BASE_URL}/api/transfers/batch`, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json', 'Idempotency-Key': idempotencyKey },
+    body: JSON.stringify({ transfers })
+  })
+  if (!response.ok) throw new Error('Failed to transfer money')
+  return response.json()
+}
+
 // Asset API
 export interface Asset {
   id: number
@@ -311,12 +592,56 @@ export async function deleteAsset(id: number): Promise<void> {
   if (!response.ok) throw new Error('Failed to delete asset')
 }
 
-export async function getAssetTotals() {
+export interface AssetTotals {
+  total_portfolio_value: number
+  base_currency: string
+  by_type: Record<string, { count: number; value: number }>
+  unconverted: Record<string, number>
+}
+
+export async function getAssetTotals(): Promise<AssetTotals> {
   const response = await fetch(`${API_BASE_URL}/api/assets/summary/totals`)
   if (!response.ok) throw new Error('Failed to fetch asset totals')
   return response.json()
 }
 
+export interface AssetValuationRow {
+  id: number
+  type: Asset['type']
+  name: string
+  amount: number
+  currency: string
+  date: string
+  days_held: number
+  symbol: string | null
+  price: number | null
+  quote_currency: string | null
+  quote_timestamp: string | null
+  priced: boolean
+  book_value: number
+  market_value: number
+  change: number
+  change_percent: number | null
+  market_value_base: number | null
+}
+
+export interface AssetValuation {
+  base_currency: string
+  as_of: string
+  assets: AssetValuationRow[]
+  totals: { book_value: number; market_value: number; change: number }
+  by_type: Record<string, { book_value: number; market_value: number }>
+  unpriced: number[]
+  unconverted_currencies: string[]
+  cached: boolean
+}
+
+export async function getAssetValuation(): Promise<AssetValuation> {
+  const response = await fetch(`${API_BASE_URL}/api/assets/valuation`)
+  if (!response.ok) throw new Error('Failed to fetch asset valuation')
+  return response.json()
+}
+
 // Market Data API
 export interface MarketData {
   symbol: string
@@ -335,6 +660,14 @@ export interface AllMarketData {
   dow_jones: MarketData | null
   nasdaq: MarketData | null
   timestamp: string
+  freshness?: Record<string, QuoteFreshness | null>
+  late?: string[]
+}
+
+export interface QuoteFreshness {
+  fetched_at: string
+  age_seconds: number
+  fresh: boolean
 }
 
 export async function getAllMarketData(): Promise<AllMarketData> {
@@ -343,6 +676,20 @@ export async function getAllMarketData(): Promise<AllMarketData> {
   return response.json()
 }
 
+// Live market data over Server-Sent Events: one snapshot, then only changed symbols.
+// Returns a function that closes the stream.
+export function subscribeMarketData(
+  onUpdate: (update: Partial<AllMarketData>) => void,
+  onError?: () => void
+): () => void {
+  const source = new EventSource(`${API_BASE_URL}/api/market-data/stream`)
+  const handle = (event: MessageEvent) => onUpdate(JSON.parse(event.data))
+  source.addEventListener('snapshot', handle as EventListener)
+  source.addEventListener('delta', handle as EventListener)
+  if (onError) source.onerror = onError
+  return () => source.close()
+}
+
 export async function getMarketSummary() {
   const response = await fetch(`${API_BASE_URL}/api/market-data/`)
   if (!response.ok) throw new Error('Failed to fetch market summary')
@@ -366,3 +713,11 @@ export async function getStockPrice(symbol: string): Promise<MarketData> {
   if (!response.ok) throw new Error(`Failed to fetch ${symbol} price`)
   return response.json()
 }
+
+export async function getQuotes(symbols: string[]): Promise<Record<string, MarketData | null>> {
+  const params = new URLSearchParams({ symbols: symbols.join(',') })
+  const response = await fetch(`${API_BASE_URL}/api/market-data/quotes?${params.toString()}`)
+  if (!response.ok) throw new Error('Failed to fetch quotes')
+  const data = await response.json()
+  return data.quotes
+}
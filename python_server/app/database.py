@@ -1,4 +1,5 @@
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 import os
@@ -18,14 +19,36 @@ if database_url.startswith("postgresql://"):
 else:
     DATABASE_URL = database_url
 
+# Sessions run in UTC, so a naive datetime means the same instant to the
+# database as to the code that files it under a day (app/services/timestamps.py)
+CONNECT_ARGS = {"connect_timeout": 5, "options": "-c timezone=UTC"}
+
 # Create engine with pool_pre_ping to handle connection errors gracefully
 engine = create_engine(
     DATABASE_URL,
     pool_pre_ping=True,  # Verify connections before using them
-    connect_args={"connect_timeout": 5}  # Timeout after 5 seconds
+    connect_args=CONNECT_ARGS
 )
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Async engine for the API routers. psycopg3 speaks asyncio natively, so the
+# same URL works; handlers await queries instead of blocking the event loop.
+async_engine = create_async_engine(
+    DATABASE_URL,
+    pool_pre_ping=True,
+    pool_size=int(os.getenv("DB_POOL_SIZE", 10)),
+    max_overflow=int(os.getenv("DB_MAX_OVERFLOW", 20)),
+    connect_args=CONNECT_ARGS
+)
+# expire_on_commit=False so response models can read attributes after commit
+# without triggering a lazy (synchronous) refresh
+AsyncSessionLocal = async_sessionmaker(
+    async_engine,
+    class_=AsyncSession,
+    autoflush=False,
+    expire_on_commit=False
+)
+
 Base = declarative_base()
 
 def get_db():
@@ -36,3 +59,8 @@ def get_db():
     finally:
         db.close()
 
+async def get_async_db():
+    """Dependency to get async database session"""
+    async with AsyncSessionLocal() as db:
+        yield db
+
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Float, Enum, Text, ForeignKey
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Date, Float, Enum, Text, ForeignKey, ARRAY, UniqueConstraint, Index
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from app.database import Base
@@ -27,10 +27,50 @@ class TransactionDB(Base):
     category = Column(String, nullable=False)
     wallet_id = Column(Integer, ForeignKey("wallets.id"), nullable=True, index=True)
     date = Column(DateTime(timezone=True), nullable=False, index=True)
+    transfer_id = Column(Integer, ForeignKey("transfers.id", ondelete="SET NULL"), nullable=True, index=True)  # Set on both legs of a transfer
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
     
     wallet = relationship("WalletDB", back_populates="transactions")
 
+    # Keyset pagination walks (date, id) newest first, optionally within one wallet
+    __table_args__ = (
+        Index("ix_transactions_date_id", date.desc(), id.desc()),
+        Index("ix_transactions_wallet_date_id", wallet_id, date.desc(), id.desc()),
+    )
+
+class TransactionRollupDB(Base):
+    """Running monthly totals per wallet, category and type, kept in step with transactions"""
+    __tablename__ = "transaction_rollups"
+
+    id = Column(Integer, primary_key=True, index=True)
+    month = Column(Date, nullable=False)  # First day of the month (UTC)
+    wallet_id = Column(Integer, nullable=False, default=0)  # 0 = no wallet
+    category = Column(String, nullable=False)
+    type = Column(Enum(TransactionType), nullable=False)
+    total = Column(Float, nullable=False, default=0.0)
+    count = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        UniqueConstraint("month", "wallet_id", "category", "type", name="uq_transaction_rollup"),
+    )
+
+class TransferDB(Base):
+    """A money transfer; its expense and income legs are transactions pointing back here"""
+    __tablename__ = "transfers"
+
+    id = Column(Integer, primary_key=True, index=True)
+    from_wallet_id = Column(Integer, ForeignKey("wallets.id", ondelete="SET NULL"), nullable=True, index=True)
+    to_wallet_id = Column(Integer, ForeignKey("wallets.id", ondelete="SET NULL"), nullable=True, index=True)
+    amount = Column(Float, nullable=False)
+    description = Column(String, nullable=True)
+    date = Column(DateTime(timezone=True), nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+    # Transfer history pages walk (date, id) newest first
+    __table_args__ = (
+        Index("ix_transfers_date_id", date.desc(), id.desc()),
+    )
+
 class WalletType(str, enum.Enum):
     cash = "Cash"  # Tiền mặt
     bank = "Bank"  # Ngân hàng
@@ -61,6 +101,70 @@ class WalletDB(Base):
     transactions = relationship("TransactionDB", back_populates="wallet")
     stocks = relationship("StockDB", back_populates="wallet")
 
+class LedgerPostingDB(Base):
+    """One immutable line of a ledger entry; the postings of an entry sum to zero per field"""
+    __tablename__ = "ledger_postings"
+
+    id = Column(Integer, primary_key=True, index=True)
+    entry_id = Column(String(32), nullable=False, index=True)
+    kind = Column(String, nullable=False)  # income, expense, transfer, stock_buy, stock_sell, adjustment, opening
+    wallet_id = Column(Integer, nullable=True)  # NULL = the external account named by kind
+    field = Column(String, nullable=False)  # balance, cash, loan or investment_value
+    amount = Column(Float, nullable=False)
+    effective_at = Column(DateTime(timezone=True), nullable=False)
+    source_type = Column(String, nullable=True)  # transaction, stock, wallet, transfer
+    source_id = Column(Integer, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+    # Balance lookups sum one wallet's postings over a time range
+    __table_args__ = (
+        Index("ix_ledger_postings_wallet_effective", wallet_id, effective_at),
+    )
+
+class LedgerSnapshotDB(Base):
+    """A wallet's ledger fields as of a point in time, so lookups skip the postings before it"""
+    __tablename__ = "ledger_snapshots"
+
+    id = Column(Integer, primary_key=True, index=True)
+    wallet_id = Column(Integer, nullable=False)
+    as_of = Column(DateTime(timezone=True), nullable=False)
+    balance = Column(Float, nullable=False, default=0.0)
+    cash = Column(Float, nullable=False, default=0.0)
+    loan = Column(Float, nullable=False, default=0.0)
+    investment_value = Column(Float, nullable=False, default=0.0)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint("wallet_id", "as_of", name="uq_ledger_snapshot"),
+    )
+
+class NetWorthDailyDB(Base):
+    """Net change of value of one category on one day; a day's net worth is the running sum"""
+    __tablename__ = "net_worth_daily"
+
+    id = Column(Integer, primary_key=True, index=True)
+    day = Column(Date, nullable=False)  # UTC
+    source = Column(String, nullable=False)  # wallet / asset
+    category = Column(String, nullable=False)  # Wallet or asset type (enum name)
+    currency = Column(String, nullable=False, default="")  # Asset currency; "" for wallets, kept in the base currency
+    amount = Column(Float, nullable=False, default=0.0)  # In `currency`, converted when read
+
+    # Also the index range reads use: (day, ...)
+    __table_args__ = (UniqueConstraint("day", "source", "category", "currency", name="uq_net_worth_daily"),)
+
+class FxRateDB(Base):
+    """Daily exchange rate of a currency against USD"""
+    __tablename__ = "fx_rates"
+
+    id = Column(Integer, primary_key=True, index=True)
+    currency = Column(String, nullable=False)  # ISO code, upper case
+    day = Column(Date, nullable=False)  # UTC
+    rate = Column(Float, nullable=False)  # Units of `currency` per 1 USD
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
+
+    # Also the index "latest rate on or before a day" reads use
+    __table_args__ = (UniqueConstraint("currency", "day", name="uq_fx_rates_currency_day"),)
+
 class AssetType(str, enum.Enum):
     money = "Money"
     bank = "Bank"
@@ -118,10 +222,58 @@ class StockDB(Base):
     sell_date = Column(DateTime(timezone=True), nullable=True)
     is_holding = Column(Boolean, default=True, nullable=False)  # Is currently holding
     margin = Column(Float, default=0.0, nullable=True)
+    # Shares of this lot not sold yet; NULL on lots from before partial sells
+    # (all of volume while holding, none after). sell_price is then the
+    # average net price of the shares sold so far
+    remaining_volume = Column(Float, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
     
     wallet = relationship("WalletDB", back_populates="stocks")
 
+    # Sells match a wallet's open lots of a code oldest first
+    __table_args__ = (
+        Index("ix_stocks_wallet_code_start", wallet_id, code, start_date, id),
+    )
+
+class TradeSide(str, enum.Enum):
+    buy = "buy"
+    sell = "sell"
+
+class StockTradeDB(Base):
+    """An executed buy or sell; appended, never edited"""
+    __tablename__ = "stock_trades"
+
+    id = Column(Integer, primary_key=True, index=True)
+    wallet_id = Column(Integer, ForeignKey("wallets.id", ondelete="SET NULL"), nullable=True)
+    code = Column(String, nullable=False)  # Upper case
+    side = Column(Enum(TradeSide), nullable=False)
+    volume = Column(Float, nullable=False)
+    price = Column(Float, nullable=False)
+    fee = Column(Float, nullable=False, default=0.0)
+    realized_pnl = Column(Float, nullable=True)  # Sells only, against the FIFO cost basis
+    stock_id = Column(Integer, ForeignKey("stocks.id", ondelete="SET NULL"), nullable=True)  # Lot a buy opened
+    date = Column(DateTime(timezone=True), nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+    __table_args__ = (
+        Index("ix_stock_trades_date_id", date.desc(), id.desc()),
+        Index("ix_stock_trades_wallet_date_id", wallet_id, date.desc(), id.desc()),
+    )
+
+class PositionDB(Base):
+    """Open volume, cost basis and realized P&L of one code in one wallet, moved by every trade"""
+    __tablename__ = "stock_positions"
+
+    id = Column(Integer, primary_key=True, index=True)
+    wallet_id = Column(Integer, ForeignKey("wallets.id", ondelete="CASCADE"), nullable=False)
+    code = Column(String, nullable=False)  # Upper case
+    volume = Column(Float, nullable=False, default=0.0)
+    cost_basis = Column(Float, nullable=False, default=0.0)  # Open shares at purchase price, fees included
+    realized_pnl = Column(Float, nullable=False, default=0.0)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
+
+    __table_args__ = (UniqueConstraint("wallet_id", "code", name="uq_stock_position"),)
+
 class PlanType(str, enum.Enum):
     income = "income"
     expense = "expense"
@@ -148,3 +300,50 @@ class UserDB(Base):
     address = Column(String, nullable=True)
     bio = Column(Text, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+class PriceHistoryChunkDB(Base):
+    """Raw quotes of one symbol for one day, stored as parallel arrays"""
+    __tablename__ = "price_history_chunks"
+
+    id = Column(Integer, primary_key=True, index=True)
+    source = Column(String, nullable=False)  # crypto / gold / stock
+    symbol = Column(String, nullable=False)
+    day = Column(Date, nullable=False)
+    timestamps = Column(ARRAY(Float), nullable=False)  # Epoch seconds, ascending
+    prices = Column(ARRAY(Float), nullable=False)
+
+    # Also the index range queries use: (source, symbol, day)
+    __table_args__ = (UniqueConstraint("source", "symbol", "day", name="uq_price_history_chunk"),)
+
+class PriceBarDB(Base):
+    """Downsampled OHLC bar for price history older than the raw retention"""
+    __tablename__ = "price_bars"
+
+    id = Column(Integer, primary_key=True, index=True)
+    source = Column(String, nullable=False)
+    symbol = Column(String, nullable=False)
+    interval = Column(String, nullable=False)  # "1h"
+    bucket_start = Column(DateTime(timezone=True), nullable=False)
+    open = Column(Float, nullable=False)
+    high = Column(Float, nullable=False)
+    low = Column(Float, nullable=False)
+    close = Column(Float, nullable=False)
+    samples = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        UniqueConstraint("source", "symbol", "interval", "bucket_start", name="uq_price_bar"),
+    )
+
+class IdempotencyKeyDB(Base):
+    """Response stored under a client's Idempotency-Key, replayed when the request is retried"""
+    __tablename__ = "idempotency_keys"
+
+    id = Column(Integer, primary_key=True, index=True)
+    scope = Column(String, nullable=False)  # Endpoint the key was used on
+    key = Column(String, nullable=False)
+    request_hash = Column(String(64), nullable=False)
+    status_code = Column(Integer, nullable=True)  # NULL until the request completes
+    response = Column(Text, nullable=True)  # JSON body
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False, index=True)
+
+    __table_args__ = (UniqueConstraint("scope", "key", name="uq_idempotency_key"),)
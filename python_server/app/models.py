@@ -43,6 +43,7 @@ class TransactionUpdate(BaseModel):
 
 class Transaction(TransactionBase):
     id: int
+    transfer_id: Optional[int] = None
     created_at: datetime
     
     class Config:
@@ -164,6 +165,32 @@ class Stock(StockBase):
     sell_price: Optional[float] = None
     sell_date: Optional[datetime] = None
     is_holding: bool
+    remaining_volume: Optional[float] = None
+    created_at: datetime
+    
+    class Config:
+        from_attributes = True
+
+class StockTradeCreate(BaseModel):
+    wallet_id: int
+    code: str
+    side: str  # buy / sell
+    volume: float
+    price: float
+    fee: float = 0.0
+    date: Optional[datetime] = None
+
+class StockTrade(BaseModel):
+    id: int
+    wallet_id: Optional[int] = None
+    code: str
+    side: str
+    volume: float
+    price: float
+    fee: float
+    realized_pnl: Optional[float] = None
+    stock_id: Optional[int] = None
+    date: datetime
     created_at: datetime
     
     class Config:
@@ -230,3 +257,18 @@ class MoneyTransfer(BaseModel):
     to_wallet_id: int
     amount: float
     description: Optional[str] = None
+
+class MoneyTransferBatch(BaseModel):
+    transfers: List[MoneyTransfer]
+
+class Transfer(BaseModel):
+    id: int
+    from_wallet_id: Optional[int] = None
+    from_wallet_name: Optional[str] = None
+    to_wallet_id: Optional[int] = None
+    to_wallet_name: Optional[str] = None
+    amount: float
+    description: Optional[str] = None
+    date: datetime
+    expense_transaction_id: Optional[int] = None
+    income_transaction_id: Optional[int] = None
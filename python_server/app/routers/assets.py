@@ -1,32 +1,44 @@
 from fastapi import APIRouter, HTTPException, Depends
-from sqlalchemy.orm import Session
+import math
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
 from app.models import Asset, AssetCreate, AssetUpdate
-from app.database import get_db
+from app.database import get_async_db
 from app.db_models import AssetDB, AssetType
+from app.services import asset_valuation, fx, net_worth
 
 router = APIRouter(prefix="/api/assets", tags=["assets"])
 
 @router.get("", response_model=List[Asset])
-async def get_assets(db: Session = Depends(get_db)):
+async def get_assets(db: AsyncSession = Depends(get_async_db)):
     """Get all assets"""
     try:
-        assets = db.query(AssetDB).order_by(AssetDB.date.desc()).all()
+        result = await db.execute(select(AssetDB).order_by(AssetDB.date.desc()))
+        assets = result.scalars().all()
         return assets
     except Exception as e:
         # Return empty list if database is not available
         return []
 
+@router.get("/valuation")
+async def get_asset_valuation(db: AsyncSession = Depends(get_async_db)):
+    """Gold, crypto and stock assets marked to the cached quotes, with the change since each asset's date"""
+    try:
+        return await asset_valuation.valuation(db)
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"Database unavailable: {str(e)}")
+
 @router.get("/{asset_id}", response_model=Asset)
-async def get_asset(asset_id: int, db: Session = Depends(get_db)):
+async def get_asset(asset_id: int, db: AsyncSession = Depends(get_async_db)):
     """Get a specific asset by ID"""
-    asset = db.query(AssetDB).filter(AssetDB.id == asset_id).first()
+    asset = await db.get(AssetDB, asset_id)
     if asset is None:
         raise HTTPException(status_code=404, detail="Asset not found")
     return asset
 
 @router.post("", response_model=Asset)
-async def create_asset(asset: AssetCreate, db: Session = Depends(get_db)):
+async def create_asset(asset: AssetCreate, db: AsyncSession = Depends(get_async_db)):
     """Create a new asset"""
     try:
         # Validate asset type
@@ -48,8 +60,12 @@ async def create_asset(asset: AssetCreate, db: Session = Depends(get_db)):
             date=asset.date
         )
         db.add(db_asset)
-        db.commit()
-        db.refresh(db_asset)
+        deltas = {}
+        net_worth.track_asset(deltas, db_asset)
+        await net_worth.apply(db, deltas)
+        await db.commit()
+        asset_valuation.invalidate()
+        await db.refresh(db_asset)
         return db_asset
     except HTTPException:
         raise
@@ -57,11 +73,14 @@ async def create_asset(asset: AssetCreate, db: Session = Depends(get_db)):
         raise HTTPException(status_code=503, detail=f"Database unavailable: {str(e)}")
 
 @router.put("/{asset_id}", response_model=Asset)
-async def update_asset(asset_id: int, asset: AssetUpdate, db: Session = Depends(get_db)):
+async def update_asset(asset_id: int, asset: AssetUpdate, db: AsyncSession = Depends(get_async_db)):
     """Update an asset"""
-    db_asset = db.query(AssetDB).filter(AssetDB.id == asset_id).first()
+    db_asset = await db.get(AssetDB, asset_id, with_for_update=True)
     if db_asset is None:
         raise HTTPException(status_code=404, detail="Asset not found")
+    # Move the asset's value out of the timeline as it was, back in as edited
+    deltas = {}
+    net_worth.track_asset(deltas, db_asset, -1)
     
     if asset.type is not None:
         try:
@@ -84,52 +103,64 @@ async def update_asset(asset_id: int, asset: AssetUpdate, db: Session = Depends(
     if asset.date is not None:
         db_asset.date = asset.date
     
-    db.commit()
-    db.refresh(db_asset)
+    net_worth.track_asset(deltas, db_asset)
+    await net_worth.apply(db, deltas)
+    await db.commit()
+    asset_valuation.invalidate()
+    await db.refresh(db_asset)
     return db_asset
 
 @router.delete("/{asset_id}")
-async def delete_asset(asset_id: int, db: Session = Depends(get_db)):
+async def delete_asset(asset_id: int, db: AsyncSession = Depends(get_async_db)):
     """Delete an asset"""
-    db_asset = db.query(AssetDB).filter(AssetDB.id == asset_id).first()
+    db_asset = await db.get(AssetDB, asset_id, with_for_update=True)
     if db_asset is None:
         raise HTTPException(status_code=404, detail="Asset not found")
     
-    db.delete(db_asset)
-    db.commit()
+    deltas = {}
+    net_worth.track_asset(deltas, db_asset, -1)
+    await net_worth.apply(db, deltas)
+    await db.delete(db_asset)
+    await db.commit()
+    asset_valuation.invalidate()
     return {"message": "Asset deleted successfully"}
 
 @router.get("/summary/totals")
-async def get_asset_totals(db: Session = Depends(get_db)):
-    """Get total portfolio value and breakdown by type"""
+async def get_asset_totals(db: AsyncSession = Depends(get_async_db)):
+    """Get total portfolio value and breakdown by type, in the base currency at today's rates"""
     try:
-        assets = db.query(AssetDB).all()
+        result = await db.execute(select(AssetDB))
+        assets = result.scalars().all()
+        # Every asset's rate in one lookup
+        table = await fx.rate_table(db, {a.currency for a in assets})
+        factors = table.factors([a.currency for a in assets], [fx.today()] * len(assets))
         
-        totals_by_type = {}
-        for asset_type in AssetType:
-            type_assets = [a for a in assets if a.type == asset_type]
-            type_value = sum(a.value for a in type_assets)
-            if asset_type == AssetType.loan:
-                type_value = -type_value  # Loans are negative
-            totals_by_type[asset_type.value] = {
-                "count": len(type_assets),
-                "value": type_value
-            }
-        
-        total_portfolio_value = sum(
-            -a.value if a.type == AssetType.loan else a.value 
-            for a in assets
-        )
+        totals_by_type = {asset_type.value: {"count": 0, "value": 0.0} for asset_type in AssetType}
+        total_portfolio_value = 0.0
+        unconverted = {}  # Native amounts of currencies without a rate, left out of the totals
+        for asset, factor in zip(assets, factors.tolist()):
+            value = net_worth.asset_value(asset)  # Loans are negative
+            type_totals = totals_by_type[AssetType(asset.type).value]
+            type_totals["count"] += 1
+            if math.isnan(factor):
+                currency = fx.normalize_currency(asset.currency)
+                unconverted[currency] = unconverted.get(currency, 0.0) + value
+                continue
+            type_totals["value"] += value * factor
+            total_portfolio_value += value * factor
         
         return {
             "total_portfolio_value": total_portfolio_value,
-            "by_type": totals_by_type
+            "base_currency": fx.BASE_CURRENCY,
+            "by_type": totals_by_type,
+            "unconverted": unconverted
         }
     except Exception as e:
         # Return empty totals if database is not available
         totals_by_type = {asset_type.value: {"count": 0, "value": 0.0} for asset_type in AssetType}
         return {
             "total_portfolio_value": 0.0,
-            "by_type": totals_by_type
+            "base_currency": fx.BASE_CURRENCY,
+            "by_type": totals_by_type,
+            "unconverted": {}
         }
-
@@ -1,33 +1,35 @@
 from fastapi import APIRouter, HTTPException, Depends
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
 from app.models import BudgetPlan, BudgetPlanCreate, BudgetPlanUpdate
-from app.database import get_db
+from app.database import get_async_db
 from app.db_models import BudgetPlanDB, PlanType
 
 router = APIRouter(prefix="/api/budget-plans", tags=["budget-plans"])
 
 @router.get("", response_model=List[BudgetPlan])
-async def get_budget_plans(plan_type: Optional[str] = None, db: Session = Depends(get_db)):
+async def get_budget_plans(plan_type: Optional[str] = None, db: AsyncSession = Depends(get_async_db)):
     """Get all budget plans, optionally filtered by type"""
     try:
-        query = db.query(BudgetPlanDB)
+        query = select(BudgetPlanDB)
         if plan_type:
             try:
                 plan_type_enum = PlanType(plan_type)
-                query = query.filter(BudgetPlanDB.type == plan_type_enum)
+                query = query.where(BudgetPlanDB.type == plan_type_enum)
             except ValueError:
                 pass
-        plans = query.order_by(BudgetPlanDB.name).all()
+        result = await db.execute(query.order_by(BudgetPlanDB.name))
+        plans = result.scalars().all()
         return plans
     except Exception as e:
         return []
 
 @router.get("/{plan_id}", response_model=BudgetPlan)
-async def get_budget_plan(plan_id: int, db: Session = Depends(get_db)):
+async def get_budget_plan(plan_id: int, db: AsyncSession = Depends(get_async_db)):
     """Get a specific budget plan by ID"""
     try:
-        plan = db.query(BudgetPlanDB).filter(BudgetPlanDB.id == plan_id).first()
+        plan = await db.get(BudgetPlanDB, plan_id)
         if plan is None:
             raise HTTPException(status_code=404, detail="Budget plan not found")
         return plan
@@ -37,7 +39,7 @@ async def get_budget_plan(plan_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=503, detail=f"Database unavailable: {str(e)}")
 
 @router.post("", response_model=BudgetPlan)
-async def create_budget_plan(plan: BudgetPlanCreate, db: Session = Depends(get_db)):
+async def create_budget_plan(plan: BudgetPlanCreate, db: AsyncSession = Depends(get_async_db)):
     """Create a new budget plan"""
     try:
         # Validate plan type
@@ -56,8 +58,8 @@ async def create_budget_plan(plan: BudgetPlanCreate, db: Session = Depends(get_d
             icon=plan.icon
         )
         db.add(db_plan)
-        db.commit()
-        db.refresh(db_plan)
+        await db.commit()
+        await db.refresh(db_plan)
         return db_plan
     except HTTPException:
         raise
@@ -65,10 +67,10 @@ async def create_budget_plan(plan: BudgetPlanCreate, db: Session = Depends(get_d
         raise HTTPException(status_code=503, detail=f"Database unavailable: {str(e)}")
 
 @router.put("/{plan_id}", response_model=BudgetPlan)
-async def update_budget_plan(plan_id: int, plan: BudgetPlanUpdate, db: Session = Depends(get_db)):
+async def update_budget_plan(plan_id: int, plan: BudgetPlanUpdate, db: AsyncSession = Depends(get_async_db)):
     """Update a budget plan"""
     try:
-        db_plan = db.query(BudgetPlanDB).filter(BudgetPlanDB.id == plan_id).first()
+        db_plan = await db.get(BudgetPlanDB, plan_id)
         if db_plan is None:
             raise HTTPException(status_code=404, detail="Budget plan not found")
         
@@ -87,8 +89,8 @@ async def update_budget_plan(plan_id: int, plan: BudgetPlanUpdate, db: Session =
         if plan.icon is not None:
             db_plan.icon = plan.icon
         
-        db.commit()
-        db.refresh(db_plan)
+        await db.commit()
+        await db.refresh(db_plan)
         return db_plan
     except HTTPException:
         raise
@@ -96,15 +98,15 @@ async def update_budget_plan(plan_id: int, plan: BudgetPlanUpdate, db: Session =
         raise HTTPException(status_code=503, detail=f"Database unavailable: {str(e)}")
 
 @router.delete("/{plan_id}")
-async def delete_budget_plan(plan_id: int, db: Session = Depends(get_db)):
+async def delete_budget_plan(plan_id: int, db: AsyncSession = Depends(get_async_db)):
     """Delete a budget plan"""
     try:
-        db_plan = db.query(BudgetPlanDB).filter(BudgetPlanDB.id == plan_id).first()
+        db_plan = await db.get(BudgetPlanDB, plan_id)
         if db_plan is None:
             raise HTTPException(status_code=404, detail="Budget plan not found")
         
-        db.delete(db_plan)
-        db.commit()
+        await db.delete(db_plan)
+        await db.commit()
         return {"message": "Budget plan deleted successfully"}
     except HTTPException:
         raise
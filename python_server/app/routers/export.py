@@ -0,0 +1,64 @@
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from typing import AsyncIterator
+from datetime import datetime
+from app import database
+from app.db_models import TransactionDB, AssetDB, StockDB, NoteDB
+from app.services.export_formats import MEDIA_TYPES, PYARROW_AVAILABLE, WRITERS
+
+router = APIRouter(prefix="/api/export", tags=["export"])
+
+EXPORTS = {
+    "transactions": TransactionDB.__table__,
+    "assets": AssetDB.__table__,
+    "stocks": StockDB.__table__,
+    "notes": NoteDB.__table__,
+}
+EXPORT_BATCH_SIZE = 2000
+
+async def export_rows(kind: str, format: str) -> AsyncIterator[bytes]:
+    """Encoded export, one batch at a time, read through a server-side cursor"""
+    table = EXPORTS[kind]
+    # The session lives as long as the response body, not the request handler
+    async with database.AsyncSessionLocal() as db:
+        result = await db.stream(
+            select(table).order_by(table.c.id).execution_options(yield_per=EXPORT_BATCH_SIZE)
+        )
+        writer = WRITERS[format](table)
+        yield writer.header()
+        async for rows in result.partitions():
+            chunk = writer.batch(rows)
+            if chunk:
+                yield chunk
+        yield writer.close()
+
+@router.get("/{kind}")
+async def export_data(kind: str, format: str = Query("csv", description="csv, ndjson or parquet")):
+    """Stream every row of a table as a file download"""
+    if kind not in EXPORTS:
+        raise HTTPException(status_code=404, detail=f"Unknown export. Use one of: {', '.join(EXPORTS)}")
+    if format not in WRITERS:
+        raise HTTPException(status_code=400, detail="Invalid format. Must be 'csv', 'ndjson' or 'parquet'")
+    if format == "parquet" and not PYARROW_AVAILABLE:
+        raise HTTPException(status_code=501, detail="Parquet export needs pyarrow (pip install pyarrow)")
+
+    body = export_rows(kind, format)
+    try:
+        # Open the cursor before answering, so a database failure is still a 503
+        first = await body.__anext__()
+    except Exception as e:
+        await body.aclose()
+        raise HTTPException(status_code=503, detail=f"Database unavailable: {str(e)}")
+
+    async def stream():
+        yield first
+        async for chunk in body:
+            yield chunk
+
+    filename = f"{kind}-{datetime.now().strftime('%Y%m%d')}.{format}"
+    return StreamingResponse(
+        stream(),
+        media_type=MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
@@ -1,145 +1,252 @@
-from fastapi import APIRouter, HTTPException
-from typing import Dict, Any, Optional
-import httpx
-from datetime import datetime
+from fastapi import APIRouter, HTTPException, Query, Request, Depends
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Dict, Any, Iterable, Optional, List, Tuple
+from datetime import datetime, timedelta, timezone
+import asyncio
+import math
+import os
+from app.database import AsyncSessionLocal, get_async_db
+from app.db_models import StockDB
+from app.services.market_providers import COIN_MAP, get_provider
+from app.services.market_quotes import asset_quote_keys, fetch_quotes_batch, stock_symbol
+from app.services import fx, price_history
+from app.services.periodic import PeriodicTask
+from app.services.quote_cache import quote_cache
+from app.services.quote_stream import quote_broadcaster
 
 router = APIRouter(prefix="/api/market-data", tags=["market-data"])
 
+MAX_QUOTES_PER_REQUEST = 200
+STREAM_HEARTBEAT_SECONDS = 15
+PRICE_HISTORY_ENABLED = os.getenv("PRICE_HISTORY_ENABLED", "1") != "0"
+# Latency budget for /all; symbols still loading after it are served stale or null
+AGGREGATE_DEADLINE_SECONDS = float(os.getenv("MARKET_AGGREGATE_DEADLINE", 3.0))
+
 async def fetch_crypto_price(symbol: str) -> Optional[Dict[str, Any]]:
-    """Fetch cryptocurrency price from CoinGecko"""
-    try:
-        # Map symbols to CoinGecko IDs
-        coin_map = {
-            'BTC': 'bitcoin',
-            'ETH': 'ethereum',
-            'BNB': 'binancecoin',
-            'SOL': 'solana',
-            'ADA': 'cardano',
-            'XRP': 'ripple',
-            'DOGE': 'dogecoin'
-        }
-        
-        coin_id = coin_map.get(symbol.upper(), symbol.lower())
-        url = f"https://api.coingecko.com/api/v3/simple/price?ids={coin_id}&vs_currencies=usd&include_24hr_change=true"
-        
-        async with httpx.AsyncClient(timeout=15.0) as client:
-            response = await client.get(url)
-            if response.status_code == 200:
-                data = response.json()
-                if coin_id in data:
-                    return {
-                        "symbol": symbol.upper(),
-                        "price": data[coin_id]["usd"],
-                        "change_24h": data[coin_id].get("usd_24h_change", 0),
-                        "timestamp": datetime.now().isoformat()
-                    }
-        return None
-    except Exception as e:
-        print(f"Error fetching crypto price for {symbol}: {e}")
-        return None
+    return await get_provider().fetch_crypto_price(symbol)
 
 async def fetch_gold_price() -> Optional[Dict[str, Any]]:
-    """Fetch gold price from Coinbase API (XAU/USD)"""
-    # Primary method: Use Coinbase API - most reliable source for gold price
-    # Gold price in 2025 is around $4000-4500/oz
+    return await get_provider().fetch_gold_price()
+
+async def fetch_stock_price(symbol: str) -> Optional[Dict[str, Any]]:
+    return await get_provider().fetch_stock_price(symbol)
+
+def classify_symbol(symbol: str) -> Tuple[str, str]:
+    """Cache key (source, symbol) for a requested symbol; "source:SYMBOL" forces the source"""
+    symbol = symbol.strip()
+    if ":" in symbol:
+        source, symbol = symbol.split(":", 1)
+        return source.lower(), symbol.upper()
+    symbol = symbol.upper()
+    if symbol in ("GOLD", "XAU"):
+        return "gold", "GOLD"
+    if symbol in COIN_MAP:
+        return "crypto", symbol
+    return "stock", symbol
+
+# Market overview served by /all: response key -> (source, symbol).
+# The background refresher keeps these (plus held stock codes) warm in the cache.
+MARKET_WATCHLIST = {
+    "bitcoin": ("crypto", "BTC"),
+    "ethereum": ("crypto", "ETH"),
+    "bnb": ("crypto", "BNB"),
+    "gold": ("gold", "GOLD"),
+    "sp500": ("stock", "GSPC"),  # S&P 500 (without ^)
+    "dollar_index": ("stock", "DX-Y.NYB"),  # Dollar Index
+    "dow_jones": ("stock", "DJI"),  # Dow Jones (without ^)
+    "nasdaq": ("stock", "IXIC"),  # NASDAQ (without ^)
+}
+
+def _fetcher_for(source: str, symbol: str):
+    """Upstream fetch function for a (source, symbol) cache key"""
+    if source == "crypto":
+        return lambda: fetch_crypto_price(symbol)
+    if source == "gold":
+        return fetch_gold_price
+    return lambda: fetch_stock_price(symbol)
+
+async def get_cached_quote(source: str, symbol: str) -> Optional[Dict[str, Any]]:
+    """Quote through the quote cache"""
+    return await quote_cache.get(source, symbol, _fetcher_for(source, symbol))
+
+async def get_cached_crypto_price(symbol: str) -> Optional[Dict[str, Any]]:
+    """Crypto price through the quote cache"""
+    return await get_cached_quote("crypto", symbol)
+
+async def get_cached_gold_price() -> Optional[Dict[str, Any]]:
+    """Gold price through the quote cache"""
+    return await get_cached_quote("gold", "GOLD")
+
+async def get_cached_stock_price(symbol: str) -> Optional[Dict[str, Any]]:
+    """Stock/index price through the quote cache"""
+    return await get_cached_quote("stock", symbol)
+
+def _extra_watchlist() -> List[Tuple[str, str]]:
+    """Extra symbols from MARKET_WATCHLIST_EXTRA, e.g. "crypto:SOL,stock:AAPL" """
+    extra = []
+    for item in os.getenv("MARKET_WATCHLIST_EXTRA", "").split(","):
+        if ":" in item:
+            source, symbol = item.strip().split(":", 1)
+            extra.append((source.lower(), symbol.upper()))
+    return extra
+
+async def get_held_stock_symbols() -> List[str]:
+    """Distinct codes of stock positions still held, in Yahoo format"""
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(select(StockDB.code).where(StockDB.is_holding == True).distinct())
+        return [stock_symbol(code) for code in result.scalars().all() if code]
+
+async def refresh_watchlist():
+    """Refresh every watched quote into the cache"""
+    targets = set(MARKET_WATCHLIST.values()) | set(_extra_watchlist())
     try:
-        # Get USD exchange rates to find XAU rate
-        url = "https://api.coinbase.com/v2/exchange-rates?currency=USD"
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            response = await client.get(url)
-            if response.status_code == 200:
-                data = response.json()
-                if "data" in data and "rates" in data["data"]:
-                    rates = data["data"]["rates"]
-                    if "XAU" in rates:
-                        # Coinbase returns how many XAU per 1 USD
-                        xau_per_usd = float(rates["XAU"])
-                        # Invert to get USD per XAU (troy ounce)
-                        price_per_ounce = 1.0 / xau_per_usd if xau_per_usd > 0 else 0
-                        
-                        # Gold price in 2025 is around $4000-4500/oz, accept this range
-                        if 1000 < price_per_ounce < 10000:
-                            return {
-                                "symbol": "GOLD",
-                                "price": round(price_per_ounce, 2),
-                                "change_24h": 0,  # Coinbase doesn't provide 24h change
-                                "timestamp": datetime.now().isoformat()
-                            }
+        targets |= {("stock", symbol) for symbol in await get_held_stock_symbols()}
+        async with AsyncSessionLocal() as db:
+            targets |= set(await asset_quote_keys(db))
     except Exception as e:
-        print(f"Error fetching gold from Coinbase: {e}")
+        print(f"Could not load held stock codes and asset symbols for refresh: {e}")
+    # One batched request per provider instead of one per symbol
+    quotes = await quote_cache.refresh_many(list(targets), fetch_quotes_batch)
+    quote_broadcaster.publish(_watchlist_quotes())
+    if PRICE_HISTORY_ENABLED:
+        try:
+            async with AsyncSessionLocal() as db:
+                await price_history.record_quotes(db, quotes)
+                await db.commit()
+        except Exception as e:
+            print(f"Could not record price history: {e}")
+
+async def compact_price_history():
+    """Fold old raw quotes into hourly bars"""
+    async with AsyncSessionLocal() as db:
+        await price_history.compact(db)
+
+def _watchlist_quotes() -> Dict[str, Optional[Dict[str, Any]]]:
+    """Current cached value of every /all key"""
+    quotes = {}
+    for key, (source, symbol) in MARKET_WATCHLIST.items():
+        entry = quote_cache.peek(source, symbol)
+        quotes[key] = entry.value if entry else None
+    return quotes
+
+# Started/stopped by the app lifespan in main.py
+market_refresher = PeriodicTask(
+    "market-data-refresher",
+    float(os.getenv("MARKET_REFRESH_INTERVAL", 15)),
+    refresh_watchlist
+)
+price_history_compactor = PeriodicTask("price-history-compactor", 3600, compact_price_history)
+
+async def refresh_fx_rates():
+    """Fetch FX rates into the live layer and today's history row"""
+    async with AsyncSessionLocal() as db:
+        await fx.refresh(db, get_provider())
+        await db.commit()
+
+fx_refresher = PeriodicTask("fx-refresher", float(os.getenv("FX_REFRESH_INTERVAL", 3600)), refresh_fx_rates)
+
+@router.get("/cache/stats")
+async def get_cache_stats():
+    """Quote cache hit/miss counters"""
+    return {**quote_cache.stats(), "stream": quote_broadcaster.stats(), "provider": get_provider().stats()}
+
+@router.get("/stream")
+async def stream_market_data(request: Request):
+    """Server-Sent Events stream of the /all keys: a snapshot, then deltas of changed symbols"""
+    queue = quote_broadcaster.subscribe()
     
-    # Fallback: Use Yahoo Finance GC=F (Gold Futures)
+    async def events():
+        try:
+            while not await request.is_disconnected():
+                try:
+                    event, data = await asyncio.wait_for(queue.get(), timeout=STREAM_HEARTBEAT_SECONDS)
+                    yield f"event: {event}\ndata: {data}\n\n"
+                except asyncio.TimeoutError:
+                    # Comment line keeps proxies from closing an idle connection
+                    yield ": keepalive\n\n"
+        finally:
+            quote_broadcaster.unsubscribe(queue)
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.get("/freshness")
+async def get_freshness():
+    """Age of every cached quote and the background refresher status"""
+    return {
+        "refresher": market_refresher.status(),
+        "quotes": quote_cache.freshness_all()
+    }
+
+@router.get("/fx")
+async def get_fx_rates(db: AsyncSession = Depends(get_async_db)):
+    """Current rate of every tracked currency, as units of it per 1 unit of the base currency"""
     try:
-        gold_data = await fetch_stock_price("GC=F")
-        if gold_data and gold_data.get("price", 0) > 0:
-            price = gold_data["price"]
-            # GC=F futures price is per troy ounce
-            # Accept prices in the $1000-$10000 range (2025 gold prices are higher)
-            if 1000 < price < 10000:
-                return {
-                    "symbol": "GOLD",
-                    "price": round(price, 2),
-                    "change_24h": gold_data.get("change_24h", 0),
-                    "timestamp": datetime.now().isoformat()
-                }
+        currencies = sorted(await fx.tracked_currencies(db) | {fx.PIVOT})
+        table = await fx.rate_table(db, currencies)
+        days = [fx.today()] * len(currencies)
+        values = table.rates(currencies, days) / table.rates([fx.BASE_CURRENCY] * len(currencies), days)
+        rates = {code: (None if math.isnan(rate) else rate) for code, rate in zip(currencies, values.tolist())}
     except Exception as e:
-        print(f"Error fetching gold from GC=F: {e}")
+        print(f"Could not load FX rates: {e}")
+        rates = {}
+    return {
+        "base_currency": fx.BASE_CURRENCY,
+        "rates": rates,
+        "fetched_at": fx.live_rates()["fetched_at"],
+        "refresher": fx_refresher.status()
+    }
+
+@router.get("/quotes")
+async def get_quotes(symbols: str = Query(..., description="Comma-separated symbols, e.g. BTC,ETH,GOLD,VNM")):
+    """Get many quotes at once, batching cache misses into one upstream request per provider"""
+    requested = [symbol.strip() for symbol in symbols.split(",") if symbol.strip()]
+    if not requested:
+        raise HTTPException(status_code=400, detail="No symbols given")
+    if len(requested) > MAX_QUOTES_PER_REQUEST:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_QUOTES_PER_REQUEST} symbols per request")
     
-    return None
+    keys = {symbol: classify_symbol(symbol) for symbol in requested}
+    quotes = await quote_cache.get_many(list(set(keys.values())), fetch_quotes_batch)
+    return {
+        "quotes": {symbol: quotes.get(key) for symbol, key in keys.items()},
+        "timestamp": datetime.now().isoformat()
+    }
 
-async def fetch_stock_price(symbol: str) -> Optional[Dict[str, Any]]:
-    """Fetch stock price using Yahoo Finance API"""
+@router.get("/history/{symbol}")
+async def get_price_history(
+    symbol: str,
+    start: Optional[datetime] = Query(None, alias="from"),
+    end: Optional[datetime] = Query(None, alias="to"),
+    interval: str = "auto",
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Recorded price history as columnar arrays (raw points, or 1h/1d OHLC bars)"""
+    if interval not in ("auto", "raw", "1h", "1d"):
+        raise HTTPException(status_code=400, detail="Invalid interval. Must be one of: auto, raw, 1h, 1d")
+    end = end or datetime.now(timezone.utc)
+    start = start or end - timedelta(days=1)
+    # Naive datetimes from the query string are taken as UTC; chunks are per UTC day
+    end = end.replace(tzinfo=timezone.utc) if end.tzinfo is None else end.astimezone(timezone.utc)
+    start = start.replace(tzinfo=timezone.utc) if start.tzinfo is None else start.astimezone(timezone.utc)
+    if start > end:
+        raise HTTPException(status_code=400, detail="'from' must be before 'to'")
+    
+    source, symbol = classify_symbol(symbol)
     try:
-        # Map common symbols to Yahoo Finance format
-        symbol_map = {
-            'GSPC': '^GSPC',  # S&P 500
-            'DJI': '^DJI',    # Dow Jones
-            'IXIC': '^IXIC',  # NASDAQ
-            'DX-Y.NYB': 'DX-Y.NYB',  # Dollar Index
-        }
-        
-        # Use mapped symbol or original
-        yahoo_symbol = symbol_map.get(symbol.upper(), symbol)
-        
-        # URL encode the symbol
-        import urllib.parse
-        encoded_symbol = urllib.parse.quote(yahoo_symbol)
-        url = f"https://query1.finance.yahoo.com/v8/finance/chart/{encoded_symbol}"
-        
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-            'Accept': 'application/json'
-        }
-        
-        async with httpx.AsyncClient(timeout=15.0, headers=headers, follow_redirects=True) as client:
-            response = await client.get(url)
-            if response.status_code == 200:
-                data = response.json()
-                if "chart" in data and "result" in data["chart"] and len(data["chart"]["result"]) > 0:
-                    result = data["chart"]["result"][0]
-                    meta = result.get("meta", {})
-                    regular_price = meta.get("regularMarketPrice") or meta.get("previousClose")
-                    previous_close = meta.get("previousClose", regular_price)
-                    
-                    if regular_price and regular_price > 0:
-                        change = regular_price - previous_close
-                        change_percent = (change / previous_close * 100) if previous_close > 0 else 0
-                        
-                        return {
-                            "symbol": symbol.upper().replace("^", ""),
-                            "price": float(regular_price),
-                            "change_24h": float(change_percent),
-                            "timestamp": datetime.now().isoformat()
-                        }
-        return None
+        return await price_history.query_history(db, source, symbol, start, end, interval)
     except Exception as e:
-        print(f"Error fetching stock price for {symbol}: {e}")
-        return None
+        raise HTTPException(status_code=503, detail=f"Database unavailable: {str(e)}")
 
 @router.get("/crypto/{symbol}")
 async def get_crypto_price(symbol: str):
     """Get cryptocurrency price"""
-    data = await fetch_crypto_price(symbol)
+    data = await get_cached_crypto_price(symbol)
     if data is None:
         raise HTTPException(status_code=404, detail=f"Could not fetch price for {symbol}")
     return data
@@ -147,7 +254,7 @@ async def get_crypto_price(symbol: str):
 @router.get("/gold")
 async def get_gold_price():
     """Get gold price"""
-    data = await fetch_gold_price()
+    data = await get_cached_gold_price()
     if data is None:
         raise HTTPException(status_code=503, detail="Gold price service unavailable")
     return data
@@ -155,42 +262,43 @@ async def get_gold_price():
 @router.get("/stock/{symbol}")
 async def get_stock_price(symbol: str):
     """Get stock price"""
-    data = await fetch_stock_price(symbol)
+    data = await get_cached_stock_price(symbol)
     if data is None:
         raise HTTPException(status_code=404, detail=f"Could not fetch price for {symbol}")
     return data
 
+def _discard_result(task: asyncio.Task):
+    if not task.cancelled():
+        task.exception()
+
 @router.get("/all")
 async def get_all_market_data():
     """Get all market data at once"""
     try:
-        import asyncio
-        
-        # Fetch all data in parallel
-        results = await asyncio.gather(
-            fetch_crypto_price("BTC"),
-            fetch_crypto_price("ETH"),
-            fetch_crypto_price("BNB"),
-            fetch_gold_price(),
-            fetch_stock_price("GSPC"),  # S&P 500 (without ^)
-            fetch_stock_price("DX-Y.NYB"),  # Dollar Index
-            fetch_stock_price("DJI"),  # Dow Jones (without ^)
-            fetch_stock_price("IXIC"),  # NASDAQ (without ^)
-            return_exceptions=True
-        )
+        # Served from the cache the background refresher keeps warm; only a
+        # cold or expired entry reaches upstream
+        keys = list(MARKET_WATCHLIST)
+        tasks = {key: asyncio.ensure_future(get_cached_quote(*MARKET_WATCHLIST[key])) for key in keys}
+        await asyncio.wait(tasks.values(), timeout=AGGREGATE_DEADLINE_SECONDS)
         
-        # Process results
-        market_data = {
-            "bitcoin": results[0] if not isinstance(results[0], Exception) and results[0] else None,
-            "ethereum": results[1] if not isinstance(results[1], Exception) and results[1] else None,
-            "bnb": results[2] if not isinstance(results[2], Exception) and results[2] else None,
-            "gold": results[3] if not isinstance(results[3], Exception) and results[3] else None,
-            "sp500": results[4] if not isinstance(results[4], Exception) and results[4] else None,
-            "dollar_index": results[5] if not isinstance(results[5], Exception) and results[5] else None,
-            "dow_jones": results[6] if not isinstance(results[6], Exception) and results[6] else None,
-            "nasdaq": results[7] if not isinstance(results[7], Exception) and results[7] else None,
-            "timestamp": datetime.now().isoformat()
+        # Process results; late fetches keep running and fill the cache for the next call
+        market_data = {}
+        late = []
+        for key, task in tasks.items():
+            if task.done():
+                result = None if task.cancelled() or task.exception() else task.result()
+            else:
+                task.add_done_callback(_discard_result)
+                late.append(key)
+                entry = quote_cache.peek(*MARKET_WATCHLIST[key])
+                result = entry.value if entry else None
+            market_data[key] = result or None
+        market_data["timestamp"] = datetime.now().isoformat()
+        market_data["freshness"] = {
+            key: quote_cache.freshness(*MARKET_WATCHLIST[key]) for key in keys
         }
+        market_data["late"] = late
+        quote_broadcaster.publish({key: market_data[key] for key in keys})
         
         return market_data
     except Exception as e:
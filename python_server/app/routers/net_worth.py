@@ -0,0 +1,29 @@
+from fastapi import APIRouter, HTTPException, Depends, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Optional
+from datetime import date, datetime, timedelta, timezone
+from app.database import get_async_db
+from app.services import net_worth
+
+router = APIRouter(prefix="/api/net-worth", tags=["net-worth"])
+
+DEFAULT_DAYS = 365
+MAX_DAYS = 3660
+
+@router.get("")
+async def get_net_worth(
+    from_: Optional[date] = Query(None, alias="from", description="First day (UTC); defaults to a year before 'to'"),
+    to: Optional[date] = Query(None, description="Last day (UTC); defaults to today"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Daily net worth, in total and per wallet and asset type, as parallel arrays"""
+    to = to or datetime.now(timezone.utc).date()
+    from_ = from_ or to - timedelta(days=DEFAULT_DAYS - 1)
+    if from_ > to:
+        raise HTTPException(status_code=400, detail="'from' must not be after 'to'")
+    if (to - from_).days + 1 > MAX_DAYS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_DAYS} days per request")
+    try:
+        return await net_worth.series(db, from_, to)
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"Database unavailable: {str(e)}")
@@ -1,8 +1,9 @@
 from fastapi import APIRouter, HTTPException, Depends
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
 from app.models import Note, NoteCreate, NoteUpdate
-from app.database import get_db
+from app.database import get_async_db
 from app.db_models import NoteDB, NoteTag
 from datetime import datetime
 
@@ -12,36 +13,37 @@ router = APIRouter(prefix="/api/notes", tags=["notes"])
 async def get_notes(
     tag: Optional[str] = None,
     date: Optional[str] = None,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get all notes, optionally filtered by tag or date"""
     try:
-        query = db.query(NoteDB)
+        query = select(NoteDB)
         
         if tag:
             try:
                 note_tag = NoteTag(tag)
-                query = query.filter(NoteDB.tag == note_tag)
+                query = query.where(NoteDB.tag == note_tag)
             except ValueError:
                 pass  # Invalid tag, ignore filter
         
         if date:
             try:
                 date_obj = datetime.fromisoformat(date.replace('Z', '+00:00'))
-                query = query.filter(NoteDB.date >= date_obj)
+                query = query.where(NoteDB.date >= date_obj)
             except:
                 pass  # Invalid date, ignore filter
         
-        notes = query.order_by(NoteDB.date.desc()).all()
+        result = await db.execute(query.order_by(NoteDB.date.desc()))
+        notes = result.scalars().all()
         return notes
     except Exception as e:
         return []
 
 @router.get("/{note_id}", response_model=Note)
-async def get_note(note_id: int, db: Session = Depends(get_db)):
+async def get_note(note_id: int, db: AsyncSession = Depends(get_async_db)):
     """Get a specific note by ID"""
     try:
-        note = db.query(NoteDB).filter(NoteDB.id == note_id).first()
+        note = await db.get(NoteDB, note_id)
         if note is None:
             raise HTTPException(status_code=404, detail="Note not found")
         return note
@@ -51,7 +53,7 @@ async def get_note(note_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=503, detail=f"Database unavailable: {str(e)}")
 
 @router.post("", response_model=Note)
-async def create_note(note: NoteCreate, db: Session = Depends(get_db)):
+async def create_note(note: NoteCreate, db: AsyncSession = Depends(get_async_db)):
     """Create a new note"""
     try:
         # Validate tag
@@ -74,8 +76,8 @@ async def create_note(note: NoteCreate, db: Session = Depends(get_db)):
             image=note.image
         )
         db.add(db_note)
-        db.commit()
-        db.refresh(db_note)
+        await db.commit()
+        await db.refresh(db_note)
         return db_note
     except HTTPException:
         raise
@@ -83,10 +85,10 @@ async def create_note(note: NoteCreate, db: Session = Depends(get_db)):
         raise HTTPException(status_code=503, detail=f"Database unavailable: {str(e)}")
 
 @router.put("/{note_id}", response_model=Note)
-async def update_note(note_id: int, note: NoteUpdate, db: Session = Depends(get_db)):
+async def update_note(note_id: int, note: NoteUpdate, db: AsyncSession = Depends(get_async_db)):
     """Update a note"""
     try:
-        db_note = db.query(NoteDB).filter(NoteDB.id == note_id).first()
+        db_note = await db.get(NoteDB, note_id)
         if db_note is None:
             raise HTTPException(status_code=404, detail="Note not found")
         
@@ -107,8 +109,8 @@ async def update_note(note_id: int, note: NoteUpdate, db: Session = Depends(get_
         if note.image is not None:
             db_note.image = note.image
         
-        db.commit()
-        db.refresh(db_note)
+        await db.commit()
+        await db.refresh(db_note)
         return db_note
     except HTTPException:
         raise
@@ -116,15 +118,15 @@ async def update_note(note_id: int, note: NoteUpdate, db: Session = Depends(get_
         raise HTTPException(status_code=503, detail=f"Database unavailable: {str(e)}")
 
 @router.delete("/{note_id}")
-async def delete_note(note_id: int, db: Session = Depends(get_db)):
+async def delete_note(note_id: int, db: AsyncSession = Depends(get_async_db)):
     """Delete a note"""
     try:
-        db_note = db.query(NoteDB).filter(NoteDB.id == note_id).first()
+        db_note = await db.get(NoteDB, note_id)
         if db_note is None:
             raise HTTPException(status_code=404, detail="Note not found")
         
-        db.delete(db_note)
-        db.commit()
+        await db.delete(db_note)
+        await db.commit()
         return {"message": "Note deleted successfully"}
     except HTTPException:
         raise
@@ -1,29 +1,216 @@
-from fastapi import APIRouter, HTTPException, Depends
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, HTTPException, Depends, Query, Response
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
-from app.models import Stock, StockCreate, StockUpdate
-from app.database import get_db
-from app.db_models import StockDB, WalletDB, WalletType
+from app.models import Stock, StockCreate, StockUpdate, StockTrade, StockTradeCreate
+from app.database import get_async_db
+from app.db_models import PositionDB, StockDB, StockTradeDB, TradeSide, WalletDB, WalletType
+from app.services.market_quotes import stock_quotes
+from app.services import balances, ledger, portfolio, positions
+from app.services.pagination import MAX_PAGE_SIZE, keyset_page, split_page
+from app.services.timestamps import utc
+from datetime import datetime, timezone
 
 router = APIRouter(prefix="/api/stocks", tags=["stocks"])
 
+DEFAULT_PAGE_SIZE = 50
+
 @router.get("", response_model=List[Stock])
-async def get_stocks(wallet_id: Optional[int] = None, db: Session = Depends(get_db)):
+async def get_stocks(wallet_id: Optional[int] = None, db: AsyncSession = Depends(get_async_db)):
     """Get all stocks, optionally filtered by wallet"""
     try:
-        query = db.query(StockDB)
+        query = select(StockDB)
         if wallet_id:
-            query = query.filter(StockDB.wallet_id == wallet_id)
-        stocks = query.order_by(StockDB.start_date.desc()).all()
+            query = query.where(StockDB.wallet_id == wallet_id)
+        result = await db.execute(query.order_by(StockDB.start_date.desc()))
+        stocks = result.scalars().all()
         return stocks
     except Exception as e:
         return []
 
+@router.get("/portfolio")
+async def get_portfolio(wallet_id: Optional[int] = None, db: AsyncSession = Depends(get_async_db)):
+    """Market value, P&L, weights and day change of held stocks, valued against cached quotes"""
+    try:
+        # The open part of each lot, with its share of the buy fee
+        holdings = (
+            select(
+                StockDB.code, positions.open_volume, StockDB.start_price,
+                positions.open_cost - positions.open_volume * StockDB.start_price
+            )
+            .where(positions.open_volume > positions.EPSILON)
+        )
+        cash = select(func.coalesce(func.sum(WalletDB.cash), 0.0)).where(WalletDB.type == WalletType.stock)
+        if wallet_id:
+            holdings = holdings.where(StockDB.wallet_id == wallet_id)
+            cash = cash.where(WalletDB.id == wallet_id)
+        rows = (await db.execute(holdings)).all()
+        cash_total = (await db.execute(cash)).scalar_one()
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"Database unavailable: {str(e)}")
+
+    codes, volume, start_price, margin = (list(column) for column in zip(*rows)) if rows else ([], [], [], [])
+    codes = [code.upper() for code in codes]
+    result = portfolio.value_lots(codes, volume, start_price, margin, await stock_quotes(codes), cash=cash_total)
+    return {"wallet_id": wallet_id, **result, "timestamp": datetime.now().isoformat()}
+
+@router.get("/positions")
+async def get_positions(
+    wallet_id: Optional[int] = None,
+    include_closed: bool = Query(False, description="Also list codes sold out, for their realized P&L"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Open volume, cost basis, realized and unrealized P&L per code"""
+    stmt = (
+        select(
+            PositionDB.code,
+            func.sum(PositionDB.volume).label("volume"),
+            func.sum(PositionDB.cost_basis).label("cost_basis"),
+            func.sum(PositionDB.realized_pnl).label("realized_pnl")
+        )
+        .group_by(PositionDB.code)
+        .order_by(PositionDB.code)
+    )
+    if wallet_id:
+        stmt = stmt.where(PositionDB.wallet_id == wallet_id)
+    if not include_closed:
+        stmt = stmt.having(func.sum(PositionDB.volume) > positions.EPSILON)
+    try:
+        rows = (await db.execute(stmt)).all()
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"Database unavailable: {str(e)}")
+
+    quotes = await stock_quotes(row.code for row in rows if row.volume > positions.EPSILON)
+    result = []
+    unpriced = []
+    for row in rows:
+        price = (quotes.get(row.code) or {}).get("price")
+        if price is None and row.volume > positions.EPSILON:
+            unpriced.append(row.code)
+        # Unpriced positions are valued at cost, like the portfolio
+        market_value = row.volume * price if price is not None else row.cost_basis
+        result.append({
+            "code": row.code,
+            "volume": row.volume,
+            "average_cost": row.cost_basis / row.volume if row.volume > positions.EPSILON else 0.0,
+            "cost_basis": row.cost_basis,
+            "price": price,
+            "market_value": market_value,
+            "unrealized_pnl": market_value - row.cost_basis,
+            "realized_pnl": row.realized_pnl,
+        })
+    return {
+        "wallet_id": wallet_id,
+        "positions": result,
+        "totals": {
+            field: sum(position[field] for position in result)
+            for field in ("cost_basis", "market_value", "unrealized_pnl", "realized_pnl")
+        },
+        "unpriced": unpriced,
+        "timestamp": datetime.now().isoformat(),
+    }
+
+@router.get("/trades", response_model=List[StockTrade])
+async def get_trades(
+    response: Response,
+    wallet_id: Optional[int] = None,
+    code: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Trade history newest first (next cursor in X-Next-Cursor)"""
+    stmt = select(StockTradeDB)
+    if wallet_id:
+        stmt = stmt.where(StockTradeDB.wallet_id == wallet_id)
+    if code:
+        stmt = stmt.where(StockTradeDB.code == positions.normalize_code(code))
+    try:
+        stmt = keyset_page(stmt, StockTradeDB.date, StockTradeDB.id, cursor, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    try:
+        result = await db.execute(stmt)
+        trades = result.scalars().all()
+    except Exception as e:
+        # Not an empty list: a paginating client would take it for the end of the data
+        raise HTTPException(status_code=503, detail=f"Database unavailable: {str(e)}")
+    trades, next_cursor = split_page(trades, limit)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return trades
+
+async def _lock_stock_wallet(db: AsyncSession, wallet_id: int) -> WalletDB:
+    """Lock a wallet (before any of its lots, like every other writer) and check it holds stocks"""
+    wallet = (await balances.lock_wallets(db, [wallet_id])).get(wallet_id)
+    if wallet is None:
+        raise HTTPException(status_code=404, detail="Wallet not found")
+    if wallet.type != WalletType.stock:
+        raise HTTPException(status_code=400, detail="Stock can only be added to Stock type wallet")
+    return wallet
+
+def _check_cash(wallet: WalletDB, total_cost: float):
+    if (wallet.cash or 0.0) < total_cost:
+        raise HTTPException(status_code=400, detail="Insufficient cash in wallet")
+
+def _booked(lot: StockDB):
+    """A lot's effects on its wallet as (ledger kind, date, effect): the purchase, then the sells"""
+    return (
+        ("stock_buy", lot.start_date, positions.buy_effect(lot)),
+        ("stock_sell", lot.sell_date or lot.start_date, positions.sell_effect(lot)),
+    )
+
+async def _rebook(db: AsyncSession, lot: StockDB, before):
+    """Post what a hand edit changed in the lot's effects (`before` is _booked of the unedited lot)"""
+    for (kind, old_at, old), (_, new_at, new) in zip(before, _booked(lot)):
+        if utc(old_at) == utc(new_at):
+            entries = [(new_at, {field: new[field] - old[field] for field in new}, 1)]
+        else:
+            # Moved to another date: reverse it at the old one, book it again at the new one
+            entries = [(old_at, old, -1), (new_at, new, 1)]
+        for effective_at, effect, sign in entries:
+            if any(abs(value) > positions.EPSILON for value in effect.values()):
+                deltas = {}
+                balances.track(deltas, lot.wallet_id, effect, sign)
+                await ledger.record(db, kind, effective_at, deltas, "stock", lot.id)
+
+@router.post("/trades", response_model=StockTrade)
+async def create_trade(trade: StockTradeCreate, db: AsyncSession = Depends(get_async_db)):
+    """Buy (opens a lot) or sell (closes the oldest lots first, partially if need be)"""
+    try:
+        side = TradeSide(trade.side.lower())
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Trade side must be 'buy' or 'sell'")
+    if trade.volume <= 0:
+        raise HTTPException(status_code=400, detail="Trade volume must be positive")
+    if trade.price < 0 or trade.fee < 0:
+        raise HTTPException(status_code=400, detail="Trade price and fee cannot be negative")
+    code = positions.normalize_code(trade.code)
+    date = trade.date or datetime.now(timezone.utc)
+    try:
+        wallet = await _lock_stock_wallet(db, trade.wallet_id)
+        if side == TradeSide.buy:
+            _check_cash(wallet, trade.volume * trade.price + trade.fee)
+            _, db_trade = await positions.buy(db, wallet.id, code, trade.volume, trade.price, trade.fee, date)
+        else:
+            try:
+                db_trade = await positions.sell(db, wallet.id, code, trade.volume, trade.price, trade.fee, date)
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+        await db.commit()
+        await db.refresh(db_trade)
+        return db_trade
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"Database unavailable: {str(e)}")
+
 @router.get("/{stock_id}", response_model=Stock)
-async def get_stock(stock_id: int, db: Session = Depends(get_db)):
+async def get_stock(stock_id: int, db: AsyncSession = Depends(get_async_db)):
     """Get a specific stock by ID"""
     try:
-        stock = db.query(StockDB).filter(StockDB.id == stock_id).first()
+        stock = await db.get(StockDB, stock_id)
         if stock is None:
             raise HTTPException(status_code=404, detail="Stock not found")
         return stock
@@ -33,39 +220,22 @@ async def get_stock(stock_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=503, detail=f"Database unavailable: {str(e)}")
 
 @router.post("", response_model=Stock)
-async def create_stock(stock: StockCreate, db: Session = Depends(get_db)):
+async def create_stock(stock: StockCreate, db: AsyncSession = Depends(get_async_db)):
     """Create a new stock"""
     try:
-        # Verify wallet exists and is a stock wallet
-        wallet = db.query(WalletDB).filter(WalletDB.id == stock.wallet_id).first()
-        if wallet is None:
-            raise HTTPException(status_code=404, detail="Wallet not found")
-        if wallet.type != WalletType.stock:
-            raise HTTPException(status_code=400, detail="Stock can only be added to Stock type wallet")
-        
+        # Verify wallet exists and is a stock wallet; locked so the cash check
+        # still holds when the purchase is booked
+        wallet = await _lock_stock_wallet(db, stock.wallet_id)
+
         # Check if enough cash available
-        total_cost = stock.volume * stock.start_price + (stock.margin or 0.0)
-        if wallet.cash < total_cost:
-            raise HTTPException(status_code=400, detail="Insufficient cash in wallet")
-        
-        db_stock = StockDB(
-            wallet_id=stock.wallet_id,
-            code=stock.code,
-            volume=stock.volume,
-            start_price=stock.start_price,
-            start_date=stock.start_date,
-            margin=stock.margin or 0.0,
-            is_holding=True
+        _check_cash(wallet, stock.volume * stock.start_price + (stock.margin or 0.0))
+
+        db_stock, _ = await positions.buy(
+            db, wallet.id, stock.code, stock.volume, stock.start_price, stock.margin or 0.0, stock.start_date
         )
-        
-        # Update wallet cash and investment value
-        wallet.cash -= total_cost
-        wallet.investment_value = (wallet.investment_value or 0.0) + (stock.volume * stock.start_price)
-        wallet.gross_balance = (wallet.cash or 0.0) + (wallet.investment_value or 0.0)
-        
-        db.add(db_stock)
-        db.commit()
-        db.refresh(db_stock)
+
+        await db.commit()
+        await db.refresh(db_stock)
         return db_stock
     except HTTPException:
         raise
@@ -73,41 +243,68 @@ async def create_stock(stock: StockCreate, db: Session = Depends(get_db)):
         raise HTTPException(status_code=503, detail=f"Database unavailable: {str(e)}")
 
 @router.put("/{stock_id}", response_model=Stock)
-async def update_stock(stock_id: int, stock: StockUpdate, db: Session = Depends(get_db)):
-    """Update a stock"""
+async def update_stock(stock_id: int, stock: StockUpdate, db: AsyncSession = Depends(get_async_db)):
+    """Edit a lot by hand; its wallet and ledger postings follow the edit"""
     try:
-        db_stock = db.query(StockDB).filter(StockDB.id == stock_id).first()
+        db_stock = await db.get(StockDB, stock_id)
         if db_stock is None:
             raise HTTPException(status_code=404, detail="Stock not found")
-        
+        # Wallet first, then the lot: two concurrent sells must not both credit the wallet
+        await balances.lock_wallets(db, [db_stock.wallet_id])
+        db_stock = await db.get(StockDB, stock_id, with_for_update=True, populate_existing=True)
+        if db_stock is None:
+            raise HTTPException(status_code=404, detail="Stock not found")
+        position_keys = {(db_stock.wallet_id, db_stock.code)}
+        before = _booked(db_stock)
+        # Selling a held lot sells all of what is left of it (once: a sold stock stays sold)
+        selling = db_stock.is_holding and stock.is_holding == False and bool(stock.sell_price)
+        edited = False
+
         if stock.code is not None:
-            db_stock.code = stock.code
+            db_stock.code = positions.normalize_code(stock.code)
+            edited = True
         if stock.volume is not None:
+            # Nothing sold from the lot yet: its open volume follows the edit
+            if db_stock.remaining_volume is not None and db_stock.remaining_volume == db_stock.volume:
+                db_stock.remaining_volume = stock.volume
             db_stock.volume = stock.volume
+            edited = True
         if stock.start_price is not None:
             db_stock.start_price = stock.start_price
+            edited = True
         if stock.start_date is not None:
             db_stock.start_date = stock.start_date
-        if stock.sell_price is not None:
-            db_stock.sell_price = stock.sell_price
-        if stock.sell_date is not None:
-            db_stock.sell_date = stock.sell_date
-        if stock.is_holding is not None:
-            db_stock.is_holding = stock.is_holding
         if stock.margin is not None:
             db_stock.margin = stock.margin
-        
-        # If selling stock, update wallet
-        if stock.is_holding == False and stock.sell_price:
-            wallet = db.query(WalletDB).filter(WalletDB.id == db_stock.wallet_id).first()
-            if wallet:
-                cash_return = db_stock.volume * stock.sell_price
-                wallet.cash = (wallet.cash or 0.0) + cash_return
-                wallet.investment_value = (wallet.investment_value or 0.0) - (db_stock.volume * db_stock.start_price)
-                wallet.gross_balance = (wallet.cash or 0.0) + (wallet.investment_value or 0.0)
-        
-        db.commit()
-        db.refresh(db_stock)
+            edited = True
+
+        if selling:
+            await _rebook(db, db_stock, before)
+            await positions.close(
+                db, db_stock.wallet_id, db_stock.code, [(db_stock, positions.remaining(db_stock))],
+                stock.sell_price, 0.0, stock.sell_date or datetime.now(timezone.utc)
+            )
+        else:
+            if stock.sell_price is not None:
+                db_stock.sell_price = stock.sell_price
+            if stock.sell_date is not None:
+                db_stock.sell_date = stock.sell_date
+            if stock.is_holding is not None and stock.is_holding != db_stock.is_holding:
+                # Opened or closed by hand: the whole lot is held, or none of it
+                db_stock.is_holding = stock.is_holding
+                db_stock.remaining_volume = None
+                edited = True
+            # The wallet and the ledger follow the edited lot, so reconciliation finds no drift
+            await _rebook(db, db_stock, before)
+
+        # Hand edits are not trades: recompute the affected positions from the lots
+        if edited:
+            position_keys.add((db_stock.wallet_id, db_stock.code))
+            await db.flush()
+            await positions.refresh(db, position_keys)
+
+        await db.commit()
+        await db.refresh(db_stock)
         return db_stock
     except HTTPException:
         raise
@@ -115,27 +312,32 @@ async def update_stock(stock_id: int, stock: StockUpdate, db: Session = Depends(
         raise HTTPException(status_code=503, detail=f"Database unavailable: {str(e)}")
 
 @router.delete("/{stock_id}")
-async def delete_stock(stock_id: int, db: Session = Depends(get_db)):
+async def delete_stock(stock_id: int, db: AsyncSession = Depends(get_async_db)):
     """Delete a stock (sell it)"""
     try:
-        db_stock = db.query(StockDB).filter(StockDB.id == stock_id).first()
+        db_stock = await db.get(StockDB, stock_id)
         if db_stock is None:
             raise HTTPException(status_code=404, detail="Stock not found")
-        
-        # Return cash to wallet if holding
-        if db_stock.is_holding:
-            wallet = db.query(WalletDB).filter(WalletDB.id == db_stock.wallet_id).first()
-            if wallet:
-                cash_return = db_stock.volume * db_stock.start_price
-                wallet.cash = (wallet.cash or 0.0) + cash_return
-                wallet.investment_value = (wallet.investment_value or 0.0) - (db_stock.volume * db_stock.start_price)
-                wallet.gross_balance = (wallet.cash or 0.0) + (wallet.investment_value or 0.0)
-        
-        db.delete(db_stock)
-        db.commit()
+        await balances.lock_wallets(db, [db_stock.wallet_id])
+        db_stock = await db.get(StockDB, stock_id, with_for_update=True, populate_existing=True)
+        if db_stock is None:
+            raise HTTPException(status_code=404, detail="Stock not found")
+
+        # Return cash to wallet for the shares still held (reverses the purchase at its date)
+        open_shares = positions.remaining(db_stock)
+        if open_shares > positions.EPSILON:
+            cost = open_shares * db_stock.start_price
+            deltas = {}
+            balances.track(deltas, db_stock.wallet_id, {"cash": cost, "investment_value": -cost})
+            await ledger.record(db, "stock_buy", db_stock.start_date, deltas, "stock", db_stock.id)
+
+        position_key = (db_stock.wallet_id, db_stock.code)
+        await db.delete(db_stock)
+        await db.flush()
+        await positions.refresh(db, [position_key])
+        await db.commit()
         return {"message": "Stock deleted successfully"}
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=503, detail=f"Database unavailable: {str(e)}")
-
@@ -1,28 +1,30 @@
 from fastapi import APIRouter, HTTPException, Depends
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
 from app.models import Task, TaskCreate, TaskUpdate
-from app.database import get_db
+from app.database import get_async_db
 from app.db_models import TaskDB
 
 router = APIRouter(prefix="/api/tasks", tags=["tasks"])
 
 @router.get("", response_model=List[Task])
-async def get_tasks(db: Session = Depends(get_db)):
+async def get_tasks(db: AsyncSession = Depends(get_async_db)):
     """Get all tasks"""
-    tasks = db.query(TaskDB).all()
+    result = await db.execute(select(TaskDB))
+    tasks = result.scalars().all()
     return tasks
 
 @router.get("/{task_id}", response_model=Task)
-async def get_task(task_id: int, db: Session = Depends(get_db)):
+async def get_task(task_id: int, db: AsyncSession = Depends(get_async_db)):
     """Get a specific task by ID"""
-    task = db.query(TaskDB).filter(TaskDB.id == task_id).first()
+    task = await db.get(TaskDB, task_id)
     if task is None:
         raise HTTPException(status_code=404, detail="Task not found")
     return task
 
 @router.post("", response_model=Task)
-async def create_task(task: TaskCreate, db: Session = Depends(get_db)):
+async def create_task(task: TaskCreate, db: AsyncSession = Depends(get_async_db)):
     """Create a new task"""
     db_task = TaskDB(
         title=task.title,
@@ -30,14 +32,14 @@ async def create_task(task: TaskCreate, db: Session = Depends(get_db)):
         completed=False
     )
     db.add(db_task)
-    db.commit()
-    db.refresh(db_task)
+    await db.commit()
+    await db.refresh(db_task)
     return db_task
 
 @router.put("/{task_id}", response_model=Task)
-async def update_task(task_id: int, task: TaskUpdate, db: Session = Depends(get_db)):
+async def update_task(task_id: int, task: TaskUpdate, db: AsyncSession = Depends(get_async_db)):
     """Update a task"""
-    db_task = db.query(TaskDB).filter(TaskDB.id == task_id).first()
+    db_task = await db.get(TaskDB, task_id)
     if db_task is None:
         raise HTTPException(status_code=404, detail="Task not found")
     
@@ -48,30 +50,30 @@ async def update_task(task_id: int, task: TaskUpdate, db: Session = Depends(get_
     if task.completed is not None:
         db_task.completed = task.completed
     
-    db.commit()
-    db.refresh(db_task)
+    await db.commit()
+    await db.refresh(db_task)
     return db_task
 
 @router.patch("/{task_id}/complete", response_model=Task)
-async def toggle_task_completion(task_id: int, db: Session = Depends(get_db)):
+async def toggle_task_completion(task_id: int, db: AsyncSession = Depends(get_async_db)):
     """Toggle task completion status"""
-    db_task = db.query(TaskDB).filter(TaskDB.id == task_id).first()
+    db_task = await db.get(TaskDB, task_id)
     if db_task is None:
         raise HTTPException(status_code=404, detail="Task not found")
     
     db_task.completed = not db_task.completed
-    db.commit()
-    db.refresh(db_task)
+    await db.commit()
+    await db.refresh(db_task)
     return db_task
 
 @router.delete("/{task_id}")
-async def delete_task(task_id: int, db: Session = Depends(get_db)):
+async def delete_task(task_id: int, db: AsyncSession = Depends(get_async_db)):
     """Delete a task"""
-    db_task = db.query(TaskDB).filter(TaskDB.id == task_id).first()
+    db_task = await db.get(TaskDB, task_id)
     if db_task is None:
         raise HTTPException(status_code=404, detail="Task not found")
     
-    db.delete(db_task)
-    db.commit()
+    await db.delete(db_task)
+    await db.commit()
     return {"message": "Task deleted successfully"}
 
@@ -1,33 +1,110 @@
-from fastapi import APIRouter, HTTPException, Depends
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, HTTPException, Depends, Query, Request, Response
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
 from app.models import Transaction, TransactionCreate, TransactionUpdate
-from app.database import get_db
-from app.db_models import TransactionDB, TransactionType, WalletDB, WalletType
-from datetime import datetime
+from app.database import get_async_db
+from app.db_models import TransactionDB, TransactionType, WalletDB
+from app.services import balances, ledger, rollups, transaction_import
+from app.services.pagination import MAX_PAGE_SIZE, keyset_page, split_page
+from app.services.timestamps import utc
+from datetime import date, datetime
 
 router = APIRouter(prefix="/api/transactions", tags=["transactions"])
 
+DEFAULT_PAGE_SIZE = 50
+
+def _posting(wallet, type_: TransactionType, amount: float, transaction: TransactionDB):
+    """Ledger kind, wallet effect and source of one transaction; a transfer leg moves money like its transfer"""
+    if transaction.transfer_id:
+        signed = amount if type_ == TransactionType.income else -amount
+        return "transfer", balances.transfer_effect(wallet.type, signed), "transfer", transaction.transfer_id
+    return ledger.transaction_kind(type_), balances.transaction_effect(wallet.type, type_, amount), "transaction", transaction.id
+
+def _moves_transfer_leg(db_transaction: TransactionDB, update: TransactionUpdate) -> bool:
+    """Whether an update changes what a transfer leg moves, from where or when"""
+    return (
+        (update.type is not None and update.type != TransactionType(db_transaction.type).value)
+        or (update.amount is not None and update.amount != db_transaction.amount)
+        or (update.wallet_id is not None and (update.wallet_id or None) != db_transaction.wallet_id)
+        or (update.date is not None and utc(update.date) != utc(db_transaction.date))
+    )
+
 @router.get("", response_model=List[Transaction])
-async def get_transactions(db: Session = Depends(get_db)):
-    """Get all transactions"""
+async def get_transactions(
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    wallet_id: Optional[int] = None,
+    type: Optional[TransactionType] = None,
+    category: Optional[str] = None,
+    start: Optional[datetime] = Query(None, alias="from"),
+    end: Optional[datetime] = Query(None, alias="to"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Get transactions newest first, one page at a time (next cursor in X-Next-Cursor)"""
+    stmt = select(TransactionDB)
+    if wallet_id is not None:
+        stmt = stmt.where(TransactionDB.wallet_id == wallet_id)
+    if type is not None:
+        stmt = stmt.where(TransactionDB.type == type)
+    if category is not None:
+        stmt = stmt.where(TransactionDB.category == category)
+    if start is not None:
+        stmt = stmt.where(TransactionDB.date >= start)
+    if end is not None:
+        stmt = stmt.where(TransactionDB.date <= end)
+
+    try:
+        stmt = keyset_page(stmt, TransactionDB.date, TransactionDB.id, cursor, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
     try:
-        transactions = db.query(TransactionDB).order_by(TransactionDB.date.desc()).all()
-        return transactions
+        result = await db.execute(stmt)
+        transactions = result.scalars().all()
     except Exception as e:
-        # Return empty list if database is not available
-        return []
+        # Not an empty list: a paginating client would take it for the end of the data
+        raise HTTPException(status_code=503, detail=f"Database unavailable: {str(e)}")
+    transactions, next_cursor = split_page(transactions, limit)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return transactions
+
+@router.get("/analytics")
+async def get_transaction_analytics(
+    group_by: str = Query("month", description="Comma-separated: month, category, wallet"),
+    start: Optional[date] = Query(None, alias="from"),
+    end: Optional[date] = Query(None, alias="to"),
+    wallet_id: Optional[int] = None,
+    category: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Income/expense totals per group as columnar arrays (from/to are inclusive days, UTC)"""
+    groups = [name.strip() for name in group_by.split(",") if name.strip()]
+    invalid = [name for name in groups if name not in rollups.ANALYTICS_GROUPS]
+    if invalid or len(set(groups)) != len(groups):
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid group_by. Use any of: {', '.join(rollups.ANALYTICS_GROUPS)}"
+        )
+    if start and end and start > end:
+        raise HTTPException(status_code=400, detail="'from' must not be after 'to'")
+    try:
+        return await rollups.analytics(db, groups, start, end, wallet_id, category)
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"Database unavailable: {str(e)}")
 
 @router.get("/{transaction_id}", response_model=Transaction)
-async def get_transaction(transaction_id: int, db: Session = Depends(get_db)):
+async def get_transaction(transaction_id: int, db: AsyncSession = Depends(get_async_db)):
     """Get a specific transaction by ID"""
-    transaction = db.query(TransactionDB).filter(TransactionDB.id == transaction_id).first()
+    transaction = await db.get(TransactionDB, transaction_id)
     if transaction is None:
         raise HTTPException(status_code=404, detail="Transaction not found")
     return transaction
 
 @router.post("", response_model=Transaction)
-async def create_transaction(transaction: TransactionCreate, db: Session = Depends(get_db)):
+async def create_transaction(transaction: TransactionCreate, db: AsyncSession = Depends(get_async_db)):
     """Create a new transaction"""
     try:
         # Validate transaction type
@@ -36,29 +113,11 @@ async def create_transaction(transaction: TransactionCreate, db: Session = Depen
         except ValueError:
             raise HTTPException(status_code=400, detail=f"Invalid transaction type. Must be 'income' or 'expense'")
         
-        # Update wallet balance if wallet_id is provided
+        wallet = None
         if transaction.wallet_id:
-            wallet = db.query(WalletDB).filter(WalletDB.id == transaction.wallet_id).first()
+            wallet = await db.get(WalletDB, transaction.wallet_id)
             if not wallet:
                 raise HTTPException(status_code=404, detail="Wallet not found")
-            
-            # Update wallet balance
-            if transaction_type == TransactionType.income:
-                if wallet.type == WalletType.credit:
-                    wallet.loan = (wallet.loan or 0.0) - transaction.amount  # Reduce debt
-                else:
-                    wallet.balance += transaction.amount
-                    if wallet.type == WalletType.stock:
-                        wallet.cash += transaction.amount
-                        wallet.gross_balance = (wallet.cash or 0.0) + (wallet.investment_value or 0.0)
-            else:  # expense
-                if wallet.type == WalletType.credit:
-                    wallet.loan = (wallet.loan or 0.0) + transaction.amount  # Increase debt
-                else:
-                    wallet.balance -= transaction.amount
-                    if wallet.type == WalletType.stock:
-                        wallet.cash -= transaction.amount
-                        wallet.gross_balance = (wallet.cash or 0.0) + (wallet.investment_value or 0.0)
         
         db_transaction = TransactionDB(
             type=transaction_type,
@@ -69,71 +128,136 @@ async def create_transaction(transaction: TransactionCreate, db: Session = Depen
             date=transaction.date
         )
         db.add(db_transaction)
-        db.commit()
-        db.refresh(db_transaction)
+        await db.flush()
+        
+        # Update wallet balance (relative UPDATE, safe against concurrent
+        # writes to the same wallet) and post it to the ledger
+        if wallet:
+            deltas = {}
+            balances.track(deltas, wallet.id, balances.transaction_effect(wallet.type, transaction_type, transaction.amount))
+            await ledger.record(
+                db, ledger.transaction_kind(transaction_type), db_transaction.date, deltas,
+                "transaction", db_transaction.id
+            )
+        await rollups.add(db, [db_transaction])
+        await db.commit()
+        await db.refresh(db_transaction)
         return db_transaction
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=503, detail=f"Database unavailable: {str(e)}")
 
+@router.post("/bulk")
+async def bulk_import_transactions(
+    request: Request,
+    format: Optional[str] = Query(None, description="csv or ndjson; defaults from Content-Type"),
+    batch_size: int = Query(1000, ge=1, le=10000),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Import a streamed CSV or NDJSON body of transactions; reports per-row errors"""
+    if format is None:
+        content_type = request.headers.get("content-type", "")
+        format = "csv" if "csv" in content_type else "ndjson"
+    if format not in transaction_import.FORMATS:
+        raise HTTPException(status_code=400, detail="Invalid format. Must be 'csv' or 'ndjson'")
+    try:
+        return await transaction_import.import_transactions(db, request.stream(), format, batch_size)
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"Database unavailable: {str(e)}")
+
 @router.put("/{transaction_id}", response_model=Transaction)
-async def update_transaction(transaction_id: int, transaction: TransactionUpdate, db: Session = Depends(get_db)):
-    """Update a transaction"""
-    db_transaction = db.query(TransactionDB).filter(TransactionDB.id == transaction_id).first()
-    if db_transaction is None:
-        raise HTTPException(status_code=404, detail="Transaction not found")
-    
-    if transaction.type is not None:
-        try:
-            db_transaction.type = TransactionType(transaction.type)
-        except ValueError:
-            raise HTTPException(status_code=400, detail=f"Invalid transaction type. Must be 'income' or 'expense'")
-    if transaction.amount is not None:
-        db_transaction.amount = transaction.amount
-    if transaction.description is not None:
-        db_transaction.description = transaction.description
-    if transaction.category is not None:
-        db_transaction.category = transaction.category
-    if transaction.date is not None:
-        db_transaction.date = transaction.date
-    
-    db.commit()
-    db.refresh(db_transaction)
-    return db_transaction
+async def update_transaction(transaction_id: int, transaction: TransactionUpdate, db: AsyncSession = Depends(get_async_db)):
+    """Update a transaction and move its effect on wallet balances"""
+    try:
+        db_transaction = await db.get(TransactionDB, transaction_id)
+        if db_transaction is None:
+            raise HTTPException(status_code=404, detail="Transaction not found")
+        # Wallets first, then the row (the order deletes and stock writes use):
+        # two concurrent edits must not both reverse the old amount
+        await balances.lock_wallets(db, [w for w in (db_transaction.wallet_id, transaction.wallet_id) if w])
+        db_transaction = await db.get(TransactionDB, transaction_id, with_for_update=True, populate_existing=True)
+        if db_transaction is None:
+            raise HTTPException(status_code=404, detail="Transaction not found")
+        # A leg changed on its own would no longer match the other leg and its transfer
+        if db_transaction.transfer_id and _moves_transfer_leg(db_transaction, transaction):
+            raise HTTPException(
+                status_code=400,
+                detail="Transaction is a leg of a transfer: only its description and category can be edited"
+            )
+        
+        # Move the transaction out of its old rollup and into the new one
+        deltas = {}
+        rollups.track(deltas, db_transaction, -1)
+        old = (db_transaction.wallet_id, db_transaction.type, db_transaction.amount, db_transaction.date)
+        if transaction.type is not None:
+            try:
+                db_transaction.type = TransactionType(transaction.type)
+            except ValueError:
+                raise HTTPException(status_code=400, detail=f"Invalid transaction type. Must be 'income' or 'expense'")
+        if transaction.amount is not None:
+            db_transaction.amount = transaction.amount
+        if transaction.description is not None:
+            db_transaction.description = transaction.description
+        if transaction.category is not None:
+            db_transaction.category = transaction.category
+        if transaction.wallet_id is not None:
+            db_transaction.wallet_id = transaction.wallet_id or None
+        if transaction.date is not None:
+            db_transaction.date = transaction.date
+        rollups.track(deltas, db_transaction)
+        await rollups.apply(db, deltas)
+        
+        # Reverse the old effect at its date and apply the new one at its date
+        new = (db_transaction.wallet_id, db_transaction.type, db_transaction.amount, db_transaction.date)
+        if new != old:
+            wallet_ids = {wallet_id for wallet_id, *_ in (old, new) if wallet_id}
+            result = await db.execute(select(WalletDB).where(WalletDB.id.in_(wallet_ids)))
+            wallets = {wallet.id: wallet for wallet in result.scalars().all()}
+            if new[0] and new[0] not in wallets:
+                raise HTTPException(status_code=404, detail="Wallet not found")
+            for (wallet_id, type_, amount, effective_at), sign in ((old, -1), (new, 1)):
+                if wallet_id in wallets:
+                    kind, effect, source_type, source_id = _posting(wallets[wallet_id], type_, amount, db_transaction)
+                    wallet_deltas = {}
+                    balances.track(wallet_deltas, wallet_id, effect, sign)
+                    await ledger.record(db, kind, effective_at, wallet_deltas, source_type, source_id)
+        
+        await db.commit()
+        await db.refresh(db_transaction)
+        return db_transaction
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"Database unavailable: {str(e)}")
 
 @router.delete("/{transaction_id}")
-async def delete_transaction(transaction_id: int, db: Session = Depends(get_db)):
+async def delete_transaction(transaction_id: int, db: AsyncSession = Depends(get_async_db)):
     """Delete a transaction and update wallet balance"""
     try:
-        db_transaction = db.query(TransactionDB).filter(TransactionDB.id == transaction_id).first()
+        db_transaction = await db.get(TransactionDB, transaction_id)
+        if db_transaction is None:
+            raise HTTPException(status_code=404, detail="Transaction not found")
+        # Wallet first, then the row: of two concurrent deletes only the first
+        # finds the row, so the reversal is posted once
+        wallets = await balances.lock_wallets(db, [db_transaction.wallet_id] if db_transaction.wallet_id else [])
+        db_transaction = await db.get(TransactionDB, transaction_id, with_for_update=True, populate_existing=True)
         if db_transaction is None:
             raise HTTPException(status_code=404, detail="Transaction not found")
         
         # Update wallet balance if wallet_id is provided
         if db_transaction.wallet_id:
-            wallet = db.query(WalletDB).filter(WalletDB.id == db_transaction.wallet_id).first()
+            wallet = wallets.get(db_transaction.wallet_id) or await db.get(WalletDB, db_transaction.wallet_id)
             if wallet:
-                # Reverse the transaction effect
-                if db_transaction.type == TransactionType.income:
-                    if wallet.type == WalletType.credit:
-                        wallet.loan = (wallet.loan or 0.0) + db_transaction.amount  # Increase debt
-                    else:
-                        wallet.balance -= db_transaction.amount
-                        if wallet.type == WalletType.stock:
-                            wallet.cash -= db_transaction.amount
-                            wallet.gross_balance = (wallet.cash or 0.0) + (wallet.investment_value or 0.0)
-                else:  # expense
-                    if wallet.type == WalletType.credit:
-                        wallet.loan = (wallet.loan or 0.0) - db_transaction.amount  # Reduce debt
-                    else:
-                        wallet.balance += db_transaction.amount
-                        if wallet.type == WalletType.stock:
-                            wallet.cash += db_transaction.amount
-                            wallet.gross_balance = (wallet.cash or 0.0) + (wallet.investment_value or 0.0)
+                # Reverse the transaction effect, dated like the transaction
+                kind, effect, source_type, source_id = _posting(wallet, db_transaction.type, db_transaction.amount, db_transaction)
+                deltas = {}
+                balances.track(deltas, wallet.id, effect, sign=-1)
+                await ledger.record(db, kind, db_transaction.date, deltas, source_type, source_id)
         
-        db.delete(db_transaction)
-        db.commit()
+        await rollups.add(db, [db_transaction], sign=-1)
+        await db.delete(db_transaction)
+        await db.commit()
         return {"message": "Transaction deleted successfully"}
     except HTTPException:
         raise
@@ -141,12 +265,12 @@ async def delete_transaction(transaction_id: int, db: Session = Depends(get_db))
         raise HTTPException(status_code=503, detail=f"Database unavailable: {str(e)}")
 
 @router.get("/summary/totals")
-async def get_transaction_totals(db: Session = Depends(get_db)):
+async def get_transaction_totals(db: AsyncSession = Depends(get_async_db)):
     """Get total income and expenses"""
     try:
-        transactions = db.query(TransactionDB).all()
-        total_income = sum(t.amount for t in transactions if t.type == TransactionType.income)
-        total_expenses = sum(t.amount for t in transactions if t.type == TransactionType.expense)
+        totals = await rollups.totals_by_type(db)
+        total_income = totals.get(TransactionType.income, 0.0)
+        total_expenses = totals.get(TransactionType.expense, 0.0)
         balance = total_income - total_expenses
         
         return {
@@ -1,105 +1,208 @@
-from fastapi import APIRouter, HTTPException, Depends
-from sqlalchemy.orm import Session
-from app.models import MoneyTransfer
-from app.database import get_db
-from app.db_models import WalletDB, WalletType, TransactionDB, TransactionType
-from datetime import datetime
+from fastapi import APIRouter, HTTPException, Depends, Header, Query, Response
+from sqlalchemy import and_, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+from typing import Dict, List, Optional
+from app.models import MoneyTransfer, MoneyTransferBatch, Transfer
+from app.database import get_async_db
+from app.db_models import WalletDB, WalletType, TransactionDB, TransactionType, TransferDB
+from app.services import balances, idempotency, ledger, rollups
+from app.services.pagination import MAX_PAGE_SIZE, keyset_page, split_page
+from datetime import datetime, timezone
 
 router = APIRouter(prefix="/api/transfers", tags=["transfers"])
 
-@router.post("")
-async def transfer_money(transfer: MoneyTransfer, db: Session = Depends(get_db)):
-    """Transfer money between wallets"""
+MAX_BATCH_SIZE = 500
+DEFAULT_PAGE_SIZE = 50
+
+@router.get("", response_model=List[Transfer])
+async def get_transfers(
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    wallet_id: Optional[int] = Query(None, description="Transfers into or out of this wallet"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Transfer history newest first with both legs and wallet names (next cursor in X-Next-Cursor)"""
+    from_wallet, to_wallet = aliased(WalletDB), aliased(WalletDB)
+    expense, income = aliased(TransactionDB), aliased(TransactionDB)
+    # One query: the wallets and legs are joined in, not loaded per row
+    stmt = (
+        select(
+            TransferDB.id, TransferDB.from_wallet_id, from_wallet.name.label("from_wallet_name"),
+            TransferDB.to_wallet_id, to_wallet.name.label("to_wallet_name"),
+            TransferDB.amount, TransferDB.description, TransferDB.date,
+            expense.id.label("expense_transaction_id"), income.id.label("income_transaction_id")
+        )
+        .outerjoin(from_wallet, from_wallet.id == TransferDB.from_wallet_id)
+        .outerjoin(to_wallet, to_wallet.id == TransferDB.to_wallet_id)
+        .outerjoin(expense, and_(expense.transfer_id == TransferDB.id, expense.type == TransactionType.expense))
+        .outerjoin(income, and_(income.transfer_id == TransferDB.id, income.type == TransactionType.income))
+    )
+    if wallet_id is not None:
+        stmt = stmt.where(or_(TransferDB.from_wallet_id == wallet_id, TransferDB.to_wallet_id == wallet_id))
     try:
-        from_wallet = db.query(WalletDB).filter(WalletDB.id == transfer.from_wallet_id).first()
-        to_wallet = db.query(WalletDB).filter(WalletDB.id == transfer.to_wallet_id).first()
-        
-        if not from_wallet:
-            raise HTTPException(status_code=404, detail="Source wallet not found")
-        if not to_wallet:
-            raise HTTPException(status_code=404, detail="Destination wallet not found")
-        if from_wallet.id == to_wallet.id:
-            raise HTTPException(status_code=400, detail="Cannot transfer to the same wallet")
-        
-        # Check balance for non-credit wallets
-        if from_wallet.type != WalletType.credit:
-            if from_wallet.type == WalletType.stock:
-                if (from_wallet.cash or 0.0) < transfer.amount:
-                    raise HTTPException(status_code=400, detail="Insufficient cash in source wallet")
-            else:
-                if from_wallet.balance < transfer.amount:
-                    raise HTTPException(status_code=400, detail="Insufficient balance in source wallet")
-        
-        now = datetime.now()
-        
-        # Handle credit card transfers specially
-        if from_wallet.type == WalletType.credit:
-            # Transferring from credit = paying off debt
-            from_wallet.loan = (from_wallet.loan or 0.0) - transfer.amount
-            if to_wallet.type == WalletType.credit:
-                to_wallet.loan = (to_wallet.loan or 0.0) + transfer.amount
-            elif to_wallet.type == WalletType.stock:
-                to_wallet.cash = (to_wallet.cash or 0.0) + transfer.amount
-                to_wallet.balance += transfer.amount
-                to_wallet.gross_balance = (to_wallet.cash or 0.0) + (to_wallet.investment_value or 0.0)
-            else:
-                to_wallet.balance += transfer.amount
-        elif to_wallet.type == WalletType.credit:
-            # Transferring to credit = using credit
-            to_wallet.loan = (to_wallet.loan or 0.0) + transfer.amount
-            if from_wallet.type == WalletType.stock:
-                from_wallet.cash = (from_wallet.cash or 0.0) - transfer.amount
-                from_wallet.balance -= transfer.amount
-                from_wallet.gross_balance = (from_wallet.cash or 0.0) + (from_wallet.investment_value or 0.0)
-            else:
-                from_wallet.balance -= transfer.amount
+        stmt = keyset_page(stmt, TransferDB.date, TransferDB.id, cursor, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    try:
+        result = await db.execute(stmt)
+        rows = result.all()
+    except Exception as e:
+        # Not an empty list: a paginating client would take it for the end of the data
+        raise HTTPException(status_code=503, detail=f"Database unavailable: {str(e)}")
+    rows, next_cursor = split_page(rows, limit)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return [row._asdict() for row in rows]
+
+def _check_transfer(transfer: MoneyTransfer, wallets: Dict[int, WalletDB], pending: balances.WalletDeltas):
+    """Validate one transfer against the locked wallets plus the batch's earlier transfers"""
+    if transfer.amount <= 0:
+        raise HTTPException(status_code=400, detail="Transfer amount must be positive")
+    if transfer.from_wallet_id == transfer.to_wallet_id:
+        raise HTTPException(status_code=400, detail="Cannot transfer to the same wallet")
+    from_wallet = wallets.get(transfer.from_wallet_id)
+    to_wallet = wallets.get(transfer.to_wallet_id)
+
+    if not from_wallet:
+        raise HTTPException(status_code=404, detail="Source wallet not found")
+    if not to_wallet:
+        raise HTTPException(status_code=404, detail="Destination wallet not found")
+
+    # Check balance for non-credit wallets
+    moved = pending.get(from_wallet.id, {})
+    if from_wallet.type != WalletType.credit:
+        if from_wallet.type == WalletType.stock:
+            if (from_wallet.cash or 0.0) + moved.get("cash", 0.0) < transfer.amount:
+                raise HTTPException(status_code=400, detail="Insufficient cash in source wallet")
         else:
-            # Regular transfer between non-credit wallets
-            if from_wallet.type == WalletType.stock:
-                from_wallet.cash = (from_wallet.cash or 0.0) - transfer.amount
-                from_wallet.balance -= transfer.amount
-                from_wallet.gross_balance = (from_wallet.cash or 0.0) + (from_wallet.investment_value or 0.0)
-            else:
-                from_wallet.balance -= transfer.amount
-            
-            if to_wallet.type == WalletType.stock:
-                to_wallet.cash = (to_wallet.cash or 0.0) + transfer.amount
-                to_wallet.balance += transfer.amount
-                to_wallet.gross_balance = (to_wallet.cash or 0.0) + (to_wallet.investment_value or 0.0)
-            else:
-                to_wallet.balance += transfer.amount
-        
-        # Create transaction records
-        description = transfer.description or f"Transfer to {to_wallet.name}"
-        expense_transaction = TransactionDB(
-            type=TransactionType.expense,
+            if from_wallet.balance + moved.get("balance", 0.0) < transfer.amount:
+                raise HTTPException(status_code=400, detail="Insufficient balance in source wallet")
+    return from_wallet, to_wallet
+
+async def execute_transfers(transfers: List[MoneyTransfer], db: AsyncSession) -> Dict[int, WalletDB]:
+    """Apply transfers in order inside the caller's database transaction; all or nothing"""
+    # Lock every wallet once (ascending id, like every other writer) so the
+    # balance checks below still hold when the updates run
+    wallet_ids = {t.from_wallet_id for t in transfers} | {t.to_wallet_id for t in transfers}
+    wallets = await balances.lock_wallets(db, wallet_ids)
+
+    now = datetime.now(timezone.utc)
+    deltas: balances.WalletDeltas = {}
+    effects = []
+    for index, transfer in enumerate(transfers):
+        try:
+            from_wallet, to_wallet = _check_transfer(transfer, wallets, deltas)
+        except HTTPException as e:
+            if len(transfers) > 1:
+                e.detail = f"Transfer {index}: {e.detail}"
+            raise
+
+        # Transferring from credit pays its debt down, transferring to credit uses it
+        transfer_deltas = {}
+        balances.track(transfer_deltas, from_wallet.id, balances.transfer_effect(from_wallet.type, -transfer.amount))
+        balances.track(transfer_deltas, to_wallet.id, balances.transfer_effect(to_wallet.type, transfer.amount))
+        for wallet_id, effect in transfer_deltas.items():
+            balances.track(deltas, wallet_id, effect)
+        effects.append(transfer_deltas)
+
+    db_transfers = [
+        TransferDB(
+            from_wallet_id=transfer.from_wallet_id,
+            to_wallet_id=transfer.to_wallet_id,
             amount=transfer.amount,
-            description=description,
-            category="Transfer",
-            wallet_id=from_wallet.id,
+            description=transfer.description,
             date=now
         )
-        
-        income_transaction = TransactionDB(
+        for transfer in transfers
+    ]
+    db.add_all(db_transfers)
+    await db.flush()
+
+    postings = []
+    legs = []
+    for db_transfer, transfer_deltas in zip(db_transfers, effects):
+        from_wallet, to_wallet = wallets[db_transfer.from_wallet_id], wallets[db_transfer.to_wallet_id]
+        postings.extend(ledger.entry_rows("transfer", now, transfer_deltas, "transfer", db_transfer.id))
+
+        # Create transaction records, linked through the transfer
+        legs.append(TransactionDB(
+            type=TransactionType.expense,
+            amount=db_transfer.amount,
+            description=db_transfer.description or f"Transfer to {to_wallet.name}",
+            category="Transfer",
+            wallet_id=from_wallet.id,
+            date=now,
+            transfer_id=db_transfer.id
+        ))
+        legs.append(TransactionDB(
             type=TransactionType.income,
-            amount=transfer.amount,
+            amount=db_transfer.amount,
             description=f"Transfer from {from_wallet.name}",
             category="Transfer",
             wallet_id=to_wallet.id,
-            date=now
-        )
-        
-        db.add(expense_transaction)
-        db.add(income_transaction)
-        db.commit()
-        
-        return {
-            "message": "Transfer completed successfully",
-            "from_wallet_balance": from_wallet.balance,
-            "to_wallet_balance": to_wallet.balance
-        }
+            date=now,
+            transfer_id=db_transfer.id
+        ))
+
+    # One relative UPDATE per wallet, however many transfers touch it
+    await balances.apply_deltas(db, deltas)
+    await ledger.write(db, postings)
+    db.add_all(legs)
+    await rollups.add(db, legs)
+    for wallet in wallets.values():
+        await db.refresh(wallet)
+    return wallets
+
+async def _run(scope: str, transfers: List[MoneyTransfer], payload, idempotency_key: Optional[str], db: AsyncSession, respond):
+    """Execute and commit, replaying the stored response when the key was seen before"""
+    try:
+        if idempotency_key:
+            replay = await idempotency.claim(db, scope, idempotency_key, payload)
+            if replay is not None:
+                return replay
+        wallets = await execute_transfers(transfers, db)
+        body = respond(wallets)
+        if idempotency_key:
+            await idempotency.store(db, scope, idempotency_key, body)
+        await db.commit()
+        return body
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=503, detail=f"Database unavailable: {str(e)}")
 
+@router.post("")
+async def transfer_money(
+    transfer: MoneyTransfer,
+    idempotency_key: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Transfer money between wallets"""
+    return await _run("transfer", [transfer], transfer, idempotency_key, db, lambda wallets: {
+        "message": "Transfer completed successfully",
+        "from_wallet_balance": wallets[transfer.from_wallet_id].balance,
+        "to_wallet_balance": wallets[transfer.to_wallet_id].balance
+    })
+
+@router.post("/batch")
+async def transfer_money_batch(
+    batch: MoneyTransferBatch,
+    idempotency_key: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Apply many transfers atomically, in order, in one database transaction"""
+    if not batch.transfers:
+        raise HTTPException(status_code=400, detail="No transfers given")
+    if len(batch.transfers) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_SIZE} transfers per batch")
+    return await _run("transfer_batch", batch.transfers, batch, idempotency_key, db, lambda wallets: {
+        "message": f"{len(batch.transfers)} transfer(s) completed successfully",
+        "count": len(batch.transfers),
+        "wallets": [
+            {"wallet_id": wallet.id, "balance": wallet.balance, "cash": wallet.cash, "loan": wallet.loan}
+            for wallet in sorted(wallets.values(), key=lambda wallet: wallet.id)
+        ]
+    })
@@ -1,7 +1,8 @@
 from fastapi import APIRouter, HTTPException, Depends
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.models import User, UserCreate, UserUpdate, UserLogin
-from app.database import get_db
+from app.database import get_async_db
 from app.db_models import UserDB
 import hashlib
 
@@ -12,12 +13,13 @@ def hash_password(password: str) -> str:
     return hashlib.sha256(password.encode()).hexdigest()
 
 @router.post("/register", response_model=User)
-async def register_user(user: UserCreate, db: Session = Depends(get_db)):
+async def register_user(user: UserCreate, db: AsyncSession = Depends(get_async_db)):
     """Register a new user"""
     try:
         # Check if username already exists
         if user.username:
-            existing = db.query(UserDB).filter(UserDB.username == user.username).first()
+            result = await db.execute(select(UserDB).where(UserDB.username == user.username))
+            existing = result.scalars().first()
             if existing:
                 raise HTTPException(status_code=400, detail="Username already exists")
         
@@ -31,8 +33,8 @@ async def register_user(user: UserCreate, db: Session = Depends(get_db)):
             bio=user.bio
         )
         db.add(db_user)
-        db.commit()
-        db.refresh(db_user)
+        await db.commit()
+        await db.refresh(db_user)
         return db_user
     except HTTPException:
         raise
@@ -40,14 +42,16 @@ async def register_user(user: UserCreate, db: Session = Depends(get_db)):
         raise HTTPException(status_code=503, detail=f"Database unavailable: {str(e)}")
 
 @router.post("/login", response_model=User)
-async def login_user(login: UserLogin, db: Session = Depends(get_db)):
+async def login_user(login: UserLogin, db: AsyncSession = Depends(get_async_db)):
     """Login user"""
     try:
         if login.username:
-            user = db.query(UserDB).filter(UserDB.username == login.username).first()
+            result = await db.execute(select(UserDB).where(UserDB.username == login.username))
+            user = result.scalars().first()
         else:
             # If no username, get first user (for apps without username)
-            user = db.query(UserDB).first()
+            result = await db.execute(select(UserDB).limit(1))
+            user = result.scalars().first()
         
         if not user:
             raise HTTPException(status_code=404, detail="User not found")
@@ -63,10 +67,11 @@ async def login_user(login: UserLogin, db: Session = Depends(get_db)):
         raise HTTPException(status_code=503, detail=f"Database unavailable: {str(e)}")
 
 @router.get("/me", response_model=User)
-async def get_current_user(db: Session = Depends(get_db)):
+async def get_current_user(db: AsyncSession = Depends(get_async_db)):
     """Get current user (first user for now)"""
     try:
-        user = db.query(UserDB).first()
+        result = await db.execute(select(UserDB).limit(1))
+        user = result.scalars().first()
         if not user:
             raise HTTPException(status_code=404, detail="No user found")
         return user
@@ -76,10 +81,11 @@ async def get_current_user(db: Session = Depends(get_db)):
         raise HTTPException(status_code=503, detail=f"Database unavailable: {str(e)}")
 
 @router.put("/me", response_model=User)
-async def update_current_user(user: UserUpdate, db: Session = Depends(get_db)):
+async def update_current_user(user: UserUpdate, db: AsyncSession = Depends(get_async_db)):
     """Update current user profile"""
     try:
-        db_user = db.query(UserDB).first()
+        result = await db.execute(select(UserDB).limit(1))
+        db_user = result.scalars().first()
         if not db_user:
             raise HTTPException(status_code=404, detail="No user found")
         
@@ -87,10 +93,11 @@ async def update_current_user(user: UserUpdate, db: Session = Depends(get_db)):
             db_user.name = user.name
         if user.username is not None:
             # Check if username is taken by another user
-            existing = db.query(UserDB).filter(
+            result = await db.execute(select(UserDB).where(
                 UserDB.username == user.username,
                 UserDB.id != db_user.id
-            ).first()
+            ))
+            existing = result.scalars().first()
             if existing:
                 raise HTTPException(status_code=400, detail="Username already taken")
             db_user.username = user.username
@@ -105,8 +112,8 @@ async def update_current_user(user: UserUpdate, db: Session = Depends(get_db)):
         if user.bio is not None:
             db_user.bio = user.bio
         
-        db.commit()
-        db.refresh(db_user)
+        await db.commit()
+        await db.refresh(db_user)
         return db_user
     except HTTPException:
         raise
@@ -1,26 +1,47 @@
-from fastapi import APIRouter, HTTPException, Depends
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, HTTPException, Depends, Query
+from sqlalchemy import case, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from typing import List, Optional
+from datetime import datetime, timezone
 from app.models import Wallet, WalletCreate, WalletUpdate
-from app.database import get_db
+from app.database import get_async_db
 from app.db_models import WalletDB, WalletType
+from app.services import balances, ledger, net_worth, reconciliation, returns, rollups
 
 router = APIRouter(prefix="/api/wallets", tags=["wallets"])
 
 @router.get("", response_model=List[Wallet])
-async def get_wallets(db: Session = Depends(get_db)):
+async def get_wallets(db: AsyncSession = Depends(get_async_db)):
     """Get all wallets"""
     try:
-        wallets = db.query(WalletDB).order_by(WalletDB.created_at.desc()).all()
+        result = await db.execute(select(WalletDB).order_by(WalletDB.created_at.desc()))
+        wallets = result.scalars().all()
         return wallets
     except Exception as e:
         return []
 
+@router.get("/reconciliation")
+async def get_reconciliation(db: AsyncSession = Depends(get_async_db)):
+    """Report wallet fields and ledger postings that have drifted from their sources"""
+    try:
+        return await reconciliation.reconcile(db)
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"Database unavailable: {str(e)}")
+
+@router.post("/reconciliation/repair")
+async def repair_reconciliation(db: AsyncSession = Depends(get_async_db)):
+    """Correct the ledger from its sources and rewrite drifted wallets from the ledger"""
+    try:
+        return await reconciliation.reconcile(db, repair=True)
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"Database unavailable: {str(e)}")
+
 @router.get("/{wallet_id}", response_model=Wallet)
-async def get_wallet(wallet_id: int, db: Session = Depends(get_db)):
+async def get_wallet(wallet_id: int, db: AsyncSession = Depends(get_async_db)):
     """Get a specific wallet by ID"""
     try:
-        wallet = db.query(WalletDB).filter(WalletDB.id == wallet_id).first()
+        wallet = await db.get(WalletDB, wallet_id)
         if wallet is None:
             raise HTTPException(status_code=404, detail="Wallet not found")
         return wallet
@@ -29,8 +50,46 @@ async def get_wallet(wallet_id: int, db: Session = Depends(get_db)):
     except Exception as e:
         raise HTTPException(status_code=503, detail=f"Database unavailable: {str(e)}")
 
+@router.get("/{wallet_id}/balance")
+async def get_wallet_balance(
+    wallet_id: int,
+    as_of: Optional[datetime] = Query(None, description="Point in time; defaults to now"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Wallet balance fields at a point in time, derived from the ledger"""
+    try:
+        wallet = await db.get(WalletDB, wallet_id)
+        if wallet is None:
+            raise HTTPException(status_code=404, detail="Wallet not found")
+        return await ledger.balance_at(db, wallet, as_of or datetime.now(timezone.utc))
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"Database unavailable: {str(e)}")
+
+@router.get("/{wallet_id}/returns")
+async def get_wallet_returns(
+    wallet_id: int,
+    from_: Optional[datetime] = Query(None, alias="from", description="Range start; defaults to the start of the year"),
+    to: Optional[datetime] = Query(None, description="Range end; defaults to now"),
+    series: bool = Query(False, description="Include the daily value, flow and cumulative TWR series"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Time-weighted and money-weighted (XIRR) return of a wallet over a range"""
+    if from_ is not None and to is not None and from_ >= to:
+        raise HTTPException(status_code=400, detail="'from' must be before 'to'")
+    try:
+        wallet = await db.get(WalletDB, wallet_id)
+        if wallet is None:
+            raise HTTPException(status_code=404, detail="Wallet not found")
+        return await returns.wallet_returns(db, wallet, from_, to, series)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"Database unavailable: {str(e)}")
+
 @router.post("", response_model=Wallet)
-async def create_wallet(wallet: WalletCreate, db: Session = Depends(get_db)):
+async def create_wallet(wallet: WalletCreate, db: AsyncSession = Depends(get_async_db)):
     """Create a new wallet"""
     try:
         # Validate wallet type
@@ -55,8 +114,15 @@ async def create_wallet(wallet: WalletCreate, db: Session = Depends(get_db)):
             not_mine=wallet.not_mine or False
         )
         db.add(db_wallet)
-        db.commit()
-        db.refresh(db_wallet)
+        await db.flush()
+        
+        # Starting cash, holdings or debt open the wallet's ledger
+        opening = {field: getattr(db_wallet, field) for field in balances.FIELDS if getattr(db_wallet, field)}
+        if opening:
+            await ledger.post(db, "opening", datetime.now(timezone.utc), {db_wallet.id: opening}, "wallet", db_wallet.id)
+        
+        await db.commit()
+        await db.refresh(db_wallet)
         return db_wallet
     except HTTPException:
         raise
@@ -64,13 +130,30 @@ async def create_wallet(wallet: WalletCreate, db: Session = Depends(get_db)):
         raise HTTPException(status_code=503, detail=f"Database unavailable: {str(e)}")
 
 @router.put("/{wallet_id}", response_model=Wallet)
-async def update_wallet(wallet_id: int, wallet: WalletUpdate, db: Session = Depends(get_db)):
+async def update_wallet(wallet_id: int, wallet: WalletUpdate, db: AsyncSession = Depends(get_async_db)):
     """Update a wallet"""
     try:
-        db_wallet = db.query(WalletDB).filter(WalletDB.id == wallet_id).first()
+        # Locked so the adjustment posted below is measured against current values
+        db_wallet = (await balances.lock_wallets(db, [wallet_id])).get(wallet_id)
         if db_wallet is None:
             raise HTTPException(status_code=404, detail="Wallet not found")
         
+        # Marking a wallet not_mine takes its history out of the net worth
+        # (before the adjustment below, which is filed by the new flag)
+        if wallet.not_mine is not None and wallet.not_mine != db_wallet.not_mine:
+            await net_worth.move_wallet(db, db_wallet, -1 if wallet.not_mine else 1)
+            db_wallet.not_mine = wallet.not_mine
+            await db.flush()
+        
+        # Setting a balance field directly is posted as an adjustment
+        adjustment = {}
+        for field in balances.FIELDS:
+            value = getattr(wallet, field)
+            if value is not None and value != (getattr(db_wallet, field) or 0.0):
+                adjustment[field] = value - (getattr(db_wallet, field) or 0.0)
+        if adjustment:
+            await ledger.post(db, "adjustment", datetime.now(timezone.utc), {wallet_id: adjustment}, "wallet", wallet_id)
+        
         if wallet.name is not None:
             db_wallet.name = wallet.name
         if wallet.balance is not None:
@@ -87,11 +170,9 @@ async def update_wallet(wallet_id: int, wallet: WalletUpdate, db: Session = Depe
             db_wallet.gross_balance = wallet.gross_balance
         if wallet.loan is not None:
             db_wallet.loan = wallet.loan
-        if wallet.not_mine is not None:
-            db_wallet.not_mine = wallet.not_mine
         
-        db.commit()
-        db.refresh(db_wallet)
+        await db.commit()
+        await db.refresh(db_wallet)
         return db_wallet
     except HTTPException:
         raise
@@ -99,15 +180,25 @@ async def update_wallet(wallet_id: int, wallet: WalletUpdate, db: Session = Depe
         raise HTTPException(status_code=503, detail=f"Database unavailable: {str(e)}")
 
 @router.delete("/{wallet_id}")
-async def delete_wallet(wallet_id: int, db: Session = Depends(get_db)):
+async def delete_wallet(wallet_id: int, db: AsyncSession = Depends(get_async_db)):
     """Delete a wallet"""
     try:
-        db_wallet = db.query(WalletDB).filter(WalletDB.id == wallet_id).first()
+        # Load children up front: the delete cascade nulls their wallet_id and
+        # an implicit lazy load is not allowed on an AsyncSession
+        db_wallet = await db.get(
+            WalletDB,
+            wallet_id,
+            options=[selectinload(WalletDB.transactions), selectinload(WalletDB.stocks)]
+        )
         if db_wallet is None:
             raise HTTPException(status_code=404, detail="Wallet not found")
         
-        db.delete(db_wallet)
-        db.commit()
+        # Its transactions stay, detached from any wallet
+        await rollups.move_wallet(db, wallet_id)
+        if not db_wallet.not_mine:
+            await net_worth.move_wallet(db, db_wallet, -1)
+        await db.delete(db_wallet)
+        await db.commit()
         return {"message": "Wallet deleted successfully"}
     except HTTPException:
         raise
@@ -115,12 +206,14 @@ async def delete_wallet(wallet_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=503, detail=f"Database unavailable: {str(e)}")
 
 @router.get("/summary/totals")
-async def get_wallet_totals(db: Session = Depends(get_db)):
+async def get_wallet_totals(db: AsyncSession = Depends(get_async_db)):
     """Get total balance across all wallets (excluding credit)"""
     try:
-        wallets = db.query(WalletDB).all()
-        total_balance = sum(w.balance for w in wallets if w.type != WalletType.credit)
-        total_credit = sum(w.loan or 0.0 for w in wallets if w.type == WalletType.credit)
+        result = await db.execute(select(
+            func.coalesce(func.sum(case((WalletDB.type != WalletType.credit, WalletDB.balance), else_=0.0)), 0.0),
+            func.coalesce(func.sum(case((WalletDB.type == WalletType.credit, func.coalesce(WalletDB.loan, 0.0)), else_=0.0)), 0.0)
+        ))
+        total_balance, total_credit = result.one()
         
         return {
             "total_balance": total_balance,
@@ -0,0 +1,29 @@
+"""
+Schema upgrades for databases created by an older version.
+
+`Base.metadata.create_all` creates missing tables but never alters existing
+ones, so a column added to an existing table is added here with an
+idempotent statement. The statements run in order, after create_all (new
+tables such as transfers exist by then), at startup and with
+    python maintenance.py upgrade-schema
+"""
+from typing import List
+
+from sqlalchemy import text
+
+UPGRADES: List[str] = [
+    # Transfers: both legs of a transfer point at their transfers row
+    "ALTER TABLE transactions ADD COLUMN IF NOT EXISTS transfer_id INTEGER REFERENCES transfers(id) ON DELETE SET NULL",
+    "CREATE INDEX IF NOT EXISTS ix_transactions_transfer_id ON transactions (transfer_id)",
+    # Partial sells: open shares of a lot (NULL on lots from before, see positions.remaining)
+    "ALTER TABLE stocks ADD COLUMN IF NOT EXISTS remaining_volume DOUBLE PRECISION",
+    "CREATE INDEX IF NOT EXISTS ix_stocks_wallet_code_start ON stocks (wallet_id, code, start_date, id)",
+    # Lots are looked up by their bare code (index above); codes are stored upper-case
+    "UPDATE stocks SET code = UPPER(TRIM(code)) WHERE code <> UPPER(TRIM(code))",
+]
+
+def upgrade(conn) -> int:
+    """Apply every upgrade on a sync connection (or through AsyncConnection.run_sync); the caller commits"""
+    for statement in UPGRADES:
+        conn.execute(text(statement))
+    return len(UPGRADES)
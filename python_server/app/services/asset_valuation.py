@@ -0,0 +1,144 @@
+"""
+Mark-to-market valuation of assets.
+
+Gold, crypto and stock assets hold a `value` entered by hand on `date`. The
+valuation prices them at the cached quote instead: `amount` units at the
+quote, converted from the quote's currency into the asset's. Gold and crypto
+are quoted in USD per unit (gold per troy ounce, see ASSET_GOLD_UNIT_OUNCES);
+stocks in their listing currency, taken to be the asset's. The change since
+`date` is the market value minus the entered value. Other assets, and assets
+without a quote or an exchange rate, keep their entered value.
+
+Every asset is joined against the quote cache in one pass: the distinct
+quote keys go through the cache together (misses as one batched upstream
+request per provider, see market_quotes.fetch_quotes_batch), and values and
+conversions are NumPy column operations. The background refresher keeps the
+assets' quotes warm, so the assets page costs no upstream fetch at all.
+
+The result is cached per worker until an asset is written in that worker, a
+quote or the FX rates are refreshed, or ASSET_VALUATION_TTL seconds (default
+30) pass, which also bounds how long writes made through another worker take
+to show.
+
+Environment variables:
+    ASSET_VALUATION_TTL     seconds a valuation is reused (default 30)
+    ASSET_GOLD_UNIT_OUNCES  troy ounces per unit of a gold asset's amount (default 1; 1.20565 for taels)
+"""
+import os
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db_models import AssetDB, AssetType
+from app.services import fx, net_worth
+from app.services.market_quotes import asset_quote_key, fetch_quotes_batch
+from app.services.quote_cache import quote_cache
+from app.services.timestamps import utc
+
+ASSET_VALUATION_TTL = float(os.getenv("ASSET_VALUATION_TTL", "30"))
+GOLD_UNIT_OUNCES = float(os.getenv("ASSET_GOLD_UNIT_OUNCES", "1"))
+USD_QUOTED = ("gold", "crypto")
+
+_generation = 0  # Bumped by asset writes in this worker
+_cached: Optional[Tuple[Tuple, float, Dict[str, Any]]] = None  # (version, expires, result)
+
+def invalidate():
+    """Drop the cached valuation (called after asset writes)"""
+    global _generation, _cached
+    _generation += 1
+    _cached = None
+
+def _version(quote_generation: int) -> Tuple:
+    return (_generation, quote_generation, fx.live_rates()["fetched_at"])
+
+async def compute(db: AsyncSession) -> Tuple[Dict[str, Any], Tuple]:
+    """Value every asset at the cached quotes; (result, the version it reflects)"""
+    generation = _generation
+    assets = (await db.execute(select(AssetDB).order_by(AssetDB.date.desc()))).scalars().all()
+    keys = [asset_quote_key(AssetType(asset.type), asset.name) for asset in assets]
+    quotes = await quote_cache.get_many(list({key for key in keys if key}), fetch_quotes_batch) if any(keys) else {}
+    version = (generation, quote_cache.generation, fx.live_rates()["fetched_at"])
+
+    count = len(assets)
+    currencies = [fx.normalize_currency(asset.currency) for asset in assets]
+    today = [fx.today()] * count
+    amount = np.array([asset.amount or 0.0 for asset in assets], dtype=np.float64)
+    book = np.array([net_worth.asset_value(asset) for asset in assets], dtype=np.float64)
+    price = np.array([
+        (quotes.get(key) or {}).get("price") or np.nan if key else np.nan for key in keys
+    ], dtype=np.float64)
+    units = np.array([GOLD_UNIT_OUNCES if key and key[0] == "gold" else 1.0 for key in keys], dtype=np.float64)
+    usd_quoted = np.array([bool(key) and key[0] in USD_QUOTED for key in keys], dtype=bool)
+
+    table = await fx.rate_table(db, currencies)
+    # USD quotes into the asset's currency: units of it per USD
+    to_native = np.where(usd_quoted, table.rates(currencies, today), 1.0)
+    market = amount * units * price * to_native
+    priced = ~np.isnan(market)
+    market = np.where(priced, market, book)
+    change = market - book
+    to_base = table.factors(currencies, today)
+    converted = ~np.isnan(to_base)
+    market_base = np.where(converted, market * np.nan_to_num(to_base), np.nan)
+    book_base = np.where(converted, book * np.nan_to_num(to_base), np.nan)
+
+    now = datetime.now(timezone.utc)
+    rows = []
+    for i, asset in enumerate(assets):
+        quote = quotes.get(keys[i]) if keys[i] else None
+        rows.append({
+            "id": asset.id,
+            "type": AssetType(asset.type).value,
+            "name": asset.name,
+            "amount": asset.amount,
+            "currency": currencies[i],
+            "date": asset.date,
+            "days_held": (now - utc(asset.date)).days,
+            "symbol": keys[i][1] if keys[i] else None,
+            "price": float(price[i]) if priced[i] else None,
+            "quote_currency": ("USD" if usd_quoted[i] else currencies[i]) if keys[i] else None,
+            "quote_timestamp": quote.get("timestamp") if quote else None,
+            "priced": bool(priced[i]),
+            "book_value": float(book[i]),
+            "market_value": float(market[i]),
+            "change": float(change[i]),
+            "change_percent": float(change[i] / abs(book[i]) * 100) if priced[i] and book[i] else None,
+            "market_value_base": float(market_base[i]) if converted[i] else None,
+        })
+
+    by_type = {}
+    for asset_type in AssetType:
+        selected = np.array([AssetType(asset.type) == asset_type for asset in assets], dtype=bool) & converted
+        by_type[asset_type.value] = {
+            "book_value": float(book_base[selected].sum()),
+            "market_value": float(market_base[selected].sum()),
+        }
+    totals = {
+        "book_value": float(book_base[converted].sum()),
+        "market_value": float(market_base[converted].sum()),
+    }
+    totals["change"] = totals["market_value"] - totals["book_value"]
+    result = {
+        "base_currency": fx.BASE_CURRENCY,
+        "as_of": now,
+        "assets": rows,
+        "totals": totals,
+        "by_type": by_type,
+        "unpriced": [asset.id for asset, key, ok in zip(assets, keys, priced) if key and not ok],
+        "unconverted_currencies": sorted({c for c, ok in zip(currencies, converted) if not ok}),
+    }
+    return result, version
+
+async def valuation(db: AsyncSession) -> Dict[str, Any]:
+    """The cached valuation, recomputed when assets, quotes or FX rates changed or it expired"""
+    global _cached
+    now = time.monotonic()
+    if _cached is not None and _cached[0] == _version(quote_cache.generation) and _cached[1] > now:
+        return {**_cached[2], "cached": True}
+    result, version = await compute(db)
+    _cached = (version, now + ASSET_VALUATION_TTL, result)
+    return {**result, "cached": False}
@@ -0,0 +1,87 @@
+"""
+Wallet balance deltas.
+
+Income and expense move different wallet fields depending on the wallet type:
+credit wallets track debt in `loan`, stock wallets keep `cash` and
+`gross_balance` in step with `balance`, everything else only has `balance`.
+`transaction_effect` and `transfer_effect` spell those rules out once;
+`apply_deltas` writes the net change with one relative `UPDATE ... SET balance
+= balance + delta` per wallet, so concurrent writers never overwrite each
+other's read-modify-write.
+
+Writes that must check a balance first (transfers, stock purchases) take the
+wallet rows with `lock_wallets`, which locks them FOR UPDATE in ascending id
+order; every path locking in the same order is what keeps two opposite
+transfers from deadlocking.
+"""
+from typing import Dict, Iterable
+
+from sqlalchemy import case, func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db_models import TransactionType, WalletDB, WalletType
+
+FIELDS = ("balance", "cash", "loan", "investment_value")
+
+# wallet_id -> {"balance": d, "cash": d, "loan": d, "investment_value": d}
+WalletDeltas = Dict[int, Dict[str, float]]
+
+def transaction_effect(wallet_type: WalletType, transaction_type: TransactionType, amount: float) -> Dict[str, float]:
+    """Field deltas a transaction applies to its wallet"""
+    signed = amount if transaction_type == TransactionType.income else -amount
+    if wallet_type == WalletType.credit:
+        return {"loan": -signed}  # Income pays debt down, expense adds to it
+    if wallet_type == WalletType.stock:
+        return {"balance": signed, "cash": signed}
+    return {"balance": signed}
+
+def transfer_effect(wallet_type: WalletType, signed_amount: float) -> Dict[str, float]:
+    """Field deltas for one side of a transfer (negative amount for the source wallet)"""
+    if wallet_type == WalletType.credit:
+        return {"loan": signed_amount}
+    if wallet_type == WalletType.stock:
+        return {"balance": signed_amount, "cash": signed_amount}
+    return {"balance": signed_amount}
+
+def track(deltas: WalletDeltas, wallet_id: int, effect: Dict[str, float], sign: int = 1):
+    """Accumulate an effect (sign -1 to reverse it) into per-wallet deltas"""
+    wallet = deltas.setdefault(wallet_id, dict.fromkeys(FIELDS, 0.0))
+    for field, value in effect.items():
+        wallet[field] += sign * value
+
+async def lock_wallets(db: AsyncSession, wallet_ids: Iterable[int]) -> Dict[int, WalletDB]:
+    """Load and lock wallets FOR UPDATE, always in ascending id order"""
+    result = await db.execute(
+        select(WalletDB)
+        .where(WalletDB.id.in_(set(wallet_ids)))
+        .order_by(WalletDB.id)
+        .with_for_update()
+        .execution_options(populate_existing=True)
+    )
+    return {wallet.id: wallet for wallet in result.scalars().all()}
+
+async def apply_deltas(db: AsyncSession, deltas: WalletDeltas):
+    """One relative UPDATE per wallet; the caller commits"""
+    for wallet_id, delta in deltas.items():
+        if not any(delta.values()):
+            continue
+        cash = func.coalesce(WalletDB.cash, 0.0) + delta["cash"]
+        investment_value = func.coalesce(WalletDB.investment_value, 0.0) + delta["investment_value"]
+        await db.execute(
+            update(WalletDB)
+            .where(WalletDB.id == wallet_id)
+            .values(
+                balance=WalletDB.balance + delta["balance"],
+                cash=case((WalletDB.type == WalletType.stock, cash), else_=WalletDB.cash),
+                investment_value=case((WalletDB.type == WalletType.stock, investment_value), else_=WalletDB.investment_value),
+                loan=case(
+                    (WalletDB.type == WalletType.credit, func.coalesce(WalletDB.loan, 0.0) + delta["loan"]),
+                    else_=WalletDB.loan
+                ),
+                gross_balance=case(
+                    (WalletDB.type == WalletType.stock, cash + investment_value),
+                    else_=WalletDB.gross_balance
+                )
+            )
+            .execution_options(synchronize_session=False)
+        )
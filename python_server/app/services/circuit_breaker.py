@@ -0,0 +1,107 @@
+"""
+Per-upstream circuit breakers.
+
+After `failure_threshold` consecutive failures (errors, timeouts, 429 and 5xx
+responses) a breaker opens and calls to that upstream fail fast instead of
+waiting out the HTTP timeout. Once the open period has passed, one probe call
+is let through (half-open): success closes the breaker, failure re-opens it
+for twice as long, up to `max_open_seconds`. A 429 with Retry-After keeps the
+breaker open at least that long.
+
+Environment variables:
+    MARKET_BREAKER_FAILURES      consecutive failures before opening (default 3)
+    MARKET_BREAKER_OPEN_SECONDS  first open period (default 10)
+    MARKET_BREAKER_MAX_OPEN      longest open period after repeated failed probes (default 300)
+"""
+import os
+import time
+from typing import Any, Dict, Optional
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+class CircuitBreaker:
+    def __init__(self, name: str, failure_threshold: int = 3, open_seconds: float = 10.0, max_open_seconds: float = 300.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.max_open_seconds = max_open_seconds
+        self.state = CLOSED
+        self.failures = 0
+        self._current_open_seconds = open_seconds
+        self._open_until = 0.0
+        self._probe_in_flight = False
+        self.counters = {"calls": 0, "failures": 0, "rejected": 0, "opened": 0}
+        self.last_error: Optional[str] = None
+
+    def allow(self) -> bool:
+        """Whether a call may go upstream now; half-open admits a single probe"""
+        if self.state == OPEN:
+            if time.monotonic() < self._open_until:
+                self.counters["rejected"] += 1
+                return False
+            self.state = HALF_OPEN
+            self._probe_in_flight = False
+        if self.state == HALF_OPEN:
+            if self._probe_in_flight:
+                self.counters["rejected"] += 1
+                return False
+            self._probe_in_flight = True
+        self.counters["calls"] += 1
+        return True
+
+    def record_success(self):
+        self.state = CLOSED
+        self.failures = 0
+        self._probe_in_flight = False
+        self._current_open_seconds = self.open_seconds
+
+    def release(self):
+        """A call was abandoned (cancelled) before it finished; let another probe through"""
+        self._probe_in_flight = False
+
+    def record_failure(self, error: str, retry_after: Optional[float] = None):
+        self.counters["failures"] += 1
+        self.failures += 1
+        self.last_error = error
+        if self.state == HALF_OPEN:
+            # Failed probe: back off twice as long before the next one
+            self._current_open_seconds = min(self._current_open_seconds * 2, self.max_open_seconds)
+            self._open(retry_after)
+        elif self.failures >= self.failure_threshold or retry_after:
+            self._open(retry_after)
+
+    def _open(self, retry_after: Optional[float]):
+        seconds = max(self._current_open_seconds, retry_after or 0)
+        self.state = OPEN
+        self._open_until = time.monotonic() + seconds
+        self._probe_in_flight = False
+        self.counters["opened"] += 1
+
+    def status(self) -> Dict[str, Any]:
+        retry_in = max(0.0, self._open_until - time.monotonic()) if self.state == OPEN else 0.0
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "retry_in_seconds": round(retry_in, 3),
+            "last_error": self.last_error,
+            **self.counters,
+        }
+
+_breakers: Dict[str, CircuitBreaker] = {}
+
+def get_breaker(name: str) -> CircuitBreaker:
+    breaker = _breakers.get(name)
+    if breaker is None:
+        breaker = CircuitBreaker(
+            name,
+            failure_threshold=int(os.getenv("MARKET_BREAKER_FAILURES", 3)),
+            open_seconds=float(os.getenv("MARKET_BREAKER_OPEN_SECONDS", 10)),
+            max_open_seconds=float(os.getenv("MARKET_BREAKER_MAX_OPEN", 300))
+        )
+        _breakers[name] = breaker
+    return breaker
+
+def breaker_stats() -> Dict[str, Dict[str, Any]]:
+    return {name: breaker.status() for name, breaker in _breakers.items()}
@@ -0,0 +1,133 @@
+"""
+Row encoders for the streaming export.
+
+Each writer turns batches of row tuples into bytes as they arrive, so an
+export never holds more than one batch in memory. Parquet needs the optional
+`pyarrow` package (pip install pyarrow); each batch becomes one row group.
+"""
+import csv
+import enum
+import io
+import json
+from datetime import date, datetime
+from typing import Any, Iterator, List, Sequence
+
+from sqlalchemy import Boolean, Date, DateTime, Enum, Float, Integer, Table
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+MEDIA_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+def _plain(value: Any) -> Any:
+    if isinstance(value, enum.Enum):
+        return value.value
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+class CsvWriter:
+    def __init__(self, table: Table):
+        self.columns = [column.name for column in table.columns]
+
+    def header(self) -> bytes:
+        return self._encode([self.columns])
+
+    def batch(self, rows: Sequence[Sequence[Any]]) -> bytes:
+        return self._encode([[_plain(value) for value in row] for row in rows])
+
+    def _encode(self, rows: List[List[Any]]) -> bytes:
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        return buffer.getvalue().encode()
+
+    def close(self) -> bytes:
+        return b""
+
+class NdjsonWriter:
+    def __init__(self, table: Table):
+        self.columns = [column.name for column in table.columns]
+
+    def header(self) -> bytes:
+        return b""
+
+    def batch(self, rows: Sequence[Sequence[Any]]) -> bytes:
+        lines = [
+            json.dumps({name: _plain(value) for name, value in zip(self.columns, row)}, ensure_ascii=False)
+            for row in rows
+        ]
+        return ("\n".join(lines) + "\n").encode() if lines else b""
+
+    def close(self) -> bytes:
+        return b""
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file that hands back whatever was written since the last drain"""
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+def _arrow_type(column):
+    if isinstance(column.type, Integer):
+        return pyarrow.int64()
+    if isinstance(column.type, Float):
+        return pyarrow.float64()
+    if isinstance(column.type, Boolean):
+        return pyarrow.bool_()
+    if isinstance(column.type, DateTime):
+        return pyarrow.timestamp("us", tz="UTC" if column.type.timezone else None)
+    if isinstance(column.type, Date):
+        return pyarrow.date32()
+    return pyarrow.string()
+
+class ParquetWriter:
+    def __init__(self, table: Table):
+        self.columns = list(table.columns)
+        self.enums = [isinstance(column.type, Enum) for column in self.columns]
+        self.schema = pyarrow.schema([(column.name, _arrow_type(column)) for column in self.columns])
+        self.sink = _ChunkSink()
+        self.writer = pyarrow.parquet.ParquetWriter(self.sink, self.schema, compression="zstd")
+
+    def header(self) -> bytes:
+        return self.sink.drain()
+
+    def batch(self, rows: Sequence[Sequence[Any]]) -> bytes:
+        arrays = []
+        for i, (field, is_enum) in enumerate(zip(self.schema, self.enums)):
+            values = [row[i] for row in rows]
+            if is_enum:
+                values = [_plain(value) for value in values]
+            arrays.append(pyarrow.array(values, type=field.type))
+        self.writer.write_batch(pyarrow.RecordBatch.from_arrays(arrays, schema=self.schema))
+        return self.sink.drain()
+
+    def close(self) -> bytes:
+        self.writer.close()
+        return self.sink.drain()
+
+WRITERS = {"csv": CsvWriter, "ndjson": NdjsonWriter, "parquet": ParquetWriter}
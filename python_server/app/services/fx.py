@@ -0,0 +1,157 @@
+"""
+Exchange rates and conversion to the base currency.
+
+Assets carry their own currency; wallets and every total are in the base
+currency (BASE_CURRENCY, default USD). Rates are kept against USD, as the
+provider returns them, so the base can change without rewriting history:
+    amount in base = amount * rate(base, day) / rate(currency, day)
+
+Two layers:
+  fx_rates   one row per (currency, day): the daily history. The background
+             refresher (market_data.fx_refresher) upserts today's rate of
+             every currency in use; older days are imported with
+                 python maintenance.py import-fx-rates --file rates.json
+  live       the rates of the last refresh, in memory per worker. They stand
+             in for today's row, so conversions at "now" use the freshest rate.
+
+Rates come from the market-data provider: Coinbase over HTTP, or the "fx"
+section of the replay file with MARKET_DATA_PROVIDER=local (offline).
+
+Conversion is done in bulk: `rate_table` loads the history of the currencies
+involved in one query and `RateTable.factors` answers any number of
+(currency, day) pairs with one sorted search. A day takes the latest rate on
+or before it; days before a currency's first rate take that first rate. A
+currency without any rate converts to NaN and callers report it instead of
+guessing.
+
+Environment variables:
+    BASE_CURRENCY        currency of wallets and totals (default USD)
+    FX_CURRENCIES        extra currencies to record besides those of assets, e.g. "EUR,JPY"
+    FX_REFRESH_ENABLED   set to 0 to disable the background refresher (default 1)
+    FX_REFRESH_INTERVAL  seconds between refreshes (default 3600)
+"""
+import os
+from datetime import date, datetime, timezone
+from typing import Any, Dict, Iterable, Optional, Sequence, Set, Tuple
+
+import numpy as np
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db_models import AssetDB, FxRateDB
+from app.services.market_providers import MarketDataProvider
+
+PIVOT = "USD"  # Currency the stored rates are quoted against
+BASE_CURRENCY = os.getenv("BASE_CURRENCY", PIVOT).strip().upper()
+
+# Sort key of a (currency, day) pair: currency index * span + day ordinal
+_DAY_SPAN = 1 << 22  # > date.max.toordinal()
+
+_live: Dict[str, float] = {}
+_live_at: Optional[datetime] = None
+
+def normalize_currency(code: Optional[str]) -> str:
+    return (code or PIVOT).strip().upper()
+
+def today() -> date:
+    return datetime.now(timezone.utc).date()
+
+def live_rates() -> Dict[str, Any]:
+    """Rates of the last refresh in this worker"""
+    return {"rates": dict(_live), "fetched_at": _live_at.isoformat() if _live_at else None}
+
+def set_live_rates(rates: Dict[str, float]):
+    global _live_at
+    _live.update({normalize_currency(code): rate for code, rate in rates.items() if rate and rate > 0})
+    _live_at = datetime.now(timezone.utc)
+
+class RateTable:
+    """Daily rates of a set of currencies, looked up many (currency, day) pairs at a time"""
+
+    def __init__(self, rows: Iterable[Tuple[str, date, float]]):
+        rows = [(normalize_currency(code), day, rate) for code, day, rate in rows]
+        self._index = {code: i for i, code in enumerate(sorted({code for code, _, _ in rows}))}
+        currencies = np.array([self._index[code] for code, _, _ in rows], dtype=np.int64)
+        days = np.array([day.toordinal() for _, day, _ in rows], dtype=np.int64)
+        rates = np.array([rate for _, _, rate in rows], dtype=np.float64)
+        # Stable sort: of two rates for the same day, the later row (the live rate) wins
+        order = np.lexsort((days, currencies))
+        self._currencies = currencies[order]
+        self._keys = self._currencies * _DAY_SPAN + days[order]
+        self._rates = rates[order]
+
+    def rates(self, currencies: Sequence[str], days: Sequence[Any]) -> np.ndarray:
+        """Units per USD of each currency on each day (dates or ordinals); NaN when unknown"""
+        codes, inverse = np.unique(np.asarray(currencies, dtype=str), return_inverse=True)
+        codes = [normalize_currency(code) for code in codes]
+        index = np.array([self._index.get(code, -1) for code in codes], dtype=np.int64)[inverse]
+        pivot = np.array([code == PIVOT for code in codes], dtype=bool)[inverse]
+        if not isinstance(days, np.ndarray):
+            days = [day.toordinal() if isinstance(day, date) else day for day in days]
+        days = np.asarray(days, dtype=np.int64)
+        result = np.full(len(index), np.nan)
+        known = index >= 0
+        if known.any():
+            position = np.searchsorted(self._keys, index * _DAY_SPAN + days, side="right") - 1
+            # Before a currency's first rate the search lands on the previous currency (or -1)
+            first = np.searchsorted(self._currencies, index, side="left")
+            position = np.where(position < first, first, position)
+            result[known] = self._rates[position[known]]
+        result[pivot] = 1.0
+        return result
+
+    def factors(self, currencies: Sequence[str], days: Sequence[Any], base: Optional[str] = None) -> np.ndarray:
+        """Multiplier from each currency to `base` (default BASE_CURRENCY) on each day; NaN when unknown"""
+        base_rates = self.rates([base or BASE_CURRENCY] * len(currencies), days)
+        return base_rates / self.rates(currencies, days)
+
+async def rate_table(db: AsyncSession, currencies: Iterable[str], end: Optional[date] = None) -> RateTable:
+    """Rate history up to `end` (default today) of the given currencies and the base, plus the live rates"""
+    codes = {normalize_currency(code) for code in currencies} | {BASE_CURRENCY}
+    codes.discard(PIVOT)
+    end = end or today()
+    rows = []
+    if codes:
+        result = await db.execute(
+            select(FxRateDB.currency, FxRateDB.day, FxRateDB.rate)
+            .where(FxRateDB.currency.in_(codes), FxRateDB.day <= end)
+        )
+        rows = list(result.all())
+        if end >= today():
+            rows += [(code, today(), rate) for code, rate in _live.items() if code in codes]
+    return RateTable(rows)
+
+async def record(db: AsyncSession, day: date, rates: Dict[str, float]) -> int:
+    """Upsert one day's rates; the caller commits"""
+    rows = [
+        {"currency": normalize_currency(code), "day": day, "rate": rate}
+        for code, rate in rates.items()
+        if rate and rate > 0 and normalize_currency(code) != PIVOT
+    ]
+    if not rows:
+        return 0
+    stmt = insert(FxRateDB).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["currency", "day"],
+        set_={"rate": stmt.excluded.rate, "updated_at": func.now()}
+    )
+    await db.execute(stmt)
+    return len(rows)
+
+async def tracked_currencies(db: AsyncSession) -> Set[str]:
+    """Currencies worth recording: those of assets, the base and FX_CURRENCIES"""
+    result = await db.execute(select(AssetDB.currency).distinct())
+    extra = [code for code in os.getenv("FX_CURRENCIES", "").split(",") if code.strip()]
+    codes = {normalize_currency(code) for code in [*result.scalars().all(), *extra, BASE_CURRENCY]}
+    codes.discard(PIVOT)
+    return codes
+
+async def refresh(db: AsyncSession, provider: MarketDataProvider) -> int:
+    """Fetch current rates into the live layer and today's history row; the caller commits"""
+    rates = await provider.fetch_fx_rates()
+    if not rates:
+        return 0
+    set_live_rates(rates)
+    wanted = await tracked_currencies(db)
+    return await record(db, today(), {code: rate for code, rate in _live.items() if code in wanted})
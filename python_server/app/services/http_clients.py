@@ -0,0 +1,87 @@
+"""
+Shared HTTP clients for the market-data upstreams.
+
+One httpx.AsyncClient per upstream lives for the whole app (created and closed
+by the FastAPI lifespan hook in main.py), so repeated quote fetches reuse
+pooled keep-alive connections instead of paying a TLS handshake per call.
+
+Environment variables:
+    MARKET_HTTP_MAX_CONNECTIONS   pool size per upstream (default 20)
+    MARKET_HTTP_MAX_KEEPALIVE     idle keep-alive connections kept (default 10)
+    MARKET_HTTP_KEEPALIVE_EXPIRY  seconds an idle connection is kept (default 30)
+    MARKET_HTTP_CONNECT_TIMEOUT   connect timeout in seconds (default 5)
+    MARKET_HTTP2                  set to 0 to disable HTTP/2 (default on when h2 is installed)
+    COINGECKO_TIMEOUT / COINBASE_TIMEOUT / YAHOO_TIMEOUT   read timeout per upstream
+"""
+import os
+from typing import Dict
+
+import httpx
+
+try:
+    import h2  # noqa: F401  (enables HTTP/2 support in httpx)
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+YAHOO_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Accept': 'application/json'
+}
+
+# Upstream name -> client settings
+UPSTREAMS = {
+    "coingecko": {"base_url": "https://api.coingecko.com", "timeout": 15.0},
+    "coinbase": {"base_url": "https://api.coinbase.com", "timeout": 10.0},
+    "yahoo": {
+        "base_url": "https://query1.finance.yahoo.com",
+        "timeout": 15.0,
+        "headers": YAHOO_HEADERS,
+        "follow_redirects": True
+    },
+}
+
+_clients: Dict[str, httpx.AsyncClient] = {}
+
+def _build_client(name: str) -> httpx.AsyncClient:
+    """Create the pooled client for an upstream from its settings and env overrides"""
+    settings = UPSTREAMS[name]
+    read_timeout = float(os.getenv(f"{name.upper()}_TIMEOUT", settings["timeout"]))
+    timeout = httpx.Timeout(
+        read_timeout,
+        connect=float(os.getenv("MARKET_HTTP_CONNECT_TIMEOUT", 5.0))
+    )
+    limits = httpx.Limits(
+        max_connections=int(os.getenv("MARKET_HTTP_MAX_CONNECTIONS", 20)),
+        max_keepalive_connections=int(os.getenv("MARKET_HTTP_MAX_KEEPALIVE", 10)),
+        keepalive_expiry=float(os.getenv("MARKET_HTTP_KEEPALIVE_EXPIRY", 30.0))
+    )
+    return httpx.AsyncClient(
+        base_url=settings["base_url"],
+        timeout=timeout,
+        limits=limits,
+        http2=HTTP2_AVAILABLE and os.getenv("MARKET_HTTP2", "1") != "0",
+        headers=settings.get("headers"),
+        follow_redirects=settings.get("follow_redirects", False)
+    )
+
+async def start_clients():
+    """Create one client per upstream (called from the app lifespan)"""
+    for name in UPSTREAMS:
+        if name not in _clients:
+            _clients[name] = _build_client(name)
+
+async def close_clients():
+    """Close all upstream clients and their pooled connections"""
+    clients = list(_clients.values())
+    _clients.clear()
+    for client in clients:
+        await client.aclose()
+
+def get_client(name: str) -> httpx.AsyncClient:
+    """Get the shared client for an upstream, creating it if the lifespan hasn't run (scripts, tests)"""
+    client = _clients.get(name)
+    if client is None or client.is_closed:
+        client = _build_client(name)
+        _clients[name] = client
+    return client
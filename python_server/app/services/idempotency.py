@@ -0,0 +1,74 @@
+"""
+Idempotency keys for write endpoints.
+
+A client that may retry sends an `Idempotency-Key` header. The first request
+with a key inserts the key row in the same database transaction as its
+writes and stores its response there before committing, so either both the
+writes and the stored response exist or neither does. A concurrent duplicate
+blocks on the unique index until the first one finishes and then replays the
+stored response; a failed request rolls back its key, so retrying it runs it
+again. Reusing a key with a different body is rejected.
+
+Keys are kept for IDEMPOTENCY_KEY_TTL_HOURS (default 24); purge older ones
+with
+    python maintenance.py purge-idempotency-keys
+"""
+import hashlib
+import json
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Any, Optional
+
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlalchemy import delete, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db_models import IdempotencyKeyDB
+
+IDEMPOTENCY_KEY_TTL_HOURS = int(os.getenv("IDEMPOTENCY_KEY_TTL_HOURS", "24"))
+MAX_KEY_LENGTH = 255
+
+def request_hash(payload: Any) -> str:
+    return hashlib.sha256(json.dumps(jsonable_encoder(payload), sort_keys=True).encode()).hexdigest()
+
+async def claim(db: AsyncSession, scope: str, key: str, payload: Any) -> Optional[JSONResponse]:
+    """Reserve the key for this request, or return the stored response of an earlier one"""
+    if len(key) > MAX_KEY_LENGTH:
+        raise HTTPException(status_code=400, detail=f"Idempotency-Key longer than {MAX_KEY_LENGTH} characters")
+    digest = request_hash(payload)
+    result = await db.execute(
+        insert(IdempotencyKeyDB)
+        .values(scope=scope, key=key, request_hash=digest)
+        .on_conflict_do_nothing(index_elements=["scope", "key"])
+        .returning(IdempotencyKeyDB.id)
+    )
+    if result.scalar_one_or_none() is not None:
+        return None
+
+    stored = (await db.execute(
+        select(IdempotencyKeyDB).where(IdempotencyKeyDB.scope == scope, IdempotencyKeyDB.key == key)
+    )).scalar_one()
+    if stored.request_hash != digest:
+        raise HTTPException(status_code=422, detail="Idempotency-Key was already used with a different request")
+    return JSONResponse(
+        content=json.loads(stored.response),
+        status_code=stored.status_code,
+        headers={"Idempotent-Replayed": "true"}
+    )
+
+async def store(db: AsyncSession, scope: str, key: str, body: Any, status_code: int = 200):
+    """Save the response with the claimed key; the caller commits"""
+    await db.execute(
+        update(IdempotencyKeyDB)
+        .where(IdempotencyKeyDB.scope == scope, IdempotencyKeyDB.key == key)
+        .values(status_code=status_code, response=json.dumps(jsonable_encoder(body)))
+    )
+
+async def purge(db: AsyncSession, older_than_hours: int = IDEMPOTENCY_KEY_TTL_HOURS) -> int:
+    cutoff = datetime.now(timezone.utc) - timedelta(hours=older_than_hours)
+    result = await db.execute(delete(IdempotencyKeyDB).where(IdempotencyKeyDB.created_at < cutoff))
+    await db.commit()
+    return result.rowcount
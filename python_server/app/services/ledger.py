@@ -0,0 +1,209 @@
+"""
+Double-entry ledger behind wallet balances.
+
+Every write that moves money (transactions, transfers, stock trades, manual
+balance edits) records one entry of immutable postings against wallet fields
+(balance, cash, loan, investment_value). Whatever a field does not net to
+zero within the entry is posted to an external account (wallet_id NULL, named
+by the entry kind: income, expense, transfer, stock_buy, ...), so every entry
+sums to zero per field. Postings are never edited: deleting or changing a
+transaction posts a reversal at the original date.
+
+A wallet's balance at time T is its latest snapshot at or before T plus the
+postings after it, so a historical lookup reads only the postings since the
+last checkpoint. Snapshots are written by
+    python maintenance.py snapshot-ledger
+and any posting dated at or before a snapshot (a backdated transaction, a
+reversal) deletes that snapshot in the same database transaction.
+
+The wallet columns stay as the current-value cache the routers read;
+`record` updates both together. Wallets that existed before the ledger need
+an opening entry once:
+    python maintenance.py ledger-opening-balances
+"""
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import and_, case, delete, func, insert, or_, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db_models import LedgerPostingDB, LedgerSnapshotDB, TransactionType, WalletDB, WalletType
+from app.services import balances, net_worth
+from app.services.timestamps import utc
+
+def transaction_kind(transaction_type: TransactionType) -> str:
+    return "income" if transaction_type == TransactionType.income else "expense"
+
+def entry_rows(
+    kind: str,
+    effective_at: datetime,
+    deltas: balances.WalletDeltas,
+    source_type: Optional[str] = None,
+    source_id: Optional[int] = None
+) -> List[Dict[str, Any]]:
+    """Postings for one entry, balanced per field against the external account"""
+    entry_id = uuid.uuid4().hex
+    rows = []
+    external = dict.fromkeys(balances.FIELDS, 0.0)
+
+    def posting(wallet_id, field, amount):
+        return {
+            "entry_id": entry_id, "kind": kind, "wallet_id": wallet_id, "field": field, "amount": amount,
+            "effective_at": effective_at, "source_type": source_type, "source_id": source_id,
+        }
+
+    for wallet_id, delta in deltas.items():
+        for field in balances.FIELDS:
+            amount = delta.get(field, 0.0)
+            if amount:
+                rows.append(posting(wallet_id, field, amount))
+                external[field] -= amount
+    for field, amount in external.items():
+        if abs(amount) > 1e-9:
+            rows.append(posting(None, field, amount))
+    return rows
+
+async def write(db: AsyncSession, rows: List[Dict[str, Any]]):
+    """Insert postings and drop the snapshots they land before; the caller commits"""
+    if not rows:
+        return
+    await db.execute(insert(LedgerPostingDB.__table__), rows)
+    await net_worth.add_postings(db, rows)
+    earliest: Dict[int, datetime] = {}
+    for row in rows:
+        wallet_id = row["wallet_id"]
+        # A batch may mix naive (UTC) and aware dates
+        effective_at = utc(row["effective_at"])
+        if wallet_id is not None and (wallet_id not in earliest or effective_at < earliest[wallet_id]):
+            earliest[wallet_id] = effective_at
+    if earliest:
+        await db.execute(
+            delete(LedgerSnapshotDB).where(or_(*[
+                and_(LedgerSnapshotDB.wallet_id == wallet_id, LedgerSnapshotDB.as_of >= effective_at)
+                for wallet_id, effective_at in earliest.items()
+            ]))
+        )
+
+async def post(
+    db: AsyncSession,
+    kind: str,
+    effective_at: datetime,
+    deltas: balances.WalletDeltas,
+    source_type: Optional[str] = None,
+    source_id: Optional[int] = None
+):
+    """Record an entry whose wallet columns the caller has already set"""
+    await write(db, entry_rows(kind, effective_at, deltas, source_type, source_id))
+
+async def record(
+    db: AsyncSession,
+    kind: str,
+    effective_at: datetime,
+    deltas: balances.WalletDeltas,
+    source_type: Optional[str] = None,
+    source_id: Optional[int] = None
+):
+    """Apply deltas to the wallet columns and post them to the ledger; the caller commits"""
+    await balances.apply_deltas(db, deltas)
+    await post(db, kind, effective_at, deltas, source_type, source_id)
+
+def field_sums():
+    """One summed column per wallet field, for aggregating postings"""
+    return [
+        func.coalesce(func.sum(case((LedgerPostingDB.field == field, LedgerPostingDB.amount), else_=0.0)), 0.0).label(field)
+        for field in balances.FIELDS
+    ]
+
+async def balance_at(db: AsyncSession, wallet: WalletDB, as_of: datetime) -> Dict[str, Any]:
+    """Wallet fields at a point in time: latest snapshot plus the postings after it"""
+    snapshot = (await db.execute(
+        select(LedgerSnapshotDB)
+        .where(LedgerSnapshotDB.wallet_id == wallet.id, LedgerSnapshotDB.as_of <= as_of)
+        .order_by(LedgerSnapshotDB.as_of.desc())
+        .limit(1)
+    )).scalar_one_or_none()
+
+    filters = [LedgerPostingDB.wallet_id == wallet.id, LedgerPostingDB.effective_at <= as_of]
+    if snapshot is not None:
+        filters.append(LedgerPostingDB.effective_at > snapshot.as_of)
+    *sums, count = (await db.execute(select(*field_sums(), func.count()).where(*filters))).one()
+
+    values = {
+        field: (getattr(snapshot, field) if snapshot is not None else 0.0) + moved
+        for field, moved in zip(balances.FIELDS, sums)
+    }
+    if wallet.type == WalletType.stock:
+        values["gross_balance"] = values["cash"] + values["investment_value"]
+    return {
+        "wallet_id": wallet.id,
+        "as_of": as_of,
+        **values,
+        "snapshot_as_of": snapshot.as_of if snapshot is not None else None,
+        "postings_applied": count,
+    }
+
+SNAPSHOT_SQL = text("""
+    WITH last AS (
+        SELECT DISTINCT ON (wallet_id) wallet_id, as_of, balance, cash, loan, investment_value
+        FROM ledger_snapshots
+        WHERE as_of <= :as_of
+        ORDER BY wallet_id, as_of DESC
+    ),
+    moved AS (
+        SELECT p.wallet_id,
+               sum(CASE WHEN p.field = 'balance' THEN p.amount ELSE 0 END) AS balance,
+               sum(CASE WHEN p.field = 'cash' THEN p.amount ELSE 0 END) AS cash,
+               sum(CASE WHEN p.field = 'loan' THEN p.amount ELSE 0 END) AS loan,
+               sum(CASE WHEN p.field = 'investment_value' THEN p.amount ELSE 0 END) AS investment_value
+        FROM ledger_postings p
+        LEFT JOIN last l ON l.wallet_id = p.wallet_id
+        WHERE p.wallet_id IS NOT NULL AND p.effective_at <= :as_of
+          AND (l.as_of IS NULL OR p.effective_at > l.as_of)
+        GROUP BY p.wallet_id
+    )
+    INSERT INTO ledger_snapshots (wallet_id, as_of, balance, cash, loan, investment_value)
+    SELECT w.id, :as_of,
+           coalesce(l.balance, 0) + m.balance, coalesce(l.cash, 0) + m.cash,
+           coalesce(l.loan, 0) + m.loan, coalesce(l.investment_value, 0) + m.investment_value
+    FROM wallets w
+    JOIN moved m ON m.wallet_id = w.id
+    LEFT JOIN last l ON l.wallet_id = w.id
+    ON CONFLICT (wallet_id, as_of) DO NOTHING
+""")
+
+async def snapshot(db: AsyncSession, as_of: Optional[datetime] = None) -> int:
+    """Checkpoint every wallet with postings since its last snapshot (one transaction)"""
+    # Writers wait for the few milliseconds this takes, so no posting can
+    # commit underneath a snapshot it should have invalidated
+    await db.execute(text("LOCK TABLE ledger_postings IN SHARE MODE"))
+    result = await db.execute(SNAPSHOT_SQL, {"as_of": as_of or datetime.now(timezone.utc)})
+    await db.commit()
+    return result.rowcount
+
+async def post_opening_balances(db: AsyncSession) -> int:
+    """Post the difference between each wallet's columns and its ledger as an opening entry"""
+    await db.execute(text("LOCK TABLE ledger_postings IN SHARE MODE"))
+    result = await db.execute(
+        select(LedgerPostingDB.wallet_id, *field_sums(), func.min(LedgerPostingDB.effective_at))
+        .where(LedgerPostingDB.wallet_id.isnot(None))
+        .group_by(LedgerPostingDB.wallet_id)
+    )
+    ledger = {row[0]: row[1:] for row in result.all()}
+    wallets = (await db.execute(select(WalletDB))).scalars().all()
+
+    rows = []
+    for wallet in wallets:
+        *sums, first_posting = ledger.get(wallet.id, [0.0] * len(balances.FIELDS) + [None])
+        delta = {
+            field: (getattr(wallet, field) or 0.0) - posted
+            for field, posted in zip(balances.FIELDS, sums)
+        }
+        if not any(abs(value) > 1e-9 for value in delta.values()):
+            continue
+        # Dated before everything else the wallet has, so it holds at every point in its history
+        opened = wallet.created_at if first_posting is None else min(wallet.created_at, first_posting)
+        rows.extend(entry_rows("opening", opened, {wallet.id: delta}, "wallet", wallet.id))
+    await write(db, rows)
+    await db.commit()
+    return len({row["wallet_id"] for row in rows if row["wallet_id"] is not None})
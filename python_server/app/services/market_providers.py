@@ -0,0 +1,484 @@
+"""
+Market data providers.
+
+The market-data router asks the active provider for quotes instead of calling
+the upstream APIs directly. `HttpMarketDataProvider` talks to CoinGecko,
+Coinbase and Yahoo Finance; `LocalReplayProvider` serves recorded or synthetic
+quotes from disk with configurable latency and error injection, so the service,
+CI and the benchmarks run without network access and deterministically. Both
+also supply the FX rates used to convert asset currencies (see services/fx.py).
+
+Environment variables:
+    MARKET_DATA_PROVIDER          "http" (default) or "local"
+    MARKET_DATA_LOCAL_PATH        JSON file of recorded quotes for the local provider
+    MARKET_DATA_LOCAL_LATENCY_MS  simulated upstream latency per request (default 0)
+    MARKET_DATA_LOCAL_JITTER_MS   random extra latency, 0..N ms (default 0)
+    MARKET_DATA_LOCAL_ERROR_RATE  fraction of requests that fail, 0..1 (default 0)
+    MARKET_DATA_LOCAL_SEED        seed for latency/error/synthetic prices (default 42)
+    MARKET_GOLD_HEDGE_DELAY       seconds before gold also asks Yahoo GC=F (default 1)
+"""
+import asyncio
+import json
+import os
+import random
+import urllib.parse
+import zlib
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+from app.services.circuit_breaker import breaker_stats, get_breaker
+from app.services.http_clients import get_client
+
+# Map symbols to CoinGecko IDs
+COIN_MAP = {
+    'BTC': 'bitcoin',
+    'ETH': 'ethereum',
+    'BNB': 'binancecoin',
+    'SOL': 'solana',
+    'ADA': 'cardano',
+    'XRP': 'ripple',
+    'DOGE': 'dogecoin'
+}
+
+# Map common symbols to Yahoo Finance format
+YAHOO_SYMBOL_MAP = {
+    'GSPC': '^GSPC',  # S&P 500
+    'DJI': '^DJI',    # Dow Jones
+    'IXIC': '^IXIC',  # NASDAQ
+    'DX-Y.NYB': 'DX-Y.NYB',  # Dollar Index
+}
+
+GOLD_HEDGE_DELAY = float(os.getenv("MARKET_GOLD_HEDGE_DELAY", 1.0))
+
+# Yahoo's spark endpoint accepts at most 20 symbols per request
+YAHOO_BATCH_SIZE = 20
+
+def _parse_spark_result(item: Dict[str, Any]) -> Optional[Tuple[float, float]]:
+    """(price, previous close) from one Yahoo spark result"""
+    responses = item.get("response") or [{}]
+    meta = responses[0].get("meta", {})
+    closes = [c for c in (responses[0].get("indicators", {}).get("quote") or [{}])[0].get("close") or [] if c]
+    price = meta.get("regularMarketPrice") or (closes[-1] if closes else None)
+    previous_close = meta.get("previousClose") or meta.get("chartPreviousClose") or price
+    if not price or price <= 0:
+        return None
+    return float(price), float(previous_close)
+
+
+class MarketDataProvider:
+    """Source of quotes; every fetch returns None (or omits a symbol) when unavailable"""
+    name = "base"
+
+    async def fetch_crypto_price(self, symbol: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    async def fetch_gold_price(self) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    async def fetch_stock_price(self, symbol: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    async def fetch_crypto_prices(self, symbols: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Batch fetch; defaults to one request per symbol"""
+        results = await asyncio.gather(*(self.fetch_crypto_price(s) for s in symbols))
+        return {s.upper(): r for s, r in zip(symbols, results) if r}
+
+    async def fetch_stock_prices(self, symbols: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Batch fetch; defaults to one request per symbol"""
+        results = await asyncio.gather(*(self.fetch_stock_price(s) for s in symbols))
+        return {s.upper(): r for s, r in zip(symbols, results) if r}
+
+    async def fetch_fx_rates(self) -> Dict[str, float]:
+        """Units of each currency per 1 USD; empty when unavailable"""
+        return {}
+
+    def stats(self) -> Dict[str, Any]:
+        return {"provider": self.name}
+
+def _retry_after(response: httpx.Response) -> Optional[float]:
+    """Seconds from a Retry-After header (delta-seconds form only)"""
+    try:
+        return float(response.headers["Retry-After"])
+    except (KeyError, ValueError):
+        return None
+
+class HttpMarketDataProvider(MarketDataProvider):
+    """Live quotes from CoinGecko, Coinbase and Yahoo Finance"""
+    name = "http"
+
+    async def _get(self, upstream: str, path: str, **kwargs) -> Optional[httpx.Response]:
+        """GET through the upstream's circuit breaker; None when the breaker is open or the call failed"""
+        breaker = get_breaker(upstream)
+        if not breaker.allow():
+            return None
+        try:
+            response = await get_client(upstream).get(path, **kwargs)
+        except asyncio.CancelledError:
+            breaker.release()
+            raise
+        except Exception as e:
+            breaker.record_failure(f"{type(e).__name__}: {e}")
+            print(f"Error calling {upstream}: {type(e).__name__}: {e}")
+            return None
+        if response.status_code == 429 or response.status_code >= 500:
+            breaker.record_failure(f"HTTP {response.status_code}", _retry_after(response))
+        else:
+            breaker.record_success()
+        return response
+
+    def stats(self) -> Dict[str, Any]:
+        return {"provider": self.name, "breakers": breaker_stats()}
+
+    async def fetch_crypto_price(self, symbol: str) -> Optional[Dict[str, Any]]:
+        """Fetch cryptocurrency price from CoinGecko"""
+        try:
+            coin_id = COIN_MAP.get(symbol.upper(), symbol.lower())
+            params = {"ids": coin_id, "vs_currencies": "usd", "include_24hr_change": "true"}
+        
+            response = await self._get("coingecko", "/api/v3/simple/price", params=params)
+            if response is not None and response.status_code == 200:
+                data = response.json()
+                if coin_id in data:
+                    return {
+                        "symbol": symbol.upper(),
+                        "price": data[coin_id]["usd"],
+                        "change_24h": data[coin_id].get("usd_24h_change", 0),
+                        "timestamp": datetime.now().isoformat()
+                    }
+            return None
+        except Exception as e:
+            print(f"Error fetching crypto price for {symbol}: {e}")
+            return None
+
+    async def _gold_from_coinbase(self) -> Optional[Dict[str, Any]]:
+        """Gold price from Coinbase API (XAU/USD)"""
+        # Gold price in 2025 is around $4000-4500/oz
+        try:
+            # Get USD exchange rates to find XAU rate
+            response = await self._get("coinbase", "/v2/exchange-rates", params={"currency": "USD"})
+            if response is not None and response.status_code == 200:
+                data = response.json()
+                if "data" in data and "rates" in data["data"]:
+                    rates = data["data"]["rates"]
+                    if "XAU" in rates:
+                        # Coinbase returns how many XAU per 1 USD
+                        xau_per_usd = float(rates["XAU"])
+                        # Invert to get USD per XAU (troy ounce)
+                        price_per_ounce = 1.0 / xau_per_usd if xau_per_usd > 0 else 0
+                    
+                        # Gold price in 2025 is around $4000-4500/oz, accept this range
+                        if 1000 < price_per_ounce < 10000:
+                            return {
+                                "symbol": "GOLD",
+                                "price": round(price_per_ounce, 2),
+                                "change_24h": 0,  # Coinbase doesn't provide 24h change
+                                "timestamp": datetime.now().isoformat()
+                            }
+        except Exception as e:
+            print(f"Error fetching gold from Coinbase: {e}")
+        return None
+
+    async def fetch_fx_rates(self) -> Dict[str, float]:
+        """Exchange rates against USD from Coinbase"""
+        try:
+            response = await self._get("coinbase", "/v2/exchange-rates", params={"currency": "USD"})
+            if response is not None and response.status_code == 200:
+                rates = (response.json().get("data") or {}).get("rates") or {}
+                return {code.upper(): float(rate) for code, rate in rates.items() if float(rate) > 0}
+        except Exception as e:
+            print(f"Error fetching FX rates from Coinbase: {e}")
+        return {}
+
+    async def _gold_from_yahoo(self) -> Optional[Dict[str, Any]]:
+        """Gold price from Yahoo Finance GC=F (Gold Futures)"""
+        try:
+            gold_data = await self.fetch_stock_price("GC=F")
+            if gold_data and gold_data.get("price", 0) > 0:
+                price = gold_data["price"]
+                # GC=F futures price is per troy ounce
+                # Accept prices in the $1000-$10000 range (2025 gold prices are higher)
+                if 1000 < price < 10000:
+                    return {
+                        "symbol": "GOLD",
+                        "price": round(price, 2),
+                        "change_24h": gold_data.get("change_24h", 0),
+                        "timestamp": datetime.now().isoformat()
+                    }
+        except Exception as e:
+            print(f"Error fetching gold from GC=F: {e}")
+        return None
+
+    async def fetch_gold_price(self) -> Optional[Dict[str, Any]]:
+        """Fetch gold price from Coinbase, hedged with Yahoo GC=F when Coinbase is slow or failing"""
+        primary = asyncio.ensure_future(self._gold_from_coinbase())
+        hedge = None
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=GOLD_HEDGE_DELAY)
+            if done and primary.result():
+                return primary.result()
+            # Coinbase failed (or its breaker is open) or is still waiting:
+            # race Yahoo against it, first usable answer wins
+            hedge = asyncio.ensure_future(self._gold_from_yahoo())
+            pending = {hedge} if done else {primary, hedge}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.result():
+                        return task.result()
+            return None
+        finally:
+            for task in (primary, hedge):
+                if task is not None and not task.done():
+                    task.cancel()
+
+    async def fetch_stock_price(self, symbol: str) -> Optional[Dict[str, Any]]:
+        """Fetch stock price using Yahoo Finance API"""
+        try:
+            # Use mapped symbol or original
+            yahoo_symbol = YAHOO_SYMBOL_MAP.get(symbol.upper(), symbol)
+        
+            # URL encode the symbol
+            encoded_symbol = urllib.parse.quote(yahoo_symbol)
+        
+            # Shared client already carries the browser User-Agent Yahoo expects
+            response = await self._get("yahoo", f"/v8/finance/chart/{encoded_symbol}")
+            if response is not None and response.status_code == 200:
+                data = response.json()
+                if "chart" in data and "result" in data["chart"] and len(data["chart"]["result"]) > 0:
+                    result = data["chart"]["result"][0]
+                    meta = result.get("meta", {})
+                    regular_price = meta.get("regularMarketPrice") or meta.get("previousClose")
+                    previous_close = meta.get("previousClose", regular_price)
+                
+                    if regular_price and regular_price > 0:
+                        change = regular_price - previous_close
+                        change_percent = (change / previous_close * 100) if previous_close > 0 else 0
+                    
+                        return {
+                            "symbol": symbol.upper().replace("^", ""),
+                            "price": float(regular_price),
+                            "change_24h": float(change_percent),
+                            "timestamp": datetime.now().isoformat()
+                        }
+            return None
+        except Exception as e:
+            print(f"Error fetching stock price for {symbol}: {e}")
+            return None
+
+    async def fetch_crypto_prices(self, symbols: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Fetch many cryptocurrency prices from CoinGecko in one request"""
+        ids = {COIN_MAP.get(symbol.upper(), symbol.lower()): symbol.upper() for symbol in symbols}
+        params = {"ids": ",".join(ids), "vs_currencies": "usd", "include_24hr_change": "true"}
+        quotes = {}
+        try:
+            response = await self._get("coingecko", "/api/v3/simple/price", params=params)
+            if response is not None and response.status_code == 200:
+                data = response.json()
+                now = datetime.now().isoformat()
+                for coin_id, symbol in ids.items():
+                    if coin_id in data and "usd" in data[coin_id]:
+                        quotes[symbol] = {
+                            "symbol": symbol,
+                            "price": data[coin_id]["usd"],
+                            "change_24h": data[coin_id].get("usd_24h_change", 0),
+                            "timestamp": now
+                        }
+        except Exception as e:
+            print(f"Error fetching crypto prices for {symbols}: {e}")
+        return quotes
+
+    async def _fetch_stock_chunk(self, symbols: List[str]) -> Dict[str, Dict[str, Any]]:
+        yahoo_symbols = {YAHOO_SYMBOL_MAP.get(symbol.upper(), symbol): symbol.upper() for symbol in symbols}
+        params = {"symbols": ",".join(yahoo_symbols), "range": "1d", "interval": "1d"}
+        quotes = {}
+        try:
+            response = await self._get("yahoo", "/v7/finance/spark", params=params)
+            if response is not None and response.status_code == 200:
+                results = (response.json().get("spark") or {}).get("result") or []
+                now = datetime.now().isoformat()
+                for item in results:
+                    symbol = yahoo_symbols.get(item.get("symbol"))
+                    parsed = _parse_spark_result(item) if symbol else None
+                    if parsed is None:
+                        continue
+                    price, previous_close = parsed
+                    change_percent = ((price - previous_close) / previous_close * 100) if previous_close > 0 else 0
+                    quotes[symbol] = {
+                        "symbol": symbol.replace("^", ""),
+                        "price": price,
+                        "change_24h": float(change_percent),
+                        "timestamp": now
+                    }
+        except Exception as e:
+            print(f"Error fetching stock prices for {symbols}: {e}")
+        return quotes
+
+    async def fetch_stock_prices(self, symbols: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Fetch many stock/index prices from Yahoo Finance, one request per 20 symbols"""
+        chunks = [symbols[i:i + YAHOO_BATCH_SIZE] for i in range(0, len(symbols), YAHOO_BATCH_SIZE)]
+        quotes = {}
+        for chunk_quotes in await asyncio.gather(*[self._fetch_stock_chunk(chunk) for chunk in chunks]):
+            quotes.update(chunk_quotes)
+        return quotes
+
+
+class LocalReplayProvider(MarketDataProvider):
+    """
+    Offline quotes from a JSON file shaped like
+        {"crypto": {"BTC": [{"price": 65000, "change_24h": 1.2}, ...]}, "gold": {"XAU": [...]}, "stock": {...},
+         "fx": {"VND": [{"price": 25400}, ...]}}
+    Each request for a symbol returns its next recorded quote, cycling when the
+    list runs out. Symbols missing from the file get a deterministic synthetic
+    random walk, so any watchlist works without a recording; FX rates (units
+    per USD) are only served for the currencies recorded.
+    """
+    name = "local"
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        latency_ms: float = 0,
+        jitter_ms: float = 0,
+        error_rate: float = 0,
+        seed: int = 42
+    ):
+        self.path = path
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.seed = seed
+        self._random = random.Random(seed)
+        self._recorded: Dict[Tuple[str, str], List[Dict[str, Any]]] = {}
+        self._positions: Dict[Tuple[str, str], int] = {}
+        self._synthetic: Dict[Tuple[str, str], Tuple[float, float]] = {}
+        self.requests = 0
+        self.errors = 0
+        if path:
+            self.load(path)
+
+    def load(self, path: str):
+        with open(path) as f:
+            data = json.load(f)
+        self._recorded = {
+            (source.lower(), symbol.upper()): quotes
+            for source, symbols in data.items()
+            for symbol, quotes in symbols.items()
+            if quotes
+        }
+        self._positions.clear()
+
+    async def _request(self) -> bool:
+        """Simulate one upstream round trip; False when an error is injected"""
+        self.requests += 1
+        delay = self.latency_ms + (self._random.uniform(0, self.jitter_ms) if self.jitter_ms else 0)
+        if delay > 0:
+            await asyncio.sleep(delay / 1000)
+        if self.error_rate and self._random.random() < self.error_rate:
+            self.errors += 1
+            return False
+        return True
+
+    def _synthetic_quote(self, key: Tuple[str, str]) -> Dict[str, Any]:
+        if key not in self._synthetic:
+            # Stable per-symbol starting price, independent of request order
+            rng = random.Random(zlib.crc32(f"{key[0]}:{key[1]}".encode()) ^ self.seed)
+            base = {"crypto": 1000.0, "gold": 2000.0}.get(key[0], 100.0) * rng.uniform(0.5, 1.5)
+            self._synthetic[key] = (base, base)
+        open_price, price = self._synthetic[key]
+        price = max(price * (1 + self._random.gauss(0, 0.001)), 0.01)
+        self._synthetic[key] = (open_price, price)
+        return {"price": round(price, 4), "change_24h": (price - open_price) / open_price * 100}
+
+    def _next_quote(self, source: str, symbol: str) -> Dict[str, Any]:
+        key = (source, symbol.upper())
+        recorded = self._recorded.get(key)
+        if not recorded:
+            quote = self._synthetic_quote(key)
+        else:
+            position = self._positions.get(key, 0)
+            self._positions[key] = position + 1
+            quote = recorded[position % len(recorded)]
+        return {
+            "symbol": symbol.upper(),
+            "price": quote["price"],
+            "change_24h": quote.get("change_24h", 0),
+            "timestamp": datetime.now().isoformat()
+        }
+
+    async def fetch_crypto_price(self, symbol: str) -> Optional[Dict[str, Any]]:
+        if not await self._request():
+            return None
+        return self._next_quote("crypto", symbol)
+
+    async def fetch_gold_price(self) -> Optional[Dict[str, Any]]:
+        if not await self._request():
+            return None
+        quote = self._next_quote("gold", "XAU")
+        quote["unit"] = "USD per ounce"
+        return quote
+
+    async def fetch_stock_price(self, symbol: str) -> Optional[Dict[str, Any]]:
+        if not await self._request():
+            return None
+        return self._next_quote("stock", symbol)
+
+    async def fetch_fx_rates(self) -> Dict[str, float]:
+        codes = [symbol for source, symbol in self._recorded if source == "fx"]
+        if not codes or not await self._request():
+            return {}
+        return {code: float(self._next_quote("fx", code)["price"]) for code in codes}
+
+    async def fetch_crypto_prices(self, symbols: List[str]) -> Dict[str, Dict[str, Any]]:
+        # One simulated request per batch, like the CoinGecko ids= call
+        if not symbols or not await self._request():
+            return {}
+        return {s.upper(): self._next_quote("crypto", s) for s in symbols}
+
+    async def fetch_stock_prices(self, symbols: List[str]) -> Dict[str, Dict[str, Any]]:
+        # One simulated request per YAHOO_BATCH_SIZE symbols, like the spark endpoint
+        results: Dict[str, Dict[str, Any]] = {}
+        for i in range(0, len(symbols), YAHOO_BATCH_SIZE):
+            chunk = symbols[i:i + YAHOO_BATCH_SIZE]
+            if await self._request():
+                results.update({s.upper(): self._next_quote("stock", s) for s in chunk})
+        return results
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "provider": self.name,
+            "requests": self.requests,
+            "errors": self.errors,
+            "recorded_symbols": len(self._recorded),
+            "latency_ms": self.latency_ms,
+            "jitter_ms": self.jitter_ms,
+            "error_rate": self.error_rate,
+        }
+
+def _provider_from_env() -> MarketDataProvider:
+    kind = os.getenv("MARKET_DATA_PROVIDER", "http").lower()
+    if kind == "local":
+        return LocalReplayProvider(
+            path=os.getenv("MARKET_DATA_LOCAL_PATH") or None,
+            latency_ms=float(os.getenv("MARKET_DATA_LOCAL_LATENCY_MS", 0)),
+            jitter_ms=float(os.getenv("MARKET_DATA_LOCAL_JITTER_MS", 0)),
+            error_rate=float(os.getenv("MARKET_DATA_LOCAL_ERROR_RATE", 0)),
+            seed=int(os.getenv("MARKET_DATA_LOCAL_SEED", 42))
+        )
+    if kind != "http":
+        raise ValueError(f"Unknown MARKET_DATA_PROVIDER: {kind}")
+    return HttpMarketDataProvider()
+
+_provider: Optional[MarketDataProvider] = None
+
+def get_provider() -> MarketDataProvider:
+    global _provider
+    if _provider is None:
+        _provider = _provider_from_env()
+    return _provider
+
+def set_provider(provider: MarketDataProvider):
+    """Swap the active provider (benchmarks, tests)"""
+    global _provider
+    _provider = provider
@@ -0,0 +1,94 @@
+"""
+Quotes for the rest of the app, through the shared quote cache.
+
+Routers and services that need prices (stock lots, wallet returns, assets)
+come here rather than to the market-data router: cache misses from any of
+them go upstream as one batched request per provider (`fetch_quotes_batch`),
+stock codes are mapped to the symbols their quotes are cached under, and
+assets to the quote they are valued at.
+"""
+import asyncio
+import os
+import re
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db_models import AssetDB, AssetType
+from app.services.market_providers import COIN_MAP, get_provider
+from app.services.quote_cache import quote_cache
+
+async def fetch_quotes_batch(keys: List[Tuple[str, str]]) -> Dict[Tuple[str, str], Dict[str, Any]]:
+    """Group cache keys by provider and issue one batched upstream request per provider"""
+    by_source: Dict[str, List[str]] = {}
+    for source, symbol in keys:
+        by_source.setdefault(source, []).append(symbol)
+    provider = get_provider()
+    
+    async def crypto():
+        return "crypto", await provider.fetch_crypto_prices(by_source["crypto"])
+    
+    async def stocks():
+        return "stock", await provider.fetch_stock_prices(by_source["stock"])
+    
+    async def gold():
+        quote = await provider.fetch_gold_price()
+        return "gold", {"GOLD": quote} if quote else {}
+    
+    jobs = []
+    if "crypto" in by_source:
+        jobs.append(crypto())
+    if "stock" in by_source:
+        jobs.append(stocks())
+    if "gold" in by_source:
+        jobs.append(gold())
+    
+    quotes = {}
+    for source, source_quotes in await asyncio.gather(*jobs):
+        for symbol, quote in source_quotes.items():
+            quotes[(source, symbol)] = quote
+    return quotes
+
+def stock_symbol(code: str) -> str:
+    """A stock code in Yahoo format, the symbol its quotes are cached under"""
+    suffix = os.getenv("MARKET_STOCK_SUFFIX", "")  # e.g. ".VN" for HOSE tickers
+    return f"{code.upper()}{suffix}"
+
+async def stock_quotes(codes: Iterable[str]) -> Dict[str, Optional[Dict[str, Any]]]:
+    """Cached quotes by stock code; misses go upstream as one batched request"""
+    keys = {code: ("stock", stock_symbol(code)) for code in set(codes)}
+    quotes = await quote_cache.get_many(list(set(keys.values())), fetch_quotes_batch)
+    return {code: quotes.get(key) for code, key in keys.items()}
+
+# Asset types marked to market, and the quote source of each
+QUOTED_ASSET_TYPES = {AssetType.gold: "gold", AssetType.crypto: "crypto", AssetType.stock: "stock"}
+COIN_NAMES = {coin_id: symbol for symbol, coin_id in COIN_MAP.items()}
+
+def asset_quote_key(asset_type: AssetType, name: str) -> Optional[Tuple[str, str]]:
+    """Cache key of the quote an asset is valued at, from its type and name ("Bitcoin", "ETH", "VNM shares")"""
+    source = QUOTED_ASSET_TYPES.get(asset_type)
+    if source == "gold":
+        return "gold", "GOLD"
+    words = re.findall(r"[A-Za-z0-9.\-]+", name or "")
+    if source == "crypto":
+        for word in words:
+            if word.upper() in COIN_MAP:
+                return "crypto", word.upper()
+            if word.lower() in COIN_NAMES:
+                return "crypto", COIN_NAMES[word.lower()]
+    if source == "stock":
+        # A ticker is the upper-case word of the name, or the whole name when it is one word
+        tickers = [word for word in words if word.isupper()] or (words if len(words) == 1 else [])
+        if tickers:
+            ticker = tickers[0]
+            return "stock", ticker.upper() if "." in ticker else stock_symbol(ticker)
+    return None
+
+async def asset_quote_keys(db: AsyncSession) -> List[Tuple[str, str]]:
+    """Quote keys of the assets valued at market prices"""
+    result = await db.execute(
+        select(AssetDB.type, AssetDB.name).where(AssetDB.type.in_(list(QUOTED_ASSET_TYPES))).distinct()
+    )
+    keys = (asset_quote_key(AssetType(type_), name) for type_, name in result.all())
+    return [key for key in keys if key]
@@ -0,0 +1,212 @@
+"""
+Daily net-worth timeline.
+
+`net_worth_daily` holds, per day and category (a wallet type or an asset
+type), the net change of value on that day. The value of a day is the running
+sum up to it, so a change dated any day only touches that day's row and every
+later day moves with it when the series is read; nothing is replayed. Rows
+are kept in step in the writer's database transaction with an atomic
+`amount = amount + delta` upsert:
+
+  wallets  every ledger posting (see ledger.write), valued like the wallet
+           totals: balance, cash + investment_value on stock wallets, minus
+           the loan on credit wallets. Wallets marked not_mine are left out;
+           marking or unmarking one moves its whole history out or in.
+  assets   an asset's value from its date, negative for loans, moved when
+           the asset is created, edited or deleted. Kept per currency, in
+           that currency; wallets are in the base currency.
+
+`series` answers a range with two grouped queries (the totals before it and
+the daily changes in it) and a cumulative sum per category and currency, then
+converts every (currency, day) cell to the base currency at that day's rate in
+one vectorized lookup (see services/fx.py). Rebuild the table from the ledger
+and the assets with
+    python maintenance.py rebuild-net-worth
+"""
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import func, select, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db_models import AssetDB, AssetType, LedgerPostingDB, NetWorthDailyDB, WalletDB, WalletType
+from app.services import fx
+from app.services.timestamps import utc
+
+WALLET = "wallet"
+ASSET = "asset"
+
+NetWorthKey = Tuple[date, str, str, str]  # (day, source, category, currency)
+NetWorthDeltas = Dict[NetWorthKey, float]
+
+def day_of(value: datetime) -> date:
+    """Day (UTC) a change is filed under"""
+    return utc(value).date()
+
+def wallet_weight(wallet_type: WalletType, field: str) -> float:
+    """How much a posting to `field` moves the wallet's value"""
+    if wallet_type == WalletType.stock:
+        return 1.0 if field in ("cash", "investment_value") else 0.0
+    if wallet_type == WalletType.credit:
+        return -1.0 if field == "loan" else 0.0
+    return 1.0 if field == "balance" else 0.0
+
+def asset_value(asset: AssetDB) -> float:
+    return -asset.value if AssetType(asset.type) == AssetType.loan else asset.value
+
+def track(deltas: NetWorthDeltas, day: date, source: str, category: str, amount: float, currency: str = ""):
+    key = (day, source, category, currency)
+    deltas[key] = deltas.get(key, 0.0) + amount
+
+def track_asset(deltas: NetWorthDeltas, asset: AssetDB, sign: int = 1):
+    """Add (or with sign=-1 remove) an asset's value from its date on"""
+    track(
+        deltas, day_of(asset.date), ASSET, AssetType(asset.type).name,
+        sign * asset_value(asset), fx.normalize_currency(asset.currency)
+    )
+
+async def apply(db: AsyncSession, deltas: NetWorthDeltas):
+    """Upsert pending deltas in one statement; the caller commits"""
+    rows = [
+        {"day": day, "source": source, "category": category, "currency": currency, "amount": amount}
+        for (day, source, category, currency), amount in deltas.items()
+        if abs(amount) > 1e-9
+    ]
+    if not rows:
+        return
+    stmt = insert(NetWorthDailyDB).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["day", "source", "category", "currency"],
+        set_={"amount": NetWorthDailyDB.amount + stmt.excluded.amount}
+    )
+    await db.execute(stmt)
+
+async def add_postings(db: AsyncSession, rows: List[Dict[str, Any]]):
+    """File ledger postings (as passed to ledger.write) under their wallets' types"""
+    wallet_ids = {row["wallet_id"] for row in rows if row["wallet_id"] is not None}
+    if not wallet_ids:
+        return
+    result = await db.execute(
+        select(WalletDB.id, WalletDB.type, WalletDB.not_mine).where(WalletDB.id.in_(wallet_ids))
+    )
+    mine = {wallet_id: WalletType(type_) for wallet_id, type_, not_mine in result.all() if not not_mine}
+    deltas: NetWorthDeltas = {}
+    for row in rows:
+        wallet_type = mine.get(row["wallet_id"])
+        if wallet_type is not None:
+            weight = wallet_weight(wallet_type, row["field"])
+            if weight:
+                track(deltas, day_of(row["effective_at"]), WALLET, wallet_type.name, weight * row["amount"])
+    await apply(db, deltas)
+
+async def move_wallet(db: AsyncSession, wallet: WalletDB, sign: int):
+    """Add (sign 1) or remove (sign -1) a wallet's whole posting history, e.g. when it is marked not_mine"""
+    result = await db.execute(
+        select(LedgerPostingDB.effective_at, LedgerPostingDB.field, LedgerPostingDB.amount)
+        .where(LedgerPostingDB.wallet_id == wallet.id)
+    )
+    wallet_type = WalletType(wallet.type)
+    deltas: NetWorthDeltas = {}
+    for effective_at, field, amount in result.all():
+        weight = wallet_weight(wallet_type, field)
+        if weight:
+            track(deltas, day_of(effective_at), WALLET, wallet_type.name, sign * weight * amount)
+    await apply(db, deltas)
+
+REBUILD_SQL = text("""
+    INSERT INTO net_worth_daily (day, source, category, currency, amount)
+    SELECT day, source, category, currency, sum(amount)
+    FROM (
+        SELECT (p.effective_at AT TIME ZONE 'UTC')::date AS day, 'wallet' AS source, w.type::text AS category,
+               '' AS currency,
+               p.amount * CASE
+                   WHEN w.type = 'stock' THEN CASE WHEN p.field IN ('cash', 'investment_value') THEN 1 ELSE 0 END
+                   WHEN w.type = 'credit' THEN CASE WHEN p.field = 'loan' THEN -1 ELSE 0 END
+                   ELSE CASE WHEN p.field = 'balance' THEN 1 ELSE 0 END
+               END AS amount
+        FROM ledger_postings p
+        JOIN wallets w ON w.id = p.wallet_id
+        WHERE NOT w.not_mine
+        UNION ALL
+        SELECT (date AT TIME ZONE 'UTC')::date, 'asset', type::text, upper(trim(coalesce(currency, 'USD'))),
+               CASE WHEN type = 'loan' THEN -value ELSE value END
+        FROM assets
+    ) changes
+    GROUP BY day, source, category, currency
+    HAVING abs(sum(amount)) > 1e-9
+""")
+
+async def rebuild(db: AsyncSession) -> int:
+    """Recompute the timeline from the ledger and the assets (one transaction)"""
+    await db.execute(text("LOCK TABLE ledger_postings, wallets, assets IN SHARE MODE"))
+    await db.execute(NetWorthDailyDB.__table__.delete())
+    result = await db.execute(REBUILD_SQL)
+    await db.commit()
+    return result.rowcount
+
+def _label(source: str, category: str) -> str:
+    """Enum value for display ("Bank", "Gold"), from the stored enum name"""
+    enum = WalletType if source == WALLET else AssetType
+    return enum[category].value if category in enum.__members__ else category
+
+async def series(db: AsyncSession, start: date, end: date) -> Dict[str, Any]:
+    """Daily net worth in the base currency over [start, end] as parallel arrays, per category and in total"""
+    days = (end - start).days + 1
+    key = (NetWorthDailyDB.source, NetWorthDailyDB.category, NetWorthDailyDB.currency)
+    opening = (await db.execute(
+        select(*key, func.sum(NetWorthDailyDB.amount)).where(NetWorthDailyDB.day < start).group_by(*key)
+    )).all()
+    changes = (await db.execute(
+        select(NetWorthDailyDB.day, *key, NetWorthDailyDB.amount)
+        .where(NetWorthDailyDB.day >= start, NetWorthDailyDB.day <= end)
+    )).all()
+
+    # One row per (source, category, currency), in that currency
+    rows = sorted({tuple(row[:3]) for row in opening} | {tuple(row[1:4]) for row in changes})
+    index = {row: i for i, row in enumerate(rows)}
+    values = np.zeros((len(rows), days))
+    if changes:
+        cells = np.array([index[tuple(row[1:4])] for row in changes], dtype=np.int64)
+        columns = np.array([(row[0] - start).days for row in changes], dtype=np.int64)
+        np.add.at(values, (cells, columns), np.array([row[4] for row in changes], dtype=np.float64))
+    values = np.cumsum(values, axis=1)
+    for source, category, currency, amount in opening:
+        values[index[(source, category, currency)]] += amount or 0.0
+
+    # Convert every cell held in a currency at its day's rate
+    unconverted = []
+    converted = [i for i, (_, _, currency) in enumerate(rows) if currency]
+    if converted:
+        table = await fx.rate_table(db, {rows[i][2] for i in converted}, end)
+        currencies = np.repeat([rows[i][2] for i in converted], days)
+        ordinals = np.tile(np.arange(start.toordinal(), end.toordinal() + 1), len(converted))
+        factors = table.factors(currencies, ordinals).reshape(len(converted), days)
+        unconverted = sorted({rows[i][2] for i, row in zip(converted, factors) if np.isnan(row).any()})
+        values[converted] *= np.nan_to_num(factors, nan=0.0)
+
+    categories = sorted({(source, category) for source, category, _ in rows})
+
+    def total(source: Optional[str] = None) -> List[float]:
+        selected = [i for i, (s, _, _) in enumerate(rows) if source is None or s == source]
+        return values[selected].sum(axis=0).tolist() if selected else [0.0] * days
+
+    def by(source: str) -> Dict[str, List[float]]:
+        return {
+            _label(s, category): values[[i for i, row in enumerate(rows) if row[:2] == (s, category)]].sum(axis=0).tolist()
+            for s, category in categories if s == source
+        }
+
+    return {
+        "from": start,
+        "to": end,
+        "base_currency": fx.BASE_CURRENCY,
+        "date": [(start + timedelta(days=i)).isoformat() for i in range(days)],
+        "net_worth": total(),
+        "wallets": total(WALLET),
+        "assets": total(ASSET),
+        "by_wallet_type": by(WALLET),
+        "by_asset_type": by(ASSET),
+        "unconverted_currencies": unconverted,
+    }
@@ -0,0 +1,44 @@
+"""
+Keyset (cursor) pagination over (timestamp, id), newest first.
+
+A cursor is the opaque, URL-safe encoding of the last row's sort key. The next
+page is `WHERE (ts, id) < (cursor_ts, cursor_id) ORDER BY ts DESC, id DESC
+LIMIT n`, which an index on (ts DESC, id DESC) answers by reading only n rows,
+however deep into the history the page is.
+"""
+import base64
+from datetime import datetime
+from typing import Any, List, Optional, Sequence, Tuple
+
+from sqlalchemy import Select, tuple_
+
+MAX_PAGE_SIZE = 500
+
+def encode_cursor(ts: datetime, row_id: int) -> str:
+    raw = f"{ts.isoformat()}|{row_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Inverse of encode_cursor; ValueError for anything malformed"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        ts, row_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(ts), int(row_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+def keyset_page(stmt: Select, ts_column, id_column, cursor: Optional[str], limit: int) -> Select:
+    """Order newest first, start after `cursor` and fetch one extra row to detect a next page"""
+    if cursor:
+        ts, row_id = decode_cursor(cursor)
+        stmt = stmt.where(tuple_(ts_column, id_column) < tuple_(ts, row_id))
+    return stmt.order_by(ts_column.desc(), id_column.desc()).limit(limit + 1)
+
+def split_page(rows: Sequence[Any], limit: int, ts_attr: str = "date") -> Tuple[List[Any], Optional[str]]:
+    """(rows of this page, cursor of the next page or None)"""
+    rows = list(rows)
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor(getattr(last, ts_attr), last.id)
@@ -0,0 +1,72 @@
+"""
+Minimal periodic background task runner used from the app lifespan.
+"""
+import asyncio
+import time
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+class PeriodicTask:
+    """Run an async function every `interval` seconds until stopped"""
+
+    def __init__(self, name: str, interval: float, func: Callable[[], Awaitable[Any]]):
+        self.name = name
+        self.interval = interval
+        self.func = func
+        self.runs = 0
+        self.errors = 0
+        self.last_run: Optional[datetime] = None
+        self.last_duration: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(), name=self.name)
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def run_once(self):
+        start = time.perf_counter()
+        try:
+            await self.func()
+            self.last_error = None
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.errors += 1
+            self.last_error = str(e)
+            print(f"Error in background task {self.name}: {e}")
+        finally:
+            self.runs += 1
+            self.last_run = datetime.now()
+            self.last_duration = time.perf_counter() - start
+
+    async def _run(self):
+        while True:
+            await self.run_once()
+            await asyncio.sleep(self.interval)
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "running": self.running,
+            "interval_seconds": self.interval,
+            "runs": self.runs,
+            "errors": self.errors,
+            "last_run": self.last_run.isoformat() if self.last_run else None,
+            "last_duration_ms": round(self.last_duration * 1000, 1) if self.last_duration is not None else None,
+            "last_error": self.last_error,
+        }
@@ -0,0 +1,98 @@
+"""
+Stock portfolio valuation.
+
+Holdings are loaded once into column arrays (one element per lot) and valued
+against quotes with NumPy: market value, cost, unrealized P&L and day change
+are whole-array expressions, and lots are summed into per-code positions
+with one `bincount` per column. Valuing thousands of lots costs a few array
+passes instead of a Python loop per lot.
+
+A lot without a quote is valued at cost (purchase price plus its fee), so it
+shows no P&L, and is reported under `unpriced`; the totals never silently
+drop a holding.
+"""
+from typing import Any, Dict, Optional, Sequence
+
+import numpy as np
+
+def value_lots(
+    codes: Sequence[str],
+    volume: Sequence[float],
+    start_price: Sequence[float],
+    margin: Sequence[float],
+    quotes: Dict[str, Optional[Dict[str, Any]]],
+    cash: float = 0.0
+) -> Dict[str, Any]:
+    """Per-code positions and portfolio totals for lots given as parallel columns"""
+    codes = np.asarray(codes, dtype=object)
+    volume = np.asarray(volume, dtype=np.float64)
+    start_price = np.asarray(start_price, dtype=np.float64)
+    margin = np.nan_to_num(np.asarray(margin, dtype=np.float64))
+
+    # Quotes are looked up once per code, then broadcast to the lots
+    unique_codes, lot_code = np.unique(codes, return_inverse=True)
+    code_quotes = [quotes.get(code) or {} for code in unique_codes]
+    code_price = np.array([quote.get("price") or np.nan for quote in code_quotes], dtype=np.float64)
+    code_change = np.array([quote.get("change_24h") or 0.0 for quote in code_quotes], dtype=np.float64)
+    priced = ~np.isnan(code_price)
+
+    cost = volume * start_price + margin
+    value = np.where(priced[lot_code], volume * code_price[lot_code], cost)
+    # change_24h is a percentage against the previous close
+    previous_value = value / (1.0 + code_change[lot_code] / 100.0)
+    day_change = np.where(priced[lot_code], value - previous_value, 0.0)
+
+    def per_code(column):
+        return np.bincount(lot_code, weights=column, minlength=len(unique_codes))
+
+    code_volume = per_code(volume)
+    code_cost = per_code(cost)
+    code_value = per_code(value)
+    code_day_change = per_code(day_change)
+    code_lots = np.bincount(lot_code, minlength=len(unique_codes))
+
+    total_value = float(code_value.sum())
+    total_cost = float(code_cost.sum())
+    total_day_change = float(code_day_change.sum())
+    with np.errstate(divide="ignore", invalid="ignore"):
+        code_pnl = code_value - code_cost
+        code_pnl_percent = np.where(code_cost > 0, code_pnl / code_cost * 100.0, 0.0)
+        weight = code_value / total_value * 100.0 if total_value else np.zeros_like(code_value)
+        average_cost = np.where(code_volume > 0, per_code(volume * start_price) / code_volume, 0.0)
+        day_change_percent = np.where(code_value - code_day_change > 0, code_day_change / (code_value - code_day_change) * 100.0, 0.0)
+
+    order = np.argsort(-code_value, kind="stable")
+    positions = [
+        {
+            "code": unique_codes[i],
+            "lots": int(code_lots[i]),
+            "volume": float(code_volume[i]),
+            "average_cost": float(average_cost[i]),
+            "price": float(code_price[i]) if priced[i] else None,
+            "cost": float(code_cost[i]),
+            "value": float(code_value[i]),
+            "pnl": float(code_pnl[i]),
+            "pnl_percent": float(code_pnl_percent[i]),
+            "weight": float(weight[i]),
+            "day_change": float(code_day_change[i]),
+            "day_change_percent": float(day_change_percent[i]),
+        }
+        for i in order
+    ]
+    total_pnl = total_value - total_cost
+    return {
+        "positions": positions,
+        "totals": {
+            "lots": int(len(codes)),
+            "cost": total_cost,
+            "value": total_value,
+            "pnl": total_pnl,
+            "pnl_percent": total_pnl / total_cost * 100.0 if total_cost else 0.0,
+            "day_change": total_day_change,
+            "day_change_percent": total_day_change / (total_value - total_day_change) * 100.0
+            if total_value - total_day_change else 0.0,
+            "cash": cash,
+            "net_asset_value": total_value + cash,
+        },
+        "unpriced": [str(code) for code in unique_codes[~priced]],
+    }
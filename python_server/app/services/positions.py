@@ -0,0 +1,262 @@
+"""
+Stock lots, trades and positions.
+
+Every buy opens a lot (a StockDB row) and every buy or sell is appended to
+`stock_trades`. A sell is matched against the wallet's open lots of that code
+oldest first (FIFO) and may close part of a lot: the lot keeps its original
+volume, `remaining_volume` drops and `sell_price` becomes the average net
+price of the shares sold from it, so a lot's cash is always
+    -(volume * start_price + margin) + (volume - remaining_volume) * sell_price
+
+`stock_positions` holds one row per (wallet, code) with the open volume, the
+cost basis of the open shares and the realized P&L. Each trade moves it by
+that trade's delta with an atomic upsert in the same database transaction, so
+a trade never re-walks the history; unrealized P&L is the open volume at the
+live quote minus the cost basis, computed when read. A lot's margin is its
+buy fee and is part of the cost basis pro rata.
+
+The FIFO queue (LotBook) is built per request from the open lots, locked for
+the duration of the trade. It is not kept across requests: the API runs
+several workers and the database is the only state they share. Positions are
+derived data; rebuild them from the lots with
+    python maintenance.py rebuild-positions
+"""
+from collections import defaultdict, deque
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import and_, case, func, or_, select, text, tuple_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db_models import PositionDB, StockDB, StockTradeDB, TradeSide
+from app.services import balances, ledger
+
+EPSILON = 1e-9  # Volumes below this count as zero (float share counts)
+
+PositionKey = Tuple[int, str]
+PositionDeltas = Dict[PositionKey, List[float]]  # key -> [volume, cost_basis, realized_pnl]
+
+def normalize_code(code: str) -> str:
+    return code.strip().upper()
+
+def remaining(lot: StockDB) -> float:
+    """Open shares of a lot, including lots from before partial sells"""
+    if lot.remaining_volume is not None:
+        return lot.remaining_volume
+    return lot.volume if lot.is_holding else 0.0
+
+def unit_cost(lot: StockDB) -> float:
+    """Cost basis per share: purchase price plus the share's part of the buy fee"""
+    return lot.start_price + ((lot.margin or 0.0) / lot.volume if lot.volume else 0.0)
+
+def buy_effect(lot: StockDB) -> Dict[str, float]:
+    """What buying a lot did to its wallet: the cost and fee out of cash, the cost into investment value"""
+    cost = lot.volume * lot.start_price
+    return {"cash": -(cost + (lot.margin or 0.0)), "investment_value": cost}
+
+def sell_effect(lot: StockDB) -> Dict[str, float]:
+    """What the sells out of a lot did to its wallet, at the lot's average net sell price"""
+    sold = lot.volume - remaining(lot)
+    return {"cash": sold * (lot.sell_price or 0.0), "investment_value": -sold * lot.start_price}
+
+# The same quantities as SQL expressions, for grouped queries over lots
+open_volume = func.coalesce(StockDB.remaining_volume, case((StockDB.is_holding, StockDB.volume), else_=0.0))
+_unit_cost = StockDB.start_price + case(
+    (StockDB.volume > 0, func.coalesce(StockDB.margin, 0.0) / StockDB.volume), else_=0.0
+)
+open_cost = open_volume * _unit_cost
+# Lots closed before sell prices were required have no proceeds to compare against
+realized_pnl = case(
+    (StockDB.sell_price.isnot(None), (StockDB.volume - open_volume) * (StockDB.sell_price - _unit_cost)),
+    else_=0.0
+)
+
+class LotBook:
+    """Open lots per code, oldest first, for FIFO matching"""
+
+    def __init__(self, lots: Iterable[StockDB] = ()):
+        self._lots: Dict[str, deque] = defaultdict(deque)
+        for lot in sorted(lots, key=lambda lot: (lot.start_date, lot.id)):
+            self.add(lot)
+
+    def add(self, lot: StockDB):
+        if remaining(lot) > EPSILON:
+            self._lots[normalize_code(lot.code)].append(lot)
+
+    def volume(self, code: str) -> float:
+        return sum(remaining(lot) for lot in self._lots.get(code, ()))
+
+    def match(self, code: str, volume: float) -> List[Tuple[StockDB, float]]:
+        """Take `volume` shares from the oldest lots: [(lot, shares)]; ValueError if fewer are open"""
+        available = self.volume(code)
+        if volume > available + EPSILON:
+            raise ValueError(f"Only {available:g} share(s) of {code} held")
+        lots = self._lots[code]
+        matches = []
+        while volume > EPSILON:
+            lot = lots[0]
+            shares = min(remaining(lot), volume)
+            matches.append((lot, shares))
+            volume -= shares
+            if remaining(lot) - shares <= EPSILON:
+                lots.popleft()
+        return matches
+
+async def open_lots(db: AsyncSession, wallet_id: int, code: str) -> List[StockDB]:
+    """A wallet's open lots of a code, locked until the caller commits"""
+    result = await db.execute(
+        select(StockDB)
+        .where(StockDB.wallet_id == wallet_id, StockDB.code == code, open_volume > EPSILON)
+        .order_by(StockDB.start_date, StockDB.id)
+        .with_for_update()
+    )
+    return result.scalars().all()
+
+def track(deltas: PositionDeltas, wallet_id: int, code: str, volume: float = 0.0, cost_basis: float = 0.0, realized: float = 0.0):
+    delta = deltas.setdefault((wallet_id, normalize_code(code)), [0.0, 0.0, 0.0])
+    delta[0] += volume
+    delta[1] += cost_basis
+    delta[2] += realized
+
+async def apply(db: AsyncSession, deltas: PositionDeltas):
+    """Add pending deltas to the positions in one upsert; the caller commits"""
+    rows = [
+        {"wallet_id": wallet_id, "code": code, "volume": volume, "cost_basis": cost_basis, "realized_pnl": realized}
+        for (wallet_id, code), (volume, cost_basis, realized) in deltas.items()
+    ]
+    if not rows:
+        return
+    stmt = insert(PositionDB).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["wallet_id", "code"],
+        set_={
+            "volume": PositionDB.volume + stmt.excluded.volume,
+            "cost_basis": PositionDB.cost_basis + stmt.excluded.cost_basis,
+            "realized_pnl": PositionDB.realized_pnl + stmt.excluded.realized_pnl,
+            "updated_at": func.now(),
+        }
+    )
+    await db.execute(stmt)
+
+async def buy(
+    db: AsyncSession,
+    wallet_id: int,
+    code: str,
+    volume: float,
+    price: float,
+    fee: float,
+    date: datetime
+) -> Tuple[StockDB, StockTradeDB]:
+    """Open a lot and book it; the caller checked the wallet and its cash, and commits"""
+    lot = StockDB(
+        wallet_id=wallet_id,
+        code=normalize_code(code),
+        volume=volume,
+        start_price=price,
+        start_date=date,
+        margin=fee,
+        remaining_volume=volume,
+        is_holding=True
+    )
+    db.add(lot)
+    await db.flush()
+    trade = StockTradeDB(
+        wallet_id=wallet_id, code=normalize_code(code), side=TradeSide.buy,
+        volume=volume, price=price, fee=fee, stock_id=lot.id, date=date
+    )
+    db.add(trade)
+
+    deltas = {}
+    balances.track(deltas, wallet_id, {"cash": -(volume * price + fee), "investment_value": volume * price})
+    await ledger.record(db, "stock_buy", date, deltas, "stock", lot.id)
+    position = {}
+    track(position, wallet_id, code, volume, volume * price + fee)
+    await apply(db, position)
+    return lot, trade
+
+async def close(
+    db: AsyncSession,
+    wallet_id: int,
+    code: str,
+    matches: List[Tuple[StockDB, float]],
+    price: float,
+    fee: float,
+    date: datetime
+) -> StockTradeDB:
+    """Sell matched shares out of their lots at `price` less `fee`; the caller locked the lots and commits"""
+    volume = sum(shares for _, shares in matches)
+    net_price = price - (fee / volume if volume else 0.0)
+    postings = []
+    wallet_deltas: balances.WalletDeltas = {}
+    cost_released = 0.0
+    realized = 0.0
+    for lot, shares in matches:
+        open_shares = remaining(lot)
+        sold = lot.volume - open_shares
+        lot.sell_price = ((lot.sell_price or 0.0) * sold + net_price * shares) / (sold + shares)
+        lot.sell_date = date
+        lot.remaining_volume = open_shares - shares if open_shares - shares > EPSILON else 0.0
+        lot.is_holding = lot.remaining_volume > 0.0
+        cost_released += shares * unit_cost(lot)
+        realized += shares * (net_price - unit_cost(lot))
+
+        # One entry per lot, so the ledger stays reconcilable against each lot
+        lot_deltas = {}
+        balances.track(lot_deltas, wallet_id, {"cash": shares * net_price, "investment_value": -shares * lot.start_price})
+        postings.extend(ledger.entry_rows("stock_sell", date, lot_deltas, "stock", lot.id))
+        balances.track(wallet_deltas, wallet_id, lot_deltas[wallet_id])
+
+    trade = StockTradeDB(
+        wallet_id=wallet_id, code=normalize_code(code), side=TradeSide.sell,
+        volume=volume, price=price, fee=fee, realized_pnl=realized, date=date
+    )
+    db.add(trade)
+    await balances.apply_deltas(db, wallet_deltas)
+    await ledger.write(db, postings)
+    position = {}
+    track(position, wallet_id, code, -volume, -cost_released, realized)
+    await apply(db, position)
+    return trade
+
+async def sell(db: AsyncSession, wallet_id: int, code: str, volume: float, price: float, fee: float, date: datetime) -> StockTradeDB:
+    """Sell `volume` shares FIFO across the wallet's open lots; ValueError if fewer are held"""
+    code = normalize_code(code)
+    book = LotBook(await open_lots(db, wallet_id, code))
+    return await close(db, wallet_id, code, book.match(code, volume), price, fee, date)
+
+def _lot_totals(keys: Optional[Iterable[PositionKey]] = None):
+    stmt = (
+        select(
+            StockDB.wallet_id, StockDB.code,
+            func.sum(open_volume).label("volume"),
+            func.sum(open_cost).label("cost_basis"),
+            func.sum(realized_pnl).label("realized_pnl")
+        )
+        .group_by(StockDB.wallet_id, StockDB.code)
+    )
+    if keys is not None:
+        stmt = stmt.where(tuple_(StockDB.wallet_id, StockDB.code).in_(list(keys)))
+    return stmt
+
+async def refresh(db: AsyncSession, keys: Optional[Iterable[PositionKey]] = None) -> int:
+    """Recompute positions (all, or the given (wallet, code) keys) from the lots; the caller commits"""
+    if keys is not None:
+        keys = {(wallet_id, normalize_code(code)) for wallet_id, code in keys}
+        if not keys:
+            return 0
+    delete = PositionDB.__table__.delete()
+    if keys is not None:
+        delete = delete.where(or_(*[and_(PositionDB.wallet_id == w, PositionDB.code == c) for w, c in keys]))
+    await db.execute(delete)
+    result = await db.execute(
+        insert(PositionDB).from_select(["wallet_id", "code", "volume", "cost_basis", "realized_pnl"], _lot_totals(keys))
+    )
+    return result.rowcount
+
+async def rebuild(db: AsyncSession) -> int:
+    """Recompute every position from the lots (one transaction)"""
+    await db.execute(text("LOCK TABLE stocks IN SHARE MODE"))
+    count = await refresh(db)
+    await db.commit()
+    return count
@@ -0,0 +1,192 @@
+"""
+Price history store.
+
+Every refreshed quote is appended to a per-(symbol, day) chunk that holds the
+day's timestamps and prices as two parallel arrays, so a day of 15-second
+quotes is one row rather than thousands. Chunks older than the raw retention
+are compacted into hourly OHLC bars. Range queries read only the chunks/bars
+in range through their (source, symbol, day|bucket) unique indexes.
+
+Environment variables:
+    PRICE_HISTORY_ENABLED   set to 0 to stop recording quotes (default on)
+    PRICE_HISTORY_RAW_DAYS  days of raw quotes kept before compaction (default 7)
+"""
+import os
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import func, select, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db_models import PriceHistoryChunkDB, PriceBarDB
+
+RAW_RETENTION_DAYS = int(os.getenv("PRICE_HISTORY_RAW_DAYS", 7))
+INTERVAL_SECONDS = {"1h": 3600, "1d": 86400}
+
+# Last price recorded per (source, symbol) in this process; unchanged quotes
+# are not appended again, which keeps flat periods (nights, weekends) compact
+_last_recorded: Dict[Tuple[str, str], float] = {}
+
+async def record_quotes(db: AsyncSession, quotes: Dict[Tuple[str, str], Optional[Dict[str, Any]]]) -> int:
+    """Append refreshed quotes to today's chunks; returns the number recorded"""
+    now = datetime.now(timezone.utc)
+    rows = []
+    for (source, symbol), quote in quotes.items():
+        if not quote or not quote.get("price"):
+            continue
+        price = float(quote["price"])
+        if _last_recorded.get((source, symbol)) == price:
+            continue
+        rows.append({
+            "source": source,
+            "symbol": symbol,
+            "day": now.date(),
+            "timestamps": [now.timestamp()],
+            "prices": [price],
+        })
+    if not rows:
+        return 0
+
+    stmt = insert(PriceHistoryChunkDB).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        constraint="uq_price_history_chunk",
+        set_={
+            "timestamps": func.array_cat(PriceHistoryChunkDB.timestamps, stmt.excluded.timestamps),
+            "prices": func.array_cat(PriceHistoryChunkDB.prices, stmt.excluded.prices),
+        }
+    )
+    await db.execute(stmt)
+    for row in rows:
+        _last_recorded[(row["source"], row["symbol"])] = row["prices"][0]
+    return len(rows)
+
+COMPACT_SQL = text("""
+    INSERT INTO price_bars (source, symbol, interval, bucket_start, open, high, low, close, samples)
+    SELECT c.source, c.symbol, '1h', date_trunc('hour', to_timestamp(u.t)) AS bucket,
+           (array_agg(u.p ORDER BY u.t))[1], max(u.p), min(u.p),
+           (array_agg(u.p ORDER BY u.t DESC))[1], count(*)
+    FROM price_history_chunks c, unnest(c.timestamps, c.prices) AS u(t, p)
+    WHERE c.day < :cutoff
+    GROUP BY c.source, c.symbol, bucket
+    ON CONFLICT ON CONSTRAINT uq_price_bar DO UPDATE SET
+        high = greatest(price_bars.high, excluded.high),
+        low = least(price_bars.low, excluded.low),
+        close = excluded.close,
+        samples = price_bars.samples + excluded.samples
+""")
+
+async def compact(db: AsyncSession, raw_days: int = RAW_RETENTION_DAYS) -> Dict[str, int]:
+    """Fold raw chunks older than `raw_days` into hourly bars and drop them (one transaction)"""
+    # Only one worker compacts at a time; the others skip this round
+    locked = await db.scalar(text("SELECT pg_try_advisory_xact_lock(hashtext('price_history_compact'))"))
+    if not locked:
+        return {"bars": 0, "chunks": 0}
+    cutoff = datetime.now(timezone.utc).date() - timedelta(days=raw_days)
+    bars = await db.execute(COMPACT_SQL, {"cutoff": cutoff})
+    chunks = await db.execute(
+        PriceHistoryChunkDB.__table__.delete().where(PriceHistoryChunkDB.day < cutoff)
+    )
+    await db.commit()
+    return {"bars": bars.rowcount, "chunks": chunks.rowcount}
+
+def _bucketize(timestamps: List[float], prices: List[float], seconds: int) -> Dict[float, List[float]]:
+    """OHLC + sample count per bucket start (epoch seconds) from sorted raw quotes"""
+    buckets: Dict[float, List[float]] = {}
+    for t, p in zip(timestamps, prices):
+        start = t - (t % seconds)
+        bar = buckets.get(start)
+        if bar is None:
+            buckets[start] = [p, p, p, p, 1]
+        else:
+            bar[1] = max(bar[1], p)
+            bar[2] = min(bar[2], p)
+            bar[3] = p
+            bar[4] += 1
+    return buckets
+
+def _merge_bar(buckets: Dict[float, List[float]], start: float, bar: List[float]):
+    existing = buckets.get(start)
+    if existing is None:
+        buckets[start] = list(bar)
+    else:
+        existing[1] = max(existing[1], bar[1])
+        existing[2] = min(existing[2], bar[2])
+        existing[3] = bar[3]
+        existing[4] += bar[4]
+
+def choose_interval(start: datetime, end: datetime) -> str:
+    span = end - start
+    if span <= timedelta(days=2):
+        return "raw"
+    if span <= timedelta(days=60):
+        return "1h"
+    return "1d"
+
+async def query_history(
+    db: AsyncSession,
+    source: str,
+    symbol: str,
+    start: datetime,
+    end: datetime,
+    interval: str = "auto"
+) -> Dict[str, Any]:
+    """Columnar price history for [start, end]: raw points or OHLC bars"""
+    if interval == "auto":
+        interval = choose_interval(start, end)
+    start_ts, end_ts = start.timestamp(), end.timestamp()
+
+    result = await db.execute(
+        select(PriceHistoryChunkDB.timestamps, PriceHistoryChunkDB.prices)
+        .where(
+            PriceHistoryChunkDB.source == source,
+            PriceHistoryChunkDB.symbol == symbol,
+            PriceHistoryChunkDB.day >= start.date(),
+            PriceHistoryChunkDB.day <= end.date()
+        )
+        .order_by(PriceHistoryChunkDB.day)
+    )
+    timestamps: List[float] = []
+    prices: List[float] = []
+    for chunk_timestamps, chunk_prices in result.all():
+        lo = bisect_left(chunk_timestamps, start_ts)
+        hi = bisect_right(chunk_timestamps, end_ts)
+        timestamps.extend(chunk_timestamps[lo:hi])
+        prices.extend(chunk_prices[lo:hi])
+
+    if interval == "raw":
+        return {"source": source, "symbol": symbol, "interval": "raw", "t": timestamps, "price": prices}
+
+    seconds = INTERVAL_SECONDS[interval]
+    buckets: Dict[float, List[float]] = {}
+    # Compacted hourly bars first (older data), then raw points on top
+    bar_rows = await db.execute(
+        select(PriceBarDB.bucket_start, PriceBarDB.open, PriceBarDB.high, PriceBarDB.low, PriceBarDB.close, PriceBarDB.samples)
+        .where(
+            PriceBarDB.source == source,
+            PriceBarDB.symbol == symbol,
+            PriceBarDB.interval == "1h",
+            PriceBarDB.bucket_start >= start,
+            PriceBarDB.bucket_start <= end
+        )
+        .order_by(PriceBarDB.bucket_start)
+    )
+    for bucket_start, open_, high, low, close, samples in bar_rows.all():
+        t = bucket_start.timestamp()
+        _merge_bar(buckets, t - (t % seconds), [open_, high, low, close, samples])
+    for t, bar in sorted(_bucketize(timestamps, prices, seconds).items()):
+        _merge_bar(buckets, t, bar)
+
+    ordered = sorted(buckets.items())
+    return {
+        "source": source,
+        "symbol": symbol,
+        "interval": interval,
+        "t": [t for t, _ in ordered],
+        "open": [bar[0] for _, bar in ordered],
+        "high": [bar[1] for _, bar in ordered],
+        "low": [bar[2] for _, bar in ordered],
+        "close": [bar[3] for _, bar in ordered],
+        "samples": [bar[4] for _, bar in ordered],
+    }
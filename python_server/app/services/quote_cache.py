@@ -0,0 +1,224 @@
+"""
+In-process quote cache for the market-data endpoints.
+
+Quotes are keyed by (source, symbol). A fresh entry (younger than the TTL) is
+served directly; a stale one (within the stale window after the TTL) is served
+immediately while a single background fetch revalidates it; anything older is
+a miss. Concurrent misses for the same key share one upstream fetch
+(single-flight), so N polling tabs cost one upstream call per TTL.
+`generation` counts stores, so results derived from quotes can tell when
+any quote has changed.
+
+Environment variables:
+    QUOTE_CACHE_TTL        seconds a quote is fresh (default 30)
+    QUOTE_CACHE_STALE_TTL  extra seconds a stale quote may be served while revalidating (default 300)
+"""
+import asyncio
+import os
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+Quote = Dict[str, Any]
+Fetcher = Callable[[], Awaitable[Optional[Quote]]]
+CacheKey = Tuple[str, str]
+# Fetches many keys in one go; keys missing from the result count as failures
+BatchFetcher = Callable[[List[CacheKey]], Awaitable[Dict[CacheKey, Quote]]]
+
+@dataclass
+class CacheEntry:
+    value: Quote
+    fetched_at: float  # time.monotonic() of the fetch, used for TTL checks
+    fetched_at_wall: float  # time.time() of the fetch, reported to clients
+
+class QuoteCache:
+    def __init__(self, ttl: float, stale_ttl: float):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._entries: Dict[CacheKey, CacheEntry] = {}
+        self._inflight: Dict[CacheKey, asyncio.Task] = {}
+        self.generation = 0  # Bumped on every stored quote
+        self.counters = {
+            "hits": 0,
+            "stale_hits": 0,
+            "misses": 0,
+            "coalesced": 0,
+            "upstream_fetches": 0,
+            "upstream_errors": 0,
+        }
+
+    @staticmethod
+    def key(source: str, symbol: str) -> CacheKey:
+        return (source, symbol.upper())
+
+    async def get(self, source: str, symbol: str, fetcher: Fetcher) -> Optional[Quote]:
+        """Get a quote, fetching it through `fetcher` on a miss"""
+        key = self.key(source, symbol)
+        entry = self._entries.get(key)
+        if entry is not None:
+            age = time.monotonic() - entry.fetched_at
+            if age < self.ttl:
+                self.counters["hits"] += 1
+                return entry.value
+            if age < self.ttl + self.stale_ttl:
+                self.counters["stale_hits"] += 1
+                self._start_fetch(key, fetcher)
+                return entry.value
+        self.counters["misses"] += 1
+        return await self.refresh(source, symbol, fetcher)
+
+    async def refresh(self, source: str, symbol: str, fetcher: Fetcher) -> Optional[Quote]:
+        """Fetch a quote now, joining an in-flight fetch for the same key if there is one"""
+        task = self._start_fetch(self.key(source, symbol), fetcher)
+        # shield: a cancelled caller must not cancel the fetch other callers share
+        return await asyncio.shield(task)
+
+    async def get_many(self, keys: List[CacheKey], batch_fetcher: BatchFetcher) -> Dict[CacheKey, Optional[Quote]]:
+        """Get many quotes; misses (and stale revalidations) go out as one batch fetch"""
+        results: Dict[CacheKey, Optional[Quote]] = {}
+        missing, stale = [], []
+        now = time.monotonic()
+        for key in keys:
+            entry = self._entries.get(key)
+            age = now - entry.fetched_at if entry is not None else None
+            if age is not None and age < self.ttl:
+                self.counters["hits"] += 1
+                results[key] = entry.value
+            elif age is not None and age < self.ttl + self.stale_ttl:
+                self.counters["stale_hits"] += 1
+                results[key] = entry.value
+                stale.append(key)
+            else:
+                self.counters["misses"] += 1
+                missing.append(key)
+        if stale:
+            self._start_batch(stale, batch_fetcher)
+        if missing:
+            results.update(await self._await_all(self._start_batch(missing, batch_fetcher)))
+        return results
+
+    async def refresh_many(self, keys: List[CacheKey], batch_fetcher: BatchFetcher) -> Dict[CacheKey, Optional[Quote]]:
+        """Fetch many quotes now as one batch, joining in-flight fetches"""
+        return await self._await_all(self._start_batch(keys, batch_fetcher))
+
+    def peek(self, source: str, symbol: str) -> Optional[CacheEntry]:
+        """Return the cached entry (fresh or not) without fetching"""
+        return self._entries.get(self.key(source, symbol))
+
+    def put(self, source: str, symbol: str, value: Quote):
+        """Store a quote fetched elsewhere"""
+        self._store(self.key(source, symbol), value)
+
+    def _store(self, key: CacheKey, value: Quote):
+        self._entries[key] = CacheEntry(value, time.monotonic(), time.time())
+        self.generation += 1
+
+    def _start_fetch(self, key: CacheKey, fetcher: Fetcher) -> asyncio.Task:
+        task = self._inflight.get(key)
+        if task is not None:
+            self.counters["coalesced"] += 1
+            return task
+        task = asyncio.ensure_future(self._load(key, fetcher))
+        self._inflight[key] = task
+        task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return task
+
+    def _start_batch(self, keys: List[CacheKey], batch_fetcher: BatchFetcher) -> Dict[CacheKey, asyncio.Future]:
+        """Per-key futures for a batch; keys already in flight join the existing fetch"""
+        futures: Dict[CacheKey, asyncio.Future] = {}
+        new_keys = []
+        for key in keys:
+            if key in self._inflight:
+                self.counters["coalesced"] += 1
+                futures[key] = self._inflight[key]
+            else:
+                new_keys.append(key)
+        if new_keys:
+            batch = asyncio.ensure_future(self._load_many(new_keys, batch_fetcher))
+            for key in new_keys:
+                future = asyncio.ensure_future(self._pick(batch, key))
+                self._inflight[key] = future
+                future.add_done_callback(lambda _, key=key: self._inflight.pop(key, None))
+                futures[key] = future
+        return futures
+
+    @staticmethod
+    async def _pick(batch: asyncio.Future, key: CacheKey) -> Optional[Quote]:
+        return (await batch).get(key)
+
+    @staticmethod
+    async def _await_all(futures: Dict[CacheKey, asyncio.Future]) -> Dict[CacheKey, Optional[Quote]]:
+        keys = list(futures)
+        values = await asyncio.shield(asyncio.gather(*futures.values()))
+        return dict(zip(keys, values))
+
+    async def _load_many(self, keys: List[CacheKey], batch_fetcher: BatchFetcher) -> Dict[CacheKey, Optional[Quote]]:
+        self.counters["upstream_fetches"] += 1
+        try:
+            values = await batch_fetcher(keys)
+        except Exception as e:
+            print(f"Error refreshing quotes {keys}: {e}")
+            values = {}
+        results = {}
+        for key in keys:
+            value = values.get(key)
+            if value is None:
+                self.counters["upstream_errors"] += 1
+                entry = self._entries.get(key)
+                results[key] = entry.value if entry else None
+            else:
+                self._store(key, value)
+                results[key] = value
+        return results
+
+    async def _load(self, key: CacheKey, fetcher: Fetcher) -> Optional[Quote]:
+        self.counters["upstream_fetches"] += 1
+        try:
+            value = await fetcher()
+        except Exception as e:
+            print(f"Error refreshing quote {key}: {e}")
+            value = None
+        if value is None:
+            self.counters["upstream_errors"] += 1
+            # Keep serving the last known quote rather than nothing
+            entry = self._entries.get(key)
+            return entry.value if entry else None
+        self._store(key, value)
+        return value
+
+    def freshness(self, source: str, symbol: str) -> Optional[Dict[str, Any]]:
+        """When a quote was fetched and whether it is still within the TTL"""
+        entry = self.peek(source, symbol)
+        if entry is None:
+            return None
+        age = time.monotonic() - entry.fetched_at
+        return {
+            "fetched_at": datetime.fromtimestamp(entry.fetched_at_wall).isoformat(),
+            "age_seconds": round(age, 3),
+            "fresh": age < self.ttl
+        }
+
+    def freshness_all(self) -> List[Dict[str, Any]]:
+        return [
+            {"source": source, "symbol": symbol, **self.freshness(source, symbol)}
+            for source, symbol in list(self._entries)
+        ]
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters plus current size, for scraping"""
+        lookups = self.counters["hits"] + self.counters["stale_hits"] + self.counters["misses"]
+        served_from_cache = self.counters["hits"] + self.counters["stale_hits"]
+        return {
+            **self.counters,
+            "hit_ratio": served_from_cache / lookups if lookups else 0.0,
+            "entries": len(self._entries),
+            "inflight": len(self._inflight),
+            "ttl_seconds": self.ttl,
+            "stale_ttl_seconds": self.stale_ttl,
+        }
+
+quote_cache = QuoteCache(
+    ttl=float(os.getenv("QUOTE_CACHE_TTL", 30)),
+    stale_ttl=float(os.getenv("QUOTE_CACHE_STALE_TTL", 300))
+)
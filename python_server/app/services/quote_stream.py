@@ -0,0 +1,74 @@
+"""
+Fan-out of market-data updates to streaming (SSE) subscribers.
+
+The background refresher publishes the watchlist once per cycle; only keys
+whose price or change moved are encoded (once) and pushed to every
+subscriber's queue, so the cost of a refresh does not grow with the number of
+connected clients beyond one queue put each.
+"""
+import asyncio
+import json
+from typing import Any, Dict, Optional, Set, Tuple
+
+Event = Tuple[str, str]  # (event name, encoded JSON payload)
+
+def _changed(previous: Optional[Dict[str, Any]], current: Optional[Dict[str, Any]]) -> bool:
+    if previous is None or current is None:
+        return previous is not current
+    return (
+        previous.get("price") != current.get("price")
+        or previous.get("change_24h") != current.get("change_24h")
+    )
+
+class QuoteBroadcaster:
+    def __init__(self, queue_size: int = 16):
+        self.queue_size = queue_size
+        self._subscribers: Set[asyncio.Queue] = set()
+        self._latest: Dict[str, Optional[Dict[str, Any]]] = {}
+        self.published = 0
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    def _snapshot(self) -> Event:
+        return ("snapshot", json.dumps(self._latest))
+
+    def subscribe(self) -> asyncio.Queue:
+        """Register a subscriber; its queue starts with a snapshot of the latest values"""
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        queue.put_nowait(self._snapshot())
+        self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self._subscribers.discard(queue)
+
+    def publish(self, quotes: Dict[str, Optional[Dict[str, Any]]]):
+        """Push the keys that changed since the last publish to every subscriber"""
+        delta = {
+            key: quote for key, quote in quotes.items()
+            if key not in self._latest or _changed(self._latest[key], quote)
+        }
+        if not delta:
+            return
+        self._latest.update(delta)
+        self.published += 1
+        event: Event = ("delta", json.dumps(delta))
+        for queue in list(self._subscribers):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # Slow client: drop its backlog and resync it with one snapshot
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(self._snapshot())
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "subscribers": self.subscriber_count,
+            "published": self.published,
+            "keys": len(self._latest),
+        }
+
+quote_broadcaster = QuoteBroadcaster()
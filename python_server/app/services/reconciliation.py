@@ -0,0 +1,228 @@
+"""
+Wallet balance reconciliation.
+
+Every check is a set-based aggregate query, so the database does the work
+and the cost is a few scans however many wallets and transactions exist:
+
+  sources  the ledger postings of every transaction and stock trade against
+           what the current TransactionDB / StockDB row says they should be
+           (an amount edited without moving the balance, a stock's volume or
+           price changed after purchase)
+  wallets  the denormalized wallet columns (balance, cash, loan,
+           investment_value, gross_balance) against the sum of their postings
+
+Repair runs both in one database transaction: source drift is corrected with
+"reconcile" postings (the source row wins), then every drifted wallet is
+rewritten from its ledger sums with one UPDATE. Transactions and stocks that
+predate the ledger have no postings of their own and are covered by the
+wallet's opening entry instead; wallets with no postings at all are only
+listed, until `maintenance.py ledger-opening-balances` has run.
+
+    python maintenance.py reconcile-wallets [--repair]
+"""
+from datetime import datetime, timezone
+from typing import Any, Dict, List
+
+from sqlalchemy import and_, case, func, literal, not_, or_, select, text, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db_models import LedgerPostingDB, StockDB, TransactionDB, TransactionType, WalletDB, WalletType
+from app.services import balances, ledger, positions
+
+TOLERANCE = 0.005  # Half a cent: float sums drift below this
+MAX_REPORTED = 500
+
+def _differs(a, b):
+    return func.abs(a - b) > TOLERANCE
+
+def _source_postings(source_type: str):
+    """Net postings per (source row, wallet)"""
+    return (
+        select(LedgerPostingDB.source_id, LedgerPostingDB.wallet_id, *ledger.field_sums())
+        .where(LedgerPostingDB.source_type == source_type, LedgerPostingDB.wallet_id.isnot(None))
+        .group_by(LedgerPostingDB.source_id, LedgerPostingDB.wallet_id)
+        .subquery()
+    )
+
+def _transaction_drift():
+    posted = _source_postings("transaction")
+    signed = case((TransactionDB.type == TransactionType.income, TransactionDB.amount), else_=-TransactionDB.amount)
+    # A deleted transaction, or one moved to another wallet, should net to zero here
+    current = and_(TransactionDB.id.isnot(None), TransactionDB.wallet_id == posted.c.wallet_id)
+    is_credit = WalletDB.type == WalletType.credit
+    expected = {
+        "balance": case((and_(current, not_(is_credit)), signed), else_=0.0),
+        "cash": case((and_(current, WalletDB.type == WalletType.stock), signed), else_=0.0),
+        "loan": case((and_(current, is_credit), -signed), else_=0.0),
+        "investment_value": literal(0.0),
+    }
+    joined = (
+        posted.join(WalletDB, WalletDB.id == posted.c.wallet_id)
+        .outerjoin(TransactionDB, TransactionDB.id == posted.c.source_id)
+    )
+    return posted, joined, TransactionDB.date, expected
+
+def _stock_drift():
+    posted = _source_postings("stock")
+    exists = StockDB.id.isnot(None)
+    cost = StockDB.volume * StockDB.start_price
+    # sell_price is the average net price of the shares sold from the lot so far
+    proceeds = (StockDB.volume - positions.open_volume) * func.coalesce(StockDB.sell_price, 0.0)
+    expected = {
+        "balance": literal(0.0),
+        # A deleted stock's cash is unknowable (its margin is gone with it)
+        "cash": case(
+            (exists, -(cost + func.coalesce(StockDB.margin, 0.0)) + proceeds),
+            else_=posted.c.cash
+        ),
+        "loan": literal(0.0),
+        "investment_value": case((exists, positions.open_volume * StockDB.start_price), else_=0.0),
+    }
+    joined = (
+        posted.join(WalletDB, WalletDB.id == posted.c.wallet_id)
+        .outerjoin(StockDB, StockDB.id == posted.c.source_id)
+    )
+    return posted, joined, StockDB.start_date, expected
+
+async def source_discrepancies(db: AsyncSession) -> List[Dict[str, Any]]:
+    """Postings that no longer match the transaction or stock they came from"""
+    rows = []
+    for source_type, check in (("transaction", _transaction_drift), ("stock", _stock_drift)):
+        posted, joined, source_date, expected = check()
+        stmt = (
+            select(
+                posted.c.source_id, posted.c.wallet_id, source_date.label("source_date"),
+                *[posted.c[field] for field in balances.FIELDS],
+                *[expected[field].label(f"expected_{field}") for field in balances.FIELDS]
+            )
+            .select_from(joined)
+            .where(or_(*[_differs(posted.c[field], expected[field]) for field in balances.FIELDS]))
+        )
+        for row in (await db.execute(stmt)).mappings():
+            for field in balances.FIELDS:
+                difference = row[f"expected_{field}"] - row[field]
+                if abs(difference) > TOLERANCE:
+                    rows.append({
+                        "source_type": source_type,
+                        "source_id": row["source_id"],
+                        "wallet_id": row["wallet_id"],
+                        "source_date": row["source_date"],
+                        "field": field,
+                        "posted": row[field],
+                        "expected": row[f"expected_{field}"],
+                        "difference": difference,
+                    })
+    return rows
+
+def _ledger_totals():
+    return (
+        select(LedgerPostingDB.wallet_id, *ledger.field_sums())
+        .where(LedgerPostingDB.wallet_id.isnot(None))
+        .group_by(LedgerPostingDB.wallet_id)
+        .subquery()
+    )
+
+def _expected_wallet_columns(totals) -> Dict[str, Any]:
+    columns = {field: totals.c[field] for field in balances.FIELDS}
+    columns["gross_balance"] = case(
+        (WalletDB.type == WalletType.stock, totals.c.cash + totals.c.investment_value),
+        else_=func.coalesce(WalletDB.gross_balance, 0.0)
+    )
+    return columns
+
+async def wallet_discrepancies(db: AsyncSession) -> List[Dict[str, Any]]:
+    """Wallet columns that differ from the sum of their postings"""
+    totals = _ledger_totals()
+    expected = _expected_wallet_columns(totals)
+    stored = {field: func.coalesce(getattr(WalletDB, field), 0.0) for field in expected}
+    stmt = (
+        select(
+            WalletDB.id, WalletDB.name,
+            *[stored[field].label(f"stored_{field}") for field in expected],
+            *[expected[field].label(f"expected_{field}") for field in expected]
+        )
+        .join(totals, totals.c.wallet_id == WalletDB.id)
+        .where(or_(*[_differs(stored[field], expected[field]) for field in expected]))
+    )
+    rows = []
+    for row in (await db.execute(stmt)).mappings():
+        for field in expected:
+            difference = row[f"expected_{field}"] - row[f"stored_{field}"]
+            if abs(difference) > TOLERANCE:
+                rows.append({
+                    "wallet_id": row["id"],
+                    "name": row["name"],
+                    "field": field,
+                    "stored": row[f"stored_{field}"],
+                    "expected": row[f"expected_{field}"],
+                    "difference": difference,
+                })
+    return rows
+
+async def wallets_without_ledger(db: AsyncSession) -> List[int]:
+    """Wallets holding a balance but no postings (opening balances not posted yet)"""
+    has_postings = select(LedgerPostingDB.id).where(LedgerPostingDB.wallet_id == WalletDB.id).exists()
+    result = await db.execute(
+        select(WalletDB.id)
+        .where(~has_postings)
+        .where(or_(*[func.coalesce(getattr(WalletDB, field), 0.0) != 0.0 for field in balances.FIELDS]))
+        .order_by(WalletDB.id)
+    )
+    return result.scalars().all()
+
+async def _post_corrections(db: AsyncSession, discrepancies: List[Dict[str, Any]]) -> int:
+    entries: Dict[tuple, Dict[str, Any]] = {}
+    for row in discrepancies:
+        entry = entries.setdefault(
+            (row["source_type"], row["source_id"], row["wallet_id"]),
+            {"date": row["source_date"] or datetime.now(timezone.utc), "delta": {}}
+        )
+        entry["delta"][row["field"]] = row["difference"]
+    postings = []
+    for (source_type, source_id, wallet_id), entry in entries.items():
+        postings.extend(ledger.entry_rows("reconcile", entry["date"], {wallet_id: entry["delta"]}, source_type, source_id))
+    await ledger.write(db, postings)
+    return len(entries)
+
+async def _rewrite_wallets(db: AsyncSession, wallet_ids: List[int]) -> int:
+    if not wallet_ids:
+        return 0
+    totals = _ledger_totals()
+    result = await db.execute(
+        update(WalletDB)
+        .where(WalletDB.id == totals.c.wallet_id, WalletDB.id.in_(wallet_ids))
+        .values(**_expected_wallet_columns(totals))
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount
+
+def _report(sources, wallets, unposted) -> Dict[str, Any]:
+    return {
+        "checked_at": datetime.now(timezone.utc),
+        "source_discrepancies": len(sources),
+        "wallet_discrepancies": len(wallets),
+        "sources": sources[:MAX_REPORTED],
+        "wallets": wallets[:MAX_REPORTED],
+        "wallets_without_ledger": unposted,
+    }
+
+async def reconcile(db: AsyncSession, repair: bool = False) -> Dict[str, Any]:
+    """Report drift between wallets, the ledger and its sources; optionally fix it in one transaction"""
+    if repair:
+        # Same order writers take (wallet rows, then postings): writers queue
+        # behind the repair instead of changing what it is correcting
+        await db.execute(text("LOCK TABLE wallets IN SHARE ROW EXCLUSIVE MODE"))
+        await db.execute(text("LOCK TABLE ledger_postings IN SHARE ROW EXCLUSIVE MODE"))
+
+    sources = await source_discrepancies(db)
+    corrections = await _post_corrections(db, sources) if repair else 0
+    # After corrections, so the wallets pick those up too
+    wallets = await wallet_discrepancies(db)
+    unposted = await wallets_without_ledger(db)
+    report = _report(sources, wallets, unposted)
+
+    if repair:
+        report["corrections_posted"] = corrections
+        report["wallets_repaired"] = await _rewrite_wallets(db, sorted({row["wallet_id"] for row in wallets}))
+        await db.commit()
+    return report
@@ -0,0 +1,287 @@
+"""
+Wallet returns: time-weighted (TWR) and money-weighted (XIRR).
+
+A wallet is valued at the end of every day of the range (and at its start):
+its ledger balance for most wallets, minus the loan for credit wallets, and
+cash plus every held code's shares at that day's close for stock wallets.
+Balances, shares and flows are loaded once and turned into per-day NumPy
+arrays with `bincount` + `cumsum`; closes come from the price history
+(daily bars), carried forward over days without quotes, with the live quote
+on a range ending today and the average purchase price before any close is
+known.
+
+External cash flows are the ledger's transfers, opening balances, manual
+adjustments and reconciliation corrections; on stock wallets income and
+expense transactions (dividends, fees) count as return, elsewhere they are
+flows too, so wallets without market prices return zero.
+
+TWR chains daily returns with flows at the start of the day. XIRR solves
+sum(cf * (1 + r) ** -years) = 0 with Newton's method run from several
+starting rates at once as one array computation, keeping the first that
+converges.
+
+Results are memoized per (wallet, range) in each worker until the wallet's
+latest posting or trade changes, checked with one query per request; ranges
+ending today also expire after RETURNS_LIVE_TTL seconds (default 60), as
+their last valuation uses live quotes.
+"""
+import os
+import time
+from collections import OrderedDict
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db_models import LedgerPostingDB, StockDB, StockTradeDB, TradeSide, WalletDB, WalletType
+from app.services.market_quotes import stock_quotes, stock_symbol
+from app.services import ledger, price_history
+from app.services.timestamps import utc
+
+RETURNS_LIVE_TTL = float(os.getenv("RETURNS_LIVE_TTL", "60"))
+MEMO_SIZE = 256
+DAY = 86400.0
+YEAR_DAYS = 365.0
+PRICE_LOOKBACK_DAYS = 30  # How far before the range a close may be carried forward from
+
+FLOW_KINDS = ("transfer", "opening", "adjustment", "reconcile")
+TRANSACTION_KINDS = ("income", "expense")
+
+Watermark = Tuple[Optional[int], Optional[int]]
+_memo: "OrderedDict[Tuple, Tuple[Watermark, Optional[float], Dict[str, Any]]]" = OrderedDict()
+
+def _epochs(values) -> np.ndarray:
+    return np.array([utc(value).timestamp() for value in values], dtype=np.float64)
+
+def default_range(start: Optional[datetime], end: Optional[datetime]) -> Tuple[datetime, datetime]:
+    """The range to compute over: up to now, from the start of that year unless given"""
+    end = utc(end) if end is not None else datetime.now(timezone.utc)
+    start = utc(start) if start is not None else datetime(end.year, 1, 1, tzinfo=timezone.utc)
+    return start, end
+
+def valuation_points(start: datetime, end: datetime) -> Tuple[List[date], np.ndarray]:
+    """The range start, then the end of every day in it (the last one clipped to `end`)"""
+    days = [start.date() + timedelta(days=i) for i in range((end.date() - start.date()).days + 1)]
+    day_ends = np.array(
+        [datetime(d.year, d.month, d.day, tzinfo=timezone.utc).timestamp() + DAY for d in days], dtype=np.float64
+    )
+    return days, np.concatenate(([start.timestamp()], np.minimum(day_ends, end.timestamp())))
+
+def cumulative(points: np.ndarray, times: np.ndarray, amounts: np.ndarray) -> np.ndarray:
+    """Running total of `amounts` at each point (events at or before the first point land on it)"""
+    index = np.searchsorted(points, times, side="left")
+    return np.cumsum(np.bincount(index, weights=amounts, minlength=len(points))[:len(points)])
+
+def carry_forward(points: np.ndarray, times: np.ndarray, prices: np.ndarray, fallback: float) -> np.ndarray:
+    """Latest price at or before each point, `fallback` before the first one"""
+    index = np.searchsorted(times, points, side="right") - 1
+    return np.where(index >= 0, prices[np.maximum(index, 0)] if len(prices) else fallback, fallback)
+
+def twr(values: np.ndarray, flows: np.ndarray) -> Tuple[float, np.ndarray]:
+    """Chained daily returns, flows at the start of each day: (total, cumulative per point)"""
+    invested = values[:-1] + flows[1:]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        daily = np.where(np.abs(invested) > 1e-9, values[1:] / invested - 1.0, 0.0)
+    growth = np.concatenate(([1.0], np.cumprod(1.0 + daily)))
+    return float(growth[-1] - 1.0), growth - 1.0
+
+def xirr(amounts: np.ndarray, years: np.ndarray, iterations: int = 50, tolerance: float = 1e-10) -> Optional[float]:
+    """Annual rate r with sum(amounts / (1 + r) ** years) = 0, or None if there is none"""
+    if len(amounts) < 2 or not (amounts.min() < 0 < amounts.max()):
+        return None
+    if years.max() - years.min() < 1.0 / YEAR_DAYS:
+        return None  # All at once: any rate fits
+    # Several starting rates at once: rows are guesses, columns are cash flows
+    rates = np.array([0.1, 0.0, -0.5, 1.0, 5.0, -0.9])[:, None]
+    for _ in range(iterations):
+        base = np.maximum(1.0 + rates, 1e-9)
+        discounted = amounts * base ** -years
+        value = discounted.sum(axis=1, keepdims=True)
+        slope = (-years * discounted / base).sum(axis=1, keepdims=True)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            step = np.where(slope != 0, value / slope, 0.0)
+        rates = np.clip(rates - step, -0.999999, 1e6)
+        if np.any(np.abs(step) < tolerance):
+            break
+    base = np.maximum(1.0 + rates, 1e-9)
+    residual = np.abs((amounts * base ** -years).sum(axis=1))
+    scale = np.abs(amounts).sum()
+    converged = np.flatnonzero(np.isfinite(residual) & (residual <= 1e-6 * scale))
+    return float(rates[converged[0], 0]) if len(converged) else None
+
+def _annualize(total: float, days: float) -> Optional[float]:
+    if days < YEAR_DAYS or total <= -1.0:
+        return None
+    return (1.0 + total) ** (YEAR_DAYS / days) - 1.0
+
+async def watermark(db: AsyncSession, wallet_id: int) -> Watermark:
+    """Latest posting and trade of the wallet; anything new changes its returns"""
+    return tuple((await db.execute(
+        select(
+            select(func.max(LedgerPostingDB.id)).where(LedgerPostingDB.wallet_id == wallet_id).scalar_subquery(),
+            select(func.max(StockTradeDB.id)).where(StockTradeDB.wallet_id == wallet_id).scalar_subquery()
+        )
+    )).one())
+
+async def _share_events(db: AsyncSession, wallet_id: int, end: datetime) -> Tuple[np.ndarray, np.ndarray, np.ndarray, Dict[str, float]]:
+    """(code index, time, shares) of every buy and sell up to `end`, the codes and their average buy price"""
+    lots = (await db.execute(
+        select(
+            StockDB.code, StockDB.volume, StockDB.start_price, StockDB.start_date,
+            StockDB.sell_date, StockDB.remaining_volume, StockDB.is_holding
+        )
+        .where(StockDB.wallet_id == wallet_id, StockDB.start_date <= end)
+    )).all()
+    sells = (await db.execute(
+        select(StockTradeDB.code, StockTradeDB.date, StockTradeDB.volume)
+        .where(StockTradeDB.wallet_id == wallet_id, StockTradeDB.side == TradeSide.sell, StockTradeDB.date <= end)
+    )).all()
+
+    events = [(code, start_date, volume) for code, volume, _, start_date, *_ in lots]
+    events += [(code, sold_at, -volume) for code, sold_at, volume in sells]
+    # Lots closed before trades were recorded sold all their shares at once
+    events += [
+        (code, sell_date or start_date, -volume)
+        for code, volume, _, start_date, sell_date, remaining_volume, is_holding in lots
+        if remaining_volume is None and not is_holding and utc(sell_date or start_date) <= end
+    ]
+    bought: Dict[str, List[float]] = {}
+    for code, volume, start_price, *_ in lots:
+        totals = bought.setdefault(code, [0.0, 0.0])
+        totals[0] += volume * start_price
+        totals[1] += volume
+    average_cost = {code: cost / volume if volume else 0.0 for code, (cost, volume) in bought.items()}
+
+    codes = sorted({code for code, _, _ in events})
+    code_index = {code: i for i, code in enumerate(codes)}
+    return (
+        np.array([code_index[code] for code, _, _ in events], dtype=np.int64),
+        _epochs(at for _, at, _ in events),
+        np.array([shares for _, _, shares in events], dtype=np.float64),
+        {code: average_cost.get(code, 0.0) for code in codes},
+    )
+
+async def _holdings_value(db: AsyncSession, wallet_id: int, start: datetime, end: datetime, points: np.ndarray, live: bool) -> np.ndarray:
+    """Market value of the wallet's shares at each point"""
+    code_index, times, shares, average_cost = await _share_events(db, wallet_id, end)
+    codes = list(average_cost)
+    if not codes:
+        return np.zeros(len(points))
+
+    quotes = await stock_quotes(codes) if live else {}
+    value = np.zeros(len(points))
+    for i, code in enumerate(codes):
+        mine = code_index == i
+        held = np.maximum(cumulative(points, times[mine], shares[mine]), 0.0)
+        if not held.any():
+            continue
+        history = await price_history.query_history(
+            db, "stock", stock_symbol(code), start - timedelta(days=PRICE_LOOKBACK_DAYS), end, interval="1d"
+        )
+        prices = carry_forward(
+            points, np.array(history["t"], dtype=np.float64), np.array(history["close"], dtype=np.float64), average_cost[code]
+        )
+        live_price = (quotes.get(code) or {}).get("price")
+        if live_price is not None:
+            prices[-1] = live_price
+        value += held * prices
+    return value
+
+async def compute(db: AsyncSession, wallet: WalletDB, start: datetime, end: datetime, series: bool = False) -> Dict[str, Any]:
+    """TWR, XIRR and the value/flow series of one wallet over [start, end]"""
+    days, points = valuation_points(start, end)
+    opening = await ledger.balance_at(db, wallet, start)
+    postings = (await db.execute(
+        select(LedgerPostingDB.field, LedgerPostingDB.amount, LedgerPostingDB.effective_at, LedgerPostingDB.kind)
+        .where(
+            LedgerPostingDB.wallet_id == wallet.id,
+            LedgerPostingDB.effective_at > start,
+            LedgerPostingDB.effective_at <= end
+        )
+    )).all()
+    fields = np.array([field for field, *_ in postings], dtype=object)
+    amounts = np.array([amount for _, amount, *_ in postings], dtype=np.float64)
+    times = _epochs(at for _, _, at, _ in postings)
+    kinds = np.array([kind for *_, kind in postings], dtype=object)
+
+    # The wallet's value in terms of its ledger fields, and the postings that are flows
+    if wallet.type == WalletType.stock:
+        value_fields = {"cash": 1.0}
+        flow_kinds = FLOW_KINDS
+    elif wallet.type == WalletType.credit:
+        value_fields = {"loan": -1.0}
+        flow_kinds = FLOW_KINDS + TRANSACTION_KINDS
+    else:
+        value_fields = {"balance": 1.0}
+        flow_kinds = FLOW_KINDS + TRANSACTION_KINDS
+    sign = np.zeros(len(postings))
+    for field, weight in value_fields.items():
+        sign[fields == field] = weight
+    moved = amounts * sign
+
+    values = sum(opening[field] * weight for field, weight in value_fields.items()) + cumulative(points, times, moved)
+    is_flow = np.isin(kinds, flow_kinds)
+    flows = np.diff(cumulative(points, times[is_flow], moved[is_flow]), prepend=0.0)
+    if wallet.type == WalletType.stock:
+        live = end.date() >= datetime.now(timezone.utc).date()
+        values = values + await _holdings_value(db, wallet.id, start, end, points, live)
+
+    total, cumulative_twr = twr(values, flows)
+    span_days = (end - start).total_seconds() / DAY
+    # Investor's view: the opening value and deposits go in, the closing value comes out
+    cash_flows = np.concatenate(([-values[0]], -flows[1:], [values[-1]]))
+    years = np.concatenate(([0.0], (points[1:] - points[0]) / DAY / YEAR_DAYS, [(points[-1] - points[0]) / DAY / YEAR_DAYS]))
+    keep = cash_flows != 0.0
+    net_flows = float(flows[1:].sum())
+
+    result = {
+        "wallet_id": wallet.id,
+        "from": start,
+        "to": end,
+        "days": len(days),
+        "start_value": float(values[0]),
+        "end_value": float(values[-1]),
+        "net_flows": net_flows,
+        "gain": float(values[-1] - values[0] - net_flows),
+        "twr": total,
+        "twr_annualized": _annualize(total, span_days),
+        "irr": xirr(cash_flows[keep], years[keep]),
+    }
+    if series:
+        result["series"] = {
+            "date": [d.isoformat() for d in days],
+            "value": values[1:].tolist(),
+            "flow": flows[1:].tolist(),
+            "twr": cumulative_twr[1:].tolist(),
+        }
+    return result
+
+async def wallet_returns(
+    db: AsyncSession,
+    wallet: WalletDB,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    series: bool = False
+) -> Dict[str, Any]:
+    """Memoized `compute`: recomputed only when the wallet has new postings or trades"""
+    # An open-ended range is keyed as such, so polling "up to now" hits the memo
+    key = (wallet.id, start, end, series)
+    start, end = default_range(start, end)
+    mark = await watermark(db, wallet.id)
+    now = time.monotonic()
+    cached = _memo.get(key)
+    if cached is not None:
+        cached_mark, expires, result = cached
+        if cached_mark == mark and (expires is None or now < expires):
+            _memo.move_to_end(key)
+            return {**result, "cached": True}
+
+    result = await compute(db, wallet, start, end, series)
+    live = end.date() >= datetime.now(timezone.utc).date()
+    _memo[key] = (mark, now + RETURNS_LIVE_TTL if live else None, result)
+    _memo.move_to_end(key)
+    while len(_memo) > MEMO_SIZE:
+        _memo.popitem(last=False)
+    return {**result, "cached": False}
@@ -0,0 +1,195 @@
+"""
+Monthly transaction rollups.
+
+`transaction_rollups` holds one row per (month, wallet, category, type) with
+the running total and count of its transactions. Every write path adds or
+subtracts its transactions here in the same database transaction, with an
+atomic `total = total + delta` upsert, so totals and per-period analytics read
+a few hundred rollup rows instead of scanning every transaction.
+
+Transactions without a wallet are filed under wallet_id 0. After upgrading,
+or if the table is ever suspected to have drifted, rebuild it with
+    python maintenance.py rebuild-rollups
+"""
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import case, func, literal_column, select, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db_models import TransactionDB, TransactionRollupDB, TransactionType
+from app.services.timestamps import utc
+
+NO_WALLET = 0
+
+RollupKey = Tuple[date, int, str, TransactionType]
+
+def month_start(value: datetime) -> date:
+    """First day of the (UTC) month a transaction date falls in"""
+    value = utc(value)
+    return date(value.year, value.month, 1)
+
+def rollup_key(month_date: datetime, wallet_id, category: str, type_: TransactionType) -> RollupKey:
+    return (month_start(month_date), wallet_id or NO_WALLET, category, TransactionType(type_))
+
+def track(deltas: Dict[RollupKey, List[float]], transaction, sign: int = 1):
+    """Accumulate one transaction (sign -1 to remove it) into pending deltas"""
+    key = rollup_key(transaction.date, transaction.wallet_id, transaction.category, transaction.type)
+    delta = deltas.setdefault(key, [0.0, 0])
+    delta[0] += sign * transaction.amount
+    delta[1] += sign
+
+async def apply(db: AsyncSession, deltas: Dict[RollupKey, List[float]]):
+    """Upsert pending deltas in one statement; the caller commits"""
+    rows = [
+        {"month": month, "wallet_id": wallet_id, "category": category, "type": type_, "total": total, "count": count}
+        for (month, wallet_id, category, type_), (total, count) in deltas.items()
+        if total or count
+    ]
+    if not rows:
+        return
+    stmt = insert(TransactionRollupDB).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["month", "wallet_id", "category", "type"],
+        set_={
+            "total": TransactionRollupDB.total + stmt.excluded.total,
+            "count": TransactionRollupDB.count + stmt.excluded.count,
+        }
+    )
+    await db.execute(stmt)
+
+async def add(db: AsyncSession, transactions: Iterable, sign: int = 1):
+    """Add (or with sign=-1 remove) transactions to the rollups"""
+    deltas: Dict[RollupKey, List[float]] = {}
+    for transaction in transactions:
+        track(deltas, transaction, sign)
+    await apply(db, deltas)
+
+async def move_wallet(db: AsyncSession, wallet_id: int, to_wallet_id: int = NO_WALLET):
+    """Re-file a wallet's rollups, e.g. when deleting the wallet detaches its transactions"""
+    rows = await db.execute(
+        select(
+            TransactionRollupDB.month, TransactionRollupDB.category, TransactionRollupDB.type,
+            TransactionRollupDB.total, TransactionRollupDB.count
+        ).where(TransactionRollupDB.wallet_id == wallet_id)
+    )
+    deltas = {
+        (month, to_wallet_id, category, type_): [total, count]
+        for month, category, type_, total, count in rows.all()
+    }
+    await db.execute(TransactionRollupDB.__table__.delete().where(TransactionRollupDB.wallet_id == wallet_id))
+    await apply(db, deltas)
+
+REBUILD_SQL = text("""
+    INSERT INTO transaction_rollups (month, wallet_id, category, type, total, count)
+    SELECT date_trunc('month', date AT TIME ZONE 'UTC')::date, coalesce(wallet_id, 0), category, type,
+           sum(amount), count(*)
+    FROM transactions
+    GROUP BY 1, 2, 3, 4
+""")
+
+async def rebuild(db: AsyncSession) -> int:
+    """Recompute every rollup from the transactions table (one transaction)"""
+    await db.execute(text("LOCK TABLE transactions IN SHARE MODE"))
+    await db.execute(TransactionRollupDB.__table__.delete())
+    result = await db.execute(REBUILD_SQL)
+    await db.commit()
+    return result.rowcount
+
+async def totals_by_type(db: AsyncSession) -> Dict[TransactionType, float]:
+    result = await db.execute(
+        select(TransactionRollupDB.type, func.sum(TransactionRollupDB.total))
+        .group_by(TransactionRollupDB.type)
+    )
+    return {TransactionType(type_): total or 0.0 for type_, total in result.all()}
+
+ANALYTICS_GROUPS = ("month", "category", "wallet")
+
+def _is_month_aligned(start: Optional[date], end: Optional[date]) -> bool:
+    """Whether [start, end] (inclusive days) covers whole months only"""
+    return (start is None or start.day == 1) and (end is None or (end + timedelta(days=1)).day == 1)
+
+def _utc_midnight(day: date) -> datetime:
+    return datetime(day.year, day.month, day.day, tzinfo=timezone.utc)
+
+async def analytics(
+    db: AsyncSession,
+    group_by: List[str],
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    wallet_id: Optional[int] = None,
+    category: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Income/expense totals grouped by any of month, category and wallet, as
+    parallel arrays. Whole-month ranges are read from the rollups; other
+    ranges aggregate the transactions in SQL.
+    """
+    if _is_month_aligned(start, end):
+        source = "rollups"
+        model = TransactionRollupDB
+        columns = {
+            "month": TransactionRollupDB.month,
+            "category": TransactionRollupDB.category,
+            "wallet": TransactionRollupDB.wallet_id,
+        }
+        amount, count = TransactionRollupDB.total, func.sum(TransactionRollupDB.count)
+        filters = []
+        if start is not None:
+            filters.append(TransactionRollupDB.month >= start)
+        if end is not None:
+            filters.append(TransactionRollupDB.month <= end)
+        if wallet_id is not None:
+            filters.append(TransactionRollupDB.wallet_id == wallet_id)
+    else:
+        source = "transactions"
+        model = TransactionDB
+        columns = {
+            # Literal arguments so the GROUP BY expression matches the select list exactly
+            "month": func.date_trunc(literal_column("'month'"), func.timezone(literal_column("'UTC'"), TransactionDB.date)),
+            "category": TransactionDB.category,
+            "wallet": func.coalesce(TransactionDB.wallet_id, literal_column(str(NO_WALLET))),
+        }
+        amount, count = TransactionDB.amount, func.count(TransactionDB.id)
+        filters = []
+        if start is not None:
+            filters.append(TransactionDB.date >= _utc_midnight(start))
+        if end is not None:
+            filters.append(TransactionDB.date < _utc_midnight(end + timedelta(days=1)))
+        if wallet_id is not None:
+            filters.append(TransactionDB.wallet_id == wallet_id)
+    if category is not None:
+        filters.append(model.category == category)
+
+    group_columns = [columns[name].label(name) for name in group_by]
+    stmt = (
+        select(
+            *group_columns,
+            func.coalesce(func.sum(case((model.type == TransactionType.income, amount), else_=0.0)), 0.0),
+            func.coalesce(func.sum(case((model.type == TransactionType.expense, amount), else_=0.0)), 0.0),
+            count
+        )
+        .where(*filters)
+        .group_by(*group_columns)
+        .having(count > 0)
+        .order_by(*group_columns)
+    )
+    rows = (await db.execute(stmt)).all()
+
+    data: Dict[str, List[Any]] = {name: [] for name in group_by}
+    data.update({"income": [], "expense": [], "net": [], "count": []})
+    width = len(group_by)
+    for row in rows:
+        for name, value in zip(group_by, row[:width]):
+            if name == "month":
+                value = value.strftime("%Y-%m")
+            elif name == "wallet":
+                value = value or None
+            data[name].append(value)
+        income, expense, row_count = row[width:]
+        data["income"].append(income)
+        data["expense"].append(expense)
+        data["net"].append(income - expense)
+        data["count"].append(row_count)
+    return {"group_by": group_by, "source": source, "rows": len(rows), **data}
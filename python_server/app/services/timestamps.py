@@ -0,0 +1,18 @@
+"""
+UTC timestamps.
+
+A naive datetime (a request body without an offset) is taken to be UTC
+everywhere: in Python, when a change is filed under its day or month
+(ledger snapshots, net-worth days, rollup months), and in PostgreSQL, whose
+sessions run in UTC (see app.database), so the rebuild queries'
+`AT TIME ZONE 'UTC'` files it under the same day. New rows are stamped with
+`now()`, which is aware.
+"""
+from datetime import datetime, timezone
+
+def utc(value: datetime) -> datetime:
+    """`value` in UTC; naive values are already UTC"""
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value.astimezone(timezone.utc)
+
+def now() -> datetime:
+    return datetime.now(timezone.utc)
@@ -0,0 +1,197 @@
+"""
+Streaming bulk import of transactions.
+
+The request body is read chunk by chunk and split into records as it
+arrives, so memory stays bounded by the batch size, not the file size.
+Accepted formats:
+
+  csv     header row with type, amount, description, category, date and
+          optionally wallet_id; quoted fields may contain commas and newlines
+  ndjson  one JSON object per line with the same fields
+
+Valid rows are inserted in batches with one executemany INSERT. Each batch
+applies its net wallet balance and rollup deltas once, writes its ledger
+postings in one more INSERT and commits on its own. A batch that fails is
+rolled back alone and its rows are reported as errors, so the report always
+says which rows were imported and a retry can resend exactly the failed ones.
+"""
+import codecs
+import csv
+import json
+from types import SimpleNamespace
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from pydantic import ValidationError
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db_models import TransactionDB, TransactionType, WalletDB
+from app.models import TransactionCreate
+from app.services import balances, ledger, rollups
+
+FORMATS = ("csv", "ndjson")
+MAX_REPORTED_ERRORS = 100
+
+class RowError(Exception):
+    pass
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """Decode a byte stream incrementally and yield it line by line"""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        lines = pending.split("\n")
+        pending = lines.pop()
+        for line in lines:
+            yield line.rstrip("\r")
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending.rstrip("\r")
+
+async def iter_csv_records(lines: AsyncIterator[str]) -> AsyncIterator[Dict[str, Any]]:
+    """Dicts keyed by the header row; a record continues over lines while a quote is open"""
+    header: Optional[List[str]] = None
+    record = ""
+    async for line in lines:
+        record = f"{record}\n{line}" if record else line
+        if record.count('"') % 2:
+            continue  # Inside a quoted field that contains a newline
+        text, record = record, ""
+        if not text.strip():
+            continue
+        values = next(csv.reader([text]))
+        if header is None:
+            header = [name.strip().lower() for name in values]
+            continue
+        yield {name: (value.strip() or None) for name, value in zip(header, values)}
+    if record.strip():
+        yield {"_error": "Unterminated quoted field at end of file"}
+
+async def iter_ndjson_records(lines: AsyncIterator[str]) -> AsyncIterator[Dict[str, Any]]:
+    async for line in lines:
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield {"_error": f"Invalid JSON: {e}"}
+            continue
+        yield record if isinstance(record, dict) else {"_error": "Expected a JSON object"}
+
+def parse_row(record: Dict[str, Any], wallet_types: Dict[int, Any]) -> Dict[str, Any]:
+    """Validate one record into TransactionDB column values"""
+    if "_error" in record:
+        raise RowError(record["_error"])
+    date = record.get("date")
+    if isinstance(date, str) and len(date) == 10:
+        record["date"] = f"{date}T00:00:00"  # Statements usually carry a bare date
+    try:
+        transaction = TransactionCreate.model_validate(record)
+    except ValidationError as e:
+        first = e.errors()[0]
+        raise RowError(f"{'.'.join(str(p) for p in first['loc'])}: {first['msg']}")
+    try:
+        transaction_type = TransactionType(transaction.type)
+    except ValueError:
+        raise RowError("Invalid transaction type. Must be 'income' or 'expense'")
+    if transaction.wallet_id and transaction.wallet_id not in wallet_types:
+        raise RowError(f"Wallet {transaction.wallet_id} not found")
+    return {
+        "type": transaction_type,
+        "amount": transaction.amount,
+        "description": transaction.description,
+        "category": transaction.category,
+        "wallet_id": transaction.wallet_id or None,
+        "date": transaction.date,
+    }
+
+class ImportReport:
+    def __init__(self):
+        self.rows = 0
+        self.inserted = 0
+        self.failed = 0
+        self.batches = 0
+        self.failed_batches = 0
+        self.errors: List[Dict[str, Any]] = []
+
+    def error(self, row: int, message: str):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"row": row, "error": message})
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "rows": self.rows,
+            "inserted": self.inserted,
+            "failed": self.failed,
+            "batches": self.batches,
+            "failed_batches": self.failed_batches,
+            "errors": sorted(self.errors, key=lambda error: error["row"]),
+            "errors_truncated": self.failed > len(self.errors),
+        }
+
+async def _flush(db: AsyncSession, numbered: List[Tuple[int, Dict[str, Any]]], wallet_types: Dict[int, Any], report: ImportReport):
+    """Insert and commit one batch of (row number, values); a failure rolls back this batch only"""
+    batch = [row for _, row in numbered]
+    try:
+        await _insert(db, batch, wallet_types)
+        await db.commit()
+    except Exception as e:
+        await db.rollback()
+        report.failed_batches += 1
+        for number, _ in numbered:
+            report.error(number, f"Not imported, batch failed: {e}")
+        return
+    report.inserted += len(batch)
+    report.batches += 1
+
+async def _insert(db: AsyncSession, batch: List[Dict[str, Any]], wallet_types: Dict[int, Any]):
+    # Core insert: the ORM bulk path splits batches wherever wallet_id switches to None
+    table = TransactionDB.__table__
+    ids = (await db.execute(insert(table).returning(table.c.id, sort_by_parameter_order=True), batch)).scalars().all()
+
+    wallet_deltas: balances.WalletDeltas = {}
+    rollup_deltas: Dict[rollups.RollupKey, List[float]] = {}
+    postings: List[Dict[str, Any]] = []
+    for row, transaction_id in zip(batch, ids):
+        if row["wallet_id"]:
+            deltas: balances.WalletDeltas = {}
+            effect = balances.transaction_effect(wallet_types[row["wallet_id"]], row["type"], row["amount"])
+            balances.track(deltas, row["wallet_id"], effect)
+            balances.track(wallet_deltas, row["wallet_id"], effect)
+            postings.extend(ledger.entry_rows(
+                ledger.transaction_kind(row["type"]), row["date"], deltas, "transaction", transaction_id
+            ))
+        rollups.track(rollup_deltas, SimpleNamespace(**row))
+    await balances.apply_deltas(db, wallet_deltas)
+    await ledger.write(db, postings)
+    await rollups.apply(db, rollup_deltas)
+
+async def import_transactions(
+    db: AsyncSession,
+    chunks: AsyncIterator[bytes],
+    format: str,
+    batch_size: int = 1000
+) -> Dict[str, Any]:
+    """Stream-parse, validate and insert; returns counts and the first per-row errors"""
+    result = await db.execute(select(WalletDB.id, WalletDB.type))
+    wallet_types = {wallet_id: wallet_type for wallet_id, wallet_type in result.all()}
+
+    lines = iter_lines(chunks)
+    records = iter_csv_records(lines) if format == "csv" else iter_ndjson_records(lines)
+    report = ImportReport()
+    batch: List[Tuple[int, Dict[str, Any]]] = []
+    async for record in records:
+        report.rows += 1
+        try:
+            batch.append((report.rows, parse_row(record, wallet_types)))
+        except RowError as e:
+            report.error(report.rows, str(e))
+            continue
+        if len(batch) >= batch_size:
+            await _flush(db, batch, wallet_types, report)
+            batch = []
+    if batch:
+        await _flush(db, batch, wallet_types, report)
+    return report.as_dict()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Event-loop latency benchmark.
+
+Runs a mixed load against the API in-process (httpx ASGITransport, one event
+loop, like a single uvicorn worker) while slow Postgres queries are in flight,
+and reports latency percentiles per route for two modes:
+
+  sync   - the old pattern: a blocking Session query inside an async handler
+  async  - the AsyncSession path the routers use now
+
+In sync mode every pg_sleep() freezes the loop, so /health and the list
+endpoints queue up behind it; in async mode they are served while the slow
+queries wait on the socket.
+
+Usage (needs the PostgreSQL database from .env):
+    python benchmarks/event_loop_latency.py
+    python benchmarks/event_loop_latency.py --slow-ms 500 --slow-workers 4 --duration 20
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+from fastapi import FastAPI
+from sqlalchemy import text
+
+from app.database import SessionLocal, AsyncSessionLocal, async_engine
+from app.routers import transactions, wallets, notes
+
+FAST_ROUTES = ["/health", "/api/wallets", "/api/transactions", "/api/notes"]
+
+def build_app(mode: str, slow_seconds: float) -> FastAPI:
+    """Build an app with the real list routers plus a slow-query route"""
+    app = FastAPI()
+    app.include_router(transactions.router)
+    app.include_router(wallets.router)
+    app.include_router(notes.router)
+
+    @app.get("/health")
+    async def health_check():
+        return {"status": "healthy"}
+
+    if mode == "sync":
+        @app.get("/bench/slow")
+        async def slow_query():
+            db = SessionLocal()
+            try:
+                db.execute(text("SELECT pg_sleep(:s)"), {"s": slow_seconds})
+            finally:
+                db.close()
+            return {"ok": True}
+    else:
+        @app.get("/bench/slow")
+        async def slow_query():
+            async with AsyncSessionLocal() as db:
+                await db.execute(text("SELECT pg_sleep(:s)"), {"s": slow_seconds})
+            return {"ok": True}
+
+    return app
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+async def worker(client, routes, deadline, samples):
+    i = 0
+    while time.perf_counter() < deadline:
+        route = routes[i % len(routes)]
+        i += 1
+        start = time.perf_counter()
+        await client.get(route)
+        samples.setdefault(route, []).append((time.perf_counter() - start) * 1000)
+
+async def run_mode(mode: str, args) -> dict:
+    app = build_app(mode, args.slow_ms / 1000.0)
+    samples = {}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+        # Warm the pools so connection setup is not measured
+        for route in FAST_ROUTES:
+            await client.get(route)
+        deadline = time.perf_counter() + args.duration
+        tasks = [worker(client, ["/bench/slow"], deadline, samples) for _ in range(args.slow_workers)]
+        tasks += [worker(client, FAST_ROUTES, deadline, samples) for _ in range(args.fast_workers)]
+        await asyncio.gather(*tasks)
+    return samples
+
+def report(mode: str, samples: dict):
+    print(f"\n[{mode}]")
+    print(f"{'route':<22}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for route in FAST_ROUTES + ["/bench/slow"]:
+        values = samples.get(route, [])
+        print(
+            f"{route:<22}{len(values):>8}"
+            f"{percentile(values, 50):>10.1f}{percentile(values, 95):>10.1f}{percentile(values, 99):>10.1f}"
+        )
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=["sync", "async", "both"], default="both")
+    parser.add_argument("--slow-ms", type=int, default=200, help="pg_sleep duration of the slow query")
+    parser.add_argument("--slow-workers", type=int, default=2, help="concurrent clients issuing slow queries")
+    parser.add_argument("--fast-workers", type=int, default=16, help="concurrent clients on the list/health routes")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per mode")
+    args = parser.parse_args()
+
+    modes = ["sync", "async"] if args.mode == "both" else [args.mode]
+    for mode in modes:
+        report(mode, await run_mode(mode, args))
+    await async_engine.dispose()
+
+if __name__ == "__main__":
+    asyncio.run(main())
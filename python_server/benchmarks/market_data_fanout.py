@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Market-data fan-out benchmark.
+
+Runs N concurrent pollers against /api/market-data/all and /quotes in-process
+(httpx ASGITransport, one event loop) with the local replay provider standing
+in for CoinGecko/Coinbase/Yahoo, and reports how many upstream requests the
+quote cache let through, the cache counters and per-route latency percentiles.
+No network or database is needed, and a fixed seed makes runs repeatable.
+
+  nocache - quote cache TTL 0: every poll goes upstream (single-flight only)
+  cache   - the configured TTL/stale window the service runs with
+
+Usage:
+    python benchmarks/market_data_fanout.py
+    python benchmarks/market_data_fanout.py --clients 200 --latency-ms 300 --error-rate 0.05
+    python benchmarks/market_data_fanout.py --recording quotes.json --mode cache
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+from fastapi import FastAPI
+
+from app.routers import market_data
+from app.services.market_providers import LocalReplayProvider, set_provider
+from app.services.quote_cache import QuoteCache
+
+QUOTE_SYMBOLS = "BTC,ETH,SOL,AAPL,MSFT,NVDA,TSLA,GOLD"
+ROUTES = ["/api/market-data/all", f"/api/market-data/quotes?symbols={QUOTE_SYMBOLS}"]
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+async def poller(client, deadline, interval, samples, offset):
+    i = offset
+    while time.perf_counter() < deadline:
+        route = ROUTES[i % len(ROUTES)]
+        i += 1
+        start = time.perf_counter()
+        await client.get(route)
+        samples.setdefault(route, []).append((time.perf_counter() - start) * 1000)
+        if interval:
+            await asyncio.sleep(interval)
+
+async def run_mode(mode: str, args) -> dict:
+    provider = LocalReplayProvider(
+        path=args.recording,
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        seed=args.seed
+    )
+    set_provider(provider)
+    ttl = 0 if mode == "nocache" else args.ttl
+    market_data.quote_cache = QuoteCache(ttl=ttl, stale_ttl=0 if mode == "nocache" else args.stale_ttl)
+
+    app = FastAPI()
+    app.include_router(market_data.router)
+    samples = {}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+        deadline = time.perf_counter() + args.duration
+        await asyncio.gather(*[
+            poller(client, deadline, args.poll_interval, samples, n) for n in range(args.clients)
+        ])
+    return {
+        "samples": samples,
+        "provider": provider.stats(),
+        "cache": market_data.quote_cache.stats(),
+    }
+
+def report(mode: str, result: dict):
+    samples = result["samples"]
+    polls = sum(len(v) for v in samples.values())
+    provider, cache = result["provider"], result["cache"]
+    print(f"\n[{mode}]")
+    print(f"polls {polls}   upstream requests {provider['requests']} "
+          f"({provider['requests'] / max(polls, 1):.2f}/poll)   injected errors {provider['errors']}")
+    print(f"cache hits {cache['hits']}   stale hits {cache['stale_hits']}   misses {cache['misses']}   "
+          f"coalesced {cache['coalesced']}   upstream errors {cache['upstream_errors']}")
+    print(f"{'route':<34}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for route in ROUTES:
+        values = samples.get(route, [])
+        print(
+            f"{route.split('?')[0]:<34}{len(values):>8}"
+            f"{percentile(values, 50):>10.1f}{percentile(values, 95):>10.1f}{percentile(values, 99):>10.1f}"
+        )
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=["nocache", "cache", "both"], default="both")
+    parser.add_argument("--clients", type=int, default=50, help="concurrent pollers")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per mode")
+    parser.add_argument("--poll-interval", type=float, default=0.1, help="pause between one client's polls")
+    parser.add_argument("--latency-ms", type=float, default=150, help="simulated upstream latency")
+    parser.add_argument("--jitter-ms", type=float, default=50, help="random extra upstream latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of upstream requests that fail")
+    parser.add_argument("--ttl", type=float, default=market_data.quote_cache.ttl, help="quote cache TTL in cache mode")
+    parser.add_argument("--stale-ttl", type=float, default=market_data.quote_cache.stale_ttl)
+    parser.add_argument("--recording", help="JSON file of recorded quotes (default: synthetic)")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    modes = ["nocache", "cache"] if args.mode == "both" else [args.mode]
+    for mode in modes:
+        report(mode, await run_mode(mode, args))
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Wallet balance concurrency stress test.
+
+Starts N parallel writers against the real routers (in-process, httpx
+ASGITransport) that hammer the same few wallets with income/expense
+transactions, transfers in both directions between the same pair of wallets
+(the classic deadlock shape) and transfers into a stock wallet. Every
+successful request's effect is tallied client-side; at the end the stored
+balances must equal the starting balances plus that tally exactly. Any
+difference is a lost update.
+
+Run it against a scratch database: it leaves its wallets (named stress-*) and
+their transactions behind.
+
+Usage (needs the PostgreSQL database from .env):
+    python benchmarks/wallet_concurrency.py
+    python benchmarks/wallet_concurrency.py --writers 100 --ops 50
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+from fastapi import FastAPI
+
+from app.database import async_engine
+from app.routers import transactions, transfers, wallets
+
+START_BALANCE = 1_000_000.0
+
+def build_app() -> FastAPI:
+    app = FastAPI()
+    app.include_router(transactions.router)
+    app.include_router(transfers.router)
+    app.include_router(wallets.router)
+    return app
+
+async def create_wallets(client, tag):
+    created = {}
+    for key, body in {
+        "a": {"name": f"stress-{tag}-a", "type": "Bank"},
+        "b": {"name": f"stress-{tag}-b", "type": "Bank"},
+        "s": {"name": f"stress-{tag}-s", "type": "Stock", "cash": START_BALANCE},
+    }.items():
+        response = await client.post("/api/wallets", json=body)
+        response.raise_for_status()
+        # New wallets start at zero; the opening balance is set by an update
+        response = await client.put(f"/api/wallets/{response.json()['id']}", json={"balance": START_BALANCE})
+        response.raise_for_status()
+        created[key] = response.json()
+    return created
+
+async def writer(client, ids, ops, rng, expected, outcomes, latencies):
+    for _ in range(ops):
+        amount = float(rng.randint(1, 100))
+        op = rng.choice(["income", "expense", "a_to_b", "b_to_a", "b_to_s"])
+        if op in ("income", "expense"):
+            request = client.post("/api/transactions", json={
+                "type": op, "amount": amount, "description": "stress", "category": "Stress",
+                "wallet_id": ids["a"], "date": "2025-01-01T00:00:00"
+            })
+            effect = {"a": amount if op == "income" else -amount}
+        else:
+            source, target = op.split("_to_")
+            request = client.post("/api/transfers", json={
+                "from_wallet_id": ids[source], "to_wallet_id": ids[target], "amount": amount
+            })
+            effect = {source: -amount, target: amount}
+        start = time.perf_counter()
+        response = await request
+        latencies.append((time.perf_counter() - start) * 1000)
+        outcomes[response.status_code] += 1
+        if response.status_code == 200:
+            for key, delta in effect.items():
+                expected[key] += delta
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--writers", type=int, default=100, help="concurrent writers")
+    parser.add_argument("--ops", type=int, default=20, help="requests per writer")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    transport = httpx.ASGITransport(app=build_app())
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+        created = await create_wallets(client, int(time.time()))
+        ids = {key: wallet["id"] for key, wallet in created.items()}
+        expected = {key: 0.0 for key in ids}
+        outcomes, latencies = Counter(), []
+
+        start = time.perf_counter()
+        await asyncio.gather(*[
+            writer(client, ids, args.ops, random.Random(args.seed + n), expected, outcomes, latencies)
+            for n in range(args.writers)
+        ])
+        elapsed = time.perf_counter() - start
+
+        failures = 0
+        print(f"{args.writers} writers x {args.ops} ops in {elapsed:.2f}s "
+              f"({len(latencies) / elapsed:.0f} req/s), responses {dict(outcomes)}")
+        latencies.sort()
+        print(f"latency p50 {latencies[len(latencies) // 2]:.1f} ms, p99 {latencies[int(len(latencies) * 0.99)]:.1f} ms")
+        for key, wallet_id in ids.items():
+            wallet = (await client.get(f"/api/wallets/{wallet_id}")).json()
+            want = START_BALANCE + expected[key]
+            ok = abs(wallet["balance"] - want) < 1e-6
+            if key == "s":
+                ok = ok and abs(wallet["cash"] - want) < 1e-6
+            failures += not ok
+            print(f"{'✓' if ok else '✗'} wallet {key} ({wallet_id}): balance {wallet['balance']:.2f}, expected {want:.2f}")
+    await async_engine.dispose()
+    if failures:
+        print("✗ Lost updates detected")
+        sys.exit(1)
+    print("✓ No lost updates")
+
+if __name__ == "__main__":
+    asyncio.run(main())
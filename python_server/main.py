@@ -1,23 +1,47 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from contextlib import asynccontextmanager
 import os
 from dotenv import load_dotenv
 from app.database import engine, Base
-from app.routers import tasks, transactions, assets, wallets, notes, stocks, budget_plans, users, transfers, market_data
+from app import schema_upgrades
+from app.routers import tasks, transactions, assets, wallets, notes, stocks, budget_plans, users, transfers, market_data, export, net_worth
+from app.services import http_clients
 
 load_dotenv()
 
 # Create database tables (only if database is available)
 try:
     Base.metadata.create_all(bind=engine)
+    # Columns added to tables create_all made before they existed
+    with engine.begin() as conn:
+        schema_upgrades.upgrade(conn)
 except Exception as e:
     print(f"Warning: Could not connect to database: {e}")
     print("Server will start, but database operations will fail until PostgreSQL is set up.")
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Pooled, keep-alive HTTP clients for the market-data upstreams
+    await http_clients.start_clients()
+    # Keep the market watchlist warm so reads are served from memory
+    if os.getenv("MARKET_REFRESH_ENABLED", "1") != "0":
+        market_data.market_refresher.start()
+        market_data.price_history_compactor.start()
+    # Keep today's FX rates fresh for the asset and net-worth conversions
+    if os.getenv("FX_REFRESH_ENABLED", "1") != "0":
+        market_data.fx_refresher.start()
+    yield
+    await market_data.fx_refresher.stop()
+    await market_data.price_history_compactor.stop()
+    await market_data.market_refresher.stop()
+    await http_clients.close_clients()
+
 app = FastAPI(
     title="Valy Life API",
     description="Backend API for Valy Life application",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # CORS middleware to allow requests from Flutter app and Next.js website
@@ -28,6 +52,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 # Include routers
@@ -41,6 +66,8 @@ app.include_router(budget_plans.router)
 app.include_router(users.router)
 app.include_router(transfers.router)
 app.include_router(market_data.router)
+app.include_router(export.router)
+app.include_router(net_worth.router)
 
 @app.get("/")
 async def root():
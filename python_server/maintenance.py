@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""
+Maintenance commands for the Valy Life database.
+
+Usage:
+    python maintenance.py upgrade-schema
+    python maintenance.py create-indexes
+    python maintenance.py rebuild-rollups
+    python maintenance.py ledger-opening-balances
+    python maintenance.py snapshot-ledger [--as-of 2025-01-01T00:00:00+00:00]
+    python maintenance.py reconcile-wallets [--repair]
+    python maintenance.py purge-idempotency-keys [--hours 24]
+    python maintenance.py link-transfers
+    python maintenance.py rebuild-positions
+    python maintenance.py rebuild-net-worth
+    python maintenance.py import-fx-rates --file rates.json
+    python maintenance.py record-fx-rates
+    python maintenance.py compact-price-history [--raw-days 7]
+    python maintenance.py record-market-data --output quotes.json [--samples 20 --interval 15 --currencies VND,EUR]
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+from datetime import date, datetime
+from dotenv import load_dotenv
+
+from app.database import AsyncSessionLocal, async_engine, Base
+from app import db_models, schema_upgrades  # noqa: F401  (db_models registers the tables on Base)
+from app.services import fx, idempotency, ledger, net_worth, positions, price_history, reconciliation, rollups
+from app.services.http_clients import close_clients
+from app.services.market_providers import HttpMarketDataProvider, get_provider
+
+load_dotenv()
+
+async def upgrade_schema(args=None):
+    """Create missing tables, then add columns newer versions added to existing ones"""
+    async with async_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        count = await conn.run_sync(schema_upgrades.upgrade)
+    print(f"✓ Schema up to date ({count} upgrade statement(s) checked)")
+
+async def create_indexes(args):
+    """Add indexes declared on the models to tables create_all made before they existed"""
+    def create(conn):
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
+    async with async_engine.begin() as conn:
+        await conn.run_sync(create)
+    print("✓ Indexes up to date")
+
+async def rebuild_rollups(args):
+    async with AsyncSessionLocal() as db:
+        count = await rollups.rebuild(db)
+    print(f"✓ Rebuilt {count} transaction rollup row(s)")
+
+async def ledger_opening_balances(args):
+    async with AsyncSessionLocal() as db:
+        count = await ledger.post_opening_balances(db)
+    print(f"✓ Posted opening balances for {count} wallet(s)")
+
+async def snapshot_ledger(args):
+    async with AsyncSessionLocal() as db:
+        count = await ledger.snapshot(db, args.as_of)
+    print(f"✓ Wrote {count} ledger snapshot(s)")
+
+async def reconcile_wallets(args):
+    async with AsyncSessionLocal() as db:
+        report = await reconciliation.reconcile(db, repair=args.repair)
+    for row in report["sources"]:
+        print(f"  {row['source_type']} {row['source_id']} (wallet {row['wallet_id']}) {row['field']}: "
+              f"posted {row['posted']:.2f}, expected {row['expected']:.2f}")
+    for row in report["wallets"]:
+        print(f"  wallet {row['wallet_id']} {row['name']} {row['field']}: "
+              f"stored {row['stored']:.2f}, ledger {row['expected']:.2f}")
+    if report["wallets_without_ledger"]:
+        print(f"  ! wallet(s) {report['wallets_without_ledger']} have no postings: run ledger-opening-balances")
+    print(f"{'✓' if args.repair else '•'} {report['source_discrepancies']} source and "
+          f"{report['wallet_discrepancies']} wallet discrepanc(ies)"
+          + (f"; posted {report['corrections_posted']} correction(s), rewrote {report['wallets_repaired']} wallet(s)"
+             if args.repair else ""))
+
+async def purge_idempotency_keys(args):
+    async with AsyncSessionLocal() as db:
+        count = await idempotency.purge(db, args.hours)
+    print(f"✓ Purged {count} idempotency key(s)")
+
+async def link_transfers(args):
+    """Pair transfer legs written before transfers were recorded and link them to a transfer row"""
+    await upgrade_schema()  # transactions.transfer_id may not exist yet
+    from sqlalchemy import and_, insert, select, update
+    from sqlalchemy.orm import aliased
+    from app.db_models import TransactionDB, TransactionType, TransferDB
+    expense, income = aliased(TransactionDB), aliased(TransactionDB)
+    async with AsyncSessionLocal() as db:
+        # Both legs were inserted back to back with the same amount and timestamp
+        pairs = (await db.execute(
+            select(expense.id, income.id, expense.wallet_id, income.wallet_id, expense.amount, expense.description, expense.date)
+            .join(income, and_(
+                income.id == expense.id + 1, income.type == TransactionType.income, income.category == "Transfer",
+                income.transfer_id.is_(None), income.amount == expense.amount, income.date == expense.date
+            ))
+            .where(expense.type == TransactionType.expense, expense.category == "Transfer", expense.transfer_id.is_(None))
+            .order_by(expense.id)
+        )).all()
+        if pairs:
+            table = TransferDB.__table__
+            ids = (await db.execute(
+                insert(table).returning(table.c.id, sort_by_parameter_order=True),
+                [
+                    {"from_wallet_id": from_id, "to_wallet_id": to_id, "amount": amount, "description": description, "date": date}
+                    for _, _, from_id, to_id, amount, description, date in pairs
+                ]
+            )).scalars().all()
+            await db.execute(update(TransactionDB), [
+                {"id": leg_id, "transfer_id": transfer_id}
+                for (expense_id, income_id, *_), transfer_id in zip(pairs, ids)
+                for leg_id in (expense_id, income_id)
+            ])
+            await db.commit()
+    print(f"✓ Linked {len(pairs)} transfer(s)")
+
+async def rebuild_positions(args):
+    await upgrade_schema()  # stocks.remaining_volume may not exist yet
+    async with AsyncSessionLocal() as db:
+        count = await positions.rebuild(db)
+    print(f"✓ Rebuilt {count} stock position(s)")
+
+async def rebuild_net_worth(args):
+    async with AsyncSessionLocal() as db:
+        count = await net_worth.rebuild(db)
+    print(f"✓ Rebuilt {count} net-worth day(s)")
+
+async def import_fx_rates(args):
+    """Load daily FX history from a JSON file shaped like {"2025-01-02": {"VND": 25380, "EUR": 0.97}, ...}"""
+    with open(args.file) as f:
+        history = json.load(f)
+    count = 0
+    async with AsyncSessionLocal() as db:
+        for day, rates in sorted(history.items()):
+            count += await fx.record(db, date.fromisoformat(day), rates)
+        await db.commit()
+    print(f"✓ Imported {count} FX rate(s) over {len(history)} day(s)")
+
+async def record_fx_rates(args):
+    """Record today's rates of the tracked currencies from the active market-data provider"""
+    try:
+        async with AsyncSessionLocal() as db:
+            count = await fx.refresh(db, get_provider())
+            await db.commit()
+    finally:
+        await close_clients()
+    print(f"✓ Recorded {count} FX rate(s) for {fx.today()}")
+
+async def compact_price_history(args):
+    async with AsyncSessionLocal() as db:
+        result = await price_history.compact(db, raw_days=args.raw_days)
+    print(f"✓ Compacted {result['chunks']} raw chunk(s) into {result['bars']} hourly bar(s)")
+
+async def record_market_data(args):
+    """Sample live quotes into a file the local replay provider can serve"""
+    from app.routers.market_data import MARKET_WATCHLIST
+    provider = HttpMarketDataProvider()
+    crypto = sorted({s for source, s in MARKET_WATCHLIST.values() if source == "crypto"})
+    stocks = sorted({s for source, s in MARKET_WATCHLIST.values() if source == "stock"})
+    currencies = [code.strip().upper() for code in (args.currencies or "").split(",") if code.strip()]
+    recording = {"crypto": {}, "gold": {}, "stock": {}, "fx": {}}
+    try:
+        for i in range(args.samples):
+            if i:
+                await asyncio.sleep(args.interval)
+            quotes = {
+                "crypto": await provider.fetch_crypto_prices(crypto),
+                "stock": await provider.fetch_stock_prices(stocks),
+                "gold": {"XAU": await provider.fetch_gold_price()},
+            }
+            rates = await provider.fetch_fx_rates() if currencies else {}
+            quotes["fx"] = {code: {"price": rates[code]} for code in currencies if code in rates}
+            for source, by_symbol in quotes.items():
+                for symbol, quote in by_symbol.items():
+                    if quote:
+                        recording[source].setdefault(symbol, []).append(
+                            {"price": quote["price"], "change_24h": quote.get("change_24h", 0)}
+                        )
+    finally:
+        await close_clients()
+    with open(args.output, "w") as f:
+        json.dump(recording, f, indent=2)
+    count = sum(len(q) for symbols in recording.values() for q in symbols.values())
+    print(f"✓ Recorded {count} quote(s) to {args.output}")
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Valy Life maintenance commands")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    upgrade = commands.add_parser("upgrade-schema", help="Add tables and columns introduced since the database was created")
+    upgrade.set_defaults(handler=upgrade_schema)
+
+    indexes = commands.add_parser("create-indexes", help="Create indexes missing from existing tables")
+    indexes.set_defaults(handler=create_indexes)
+
+    rebuild = commands.add_parser("rebuild-rollups", help="Recompute monthly transaction rollups from scratch")
+    rebuild.set_defaults(handler=rebuild_rollups)
+
+    opening = commands.add_parser("ledger-opening-balances",
+                                  help="Post wallet balances that predate the ledger as opening entries")
+    opening.set_defaults(handler=ledger_opening_balances)
+
+    snapshot = commands.add_parser("snapshot-ledger", help="Checkpoint wallet balances for fast as-of lookups")
+    snapshot.add_argument("--as-of", type=datetime.fromisoformat, default=None,
+                          help="Snapshot time (ISO 8601), defaults to now")
+    snapshot.set_defaults(handler=snapshot_ledger)
+
+    reconcile = commands.add_parser("reconcile-wallets", help="Check wallet balances against the ledger and its sources")
+    reconcile.add_argument("--repair", action="store_true", help="Fix what is found, in one transaction")
+    reconcile.set_defaults(handler=reconcile_wallets)
+
+    purge = commands.add_parser("purge-idempotency-keys", help="Delete stored idempotent responses past their TTL")
+    purge.add_argument("--hours", type=int, default=idempotency.IDEMPOTENCY_KEY_TTL_HOURS,
+                       help="Keep keys younger than this")
+    purge.set_defaults(handler=purge_idempotency_keys)
+
+    link = commands.add_parser("link-transfers", help="Link transfer legs recorded before the transfers table existed")
+    link.set_defaults(handler=link_transfers)
+
+    rebuild_pos = commands.add_parser("rebuild-positions", help="Recompute stock positions from the lots")
+    rebuild_pos.set_defaults(handler=rebuild_positions)
+
+    rebuild_worth = commands.add_parser("rebuild-net-worth", help="Recompute the daily net-worth timeline")
+    rebuild_worth.set_defaults(handler=rebuild_net_worth)
+
+    import_fx = commands.add_parser("import-fx-rates", help="Load daily FX rate history from a JSON file")
+    import_fx.add_argument("--file", required=True, help='JSON file: {"YYYY-MM-DD": {"VND": 25380, ...}, ...} (units per USD)')
+    import_fx.set_defaults(handler=import_fx_rates)
+
+    record_fx = commands.add_parser("record-fx-rates", help="Record today's FX rates of the currencies in use")
+    record_fx.set_defaults(handler=record_fx_rates)
+
+    compact = commands.add_parser("compact-price-history", help="Fold old raw quotes into hourly OHLC bars")
+    compact.add_argument("--raw-days", type=int, default=price_history.RAW_RETENTION_DAYS,
+                         help="Days of raw quotes to keep")
+    compact.set_defaults(handler=compact_price_history)
+
+    record = commands.add_parser("record-market-data", help="Record live watchlist quotes for MARKET_DATA_PROVIDER=local")
+    record.add_argument("--output", required=True, help="JSON file to write")
+    record.add_argument("--samples", type=int, default=20, help="Quotes to record per symbol")
+    record.add_argument("--interval", type=float, default=15, help="Seconds between samples")
+    record.add_argument("--currencies", default=os.getenv("FX_CURRENCIES", ""),
+                        help="Comma-separated FX rates to record too (default FX_CURRENCIES)")
+    record.set_defaults(handler=record_market_data)
+
+    return parser
+
+async def run(args):
+    try:
+        await args.handler(args)
+    finally:
+        await async_engine.dispose()
+
+if __name__ == "__main__":
+    args = build_parser().parse_args()
+    try:
+        asyncio.run(run(args))
+    except Exception as e:
+        print(f"✗ {args.command} failed: {e}")
+        sys.exit(1)
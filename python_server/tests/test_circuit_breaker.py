@@ -0,0 +1,84 @@
+import pytest
+
+from app.services import circuit_breaker
+from app.services.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(circuit_breaker.time, "monotonic", clock)
+    return clock
+
+def trip(breaker: CircuitBreaker):
+    for _ in range(breaker.failure_threshold):
+        assert breaker.allow()
+        breaker.record_failure("boom")
+
+def test_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker("test", failure_threshold=3, open_seconds=10)
+    breaker.record_failure("boom")
+    breaker.record_failure("boom")
+    assert breaker.state == CLOSED and breaker.allow()
+    breaker.record_failure("boom")
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+    assert breaker.status()["retry_in_seconds"] == 10
+    assert breaker.counters["rejected"] == 1
+
+def test_success_resets_the_failure_count(clock):
+    breaker = CircuitBreaker("test", failure_threshold=3)
+    breaker.record_failure("boom")
+    breaker.record_failure("boom")
+    breaker.record_success()
+    breaker.record_failure("boom")
+    assert breaker.state == CLOSED
+
+def test_half_open_admits_one_probe_and_success_closes(clock):
+    breaker = CircuitBreaker("test", failure_threshold=1, open_seconds=10)
+    trip(breaker)
+    clock.now += 10
+    assert breaker.allow()
+    assert breaker.state == HALF_OPEN
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CLOSED and breaker.allow()
+
+def test_failed_probes_double_the_open_period_up_to_the_max(clock):
+    breaker = CircuitBreaker("test", failure_threshold=1, open_seconds=10, max_open_seconds=35)
+    trip(breaker)
+    periods = []
+    for _ in range(4):
+        clock.now += breaker.status()["retry_in_seconds"]
+        assert breaker.allow()
+        breaker.record_failure("still down")
+        periods.append(breaker.status()["retry_in_seconds"])
+    assert periods == [20, 35, 35, 35]
+    clock.now += 35
+    assert breaker.allow()
+    breaker.record_success()
+    trip(breaker)
+    assert breaker.status()["retry_in_seconds"] == 10
+
+def test_retry_after_keeps_the_breaker_open_longer(clock):
+    breaker = CircuitBreaker("test", failure_threshold=3, open_seconds=10)
+    breaker.record_failure("429", retry_after=60)
+    assert breaker.state == OPEN
+    clock.now += 30
+    assert not breaker.allow()
+    clock.now += 30
+    assert breaker.allow()
+
+def test_released_probe_lets_another_through(clock):
+    breaker = CircuitBreaker("test", failure_threshold=1, open_seconds=10)
+    trip(breaker)
+    clock.now += 10
+    assert breaker.allow()
+    breaker.release()
+    assert breaker.allow()
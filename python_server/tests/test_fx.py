@@ -0,0 +1,54 @@
+from datetime import date
+
+import numpy as np
+import pytest
+
+from app.services.fx import RateTable
+
+ROWS = [
+    ("EUR", date(2024, 1, 10), 0.90),
+    ("EUR", date(2024, 1, 20), 0.92),
+    ("jpy", date(2024, 1, 15), 140.0),
+    ("JPY", date(2024, 1, 25), 150.0),
+    ("VND", date(2024, 1, 5), 24000.0),
+]
+
+@pytest.fixture
+def table():
+    return RateTable(ROWS)
+
+def test_a_day_takes_the_latest_rate_on_or_before_it(table):
+    rates = table.rates(["EUR", "EUR", "EUR", "JPY"], [date(2024, 1, 10), date(2024, 1, 19), date(2024, 3, 1), date(2024, 1, 25)])
+    assert rates.tolist() == [0.90, 0.90, 0.92, 150.0]
+
+def test_days_before_the_first_rate_take_the_first_rate(table):
+    # EUR is the first currency (the search lands at -1), JPY and VND follow
+    # another currency (the search lands on its last rate)
+    rates = table.rates(["EUR", "JPY", "VND"], [date(2023, 1, 1)] * 3)
+    assert rates.tolist() == [0.90, 140.0, 24000.0]
+
+def test_lookups_stay_within_their_currency(table):
+    # The day after EUR's last rate and before JPY's first
+    rates = table.rates(["EUR", "JPY"], [date(2024, 1, 21), date(2024, 1, 14)])
+    assert rates.tolist() == [0.92, 140.0]
+
+def test_pivot_and_unknown_currencies(table):
+    rates = table.rates(["USD", "gbp", "usd"], [date(2024, 1, 1)] * 3)
+    assert rates[0] == 1.0 and np.isnan(rates[1]) and rates[2] == 1.0
+
+def test_days_may_be_ordinals(table):
+    assert table.rates(["EUR"], np.array([date(2024, 1, 20).toordinal()])).tolist() == [0.92]
+
+def test_a_later_row_for_the_same_day_wins():
+    table = RateTable([("EUR", date(2024, 1, 10), 0.90), ("EUR", date(2024, 1, 10), 0.95)])
+    assert table.rates(["EUR"], [date(2024, 1, 10)]).tolist() == [0.95]
+
+def test_factors_convert_through_the_pivot(table):
+    day = [date(2024, 1, 25)] * 3
+    factors = table.factors(["JPY", "USD", "GBP"], day, base="EUR")
+    assert factors[0] == pytest.approx(0.92 / 150.0)
+    assert factors[1] == pytest.approx(0.92)
+    assert np.isnan(factors[2])
+
+def test_empty_table():
+    assert np.isnan(RateTable([]).rates(["EUR"], [date(2024, 1, 1)])).all()
@@ -0,0 +1,34 @@
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+
+from app.services.pagination import decode_cursor, encode_cursor, split_page
+
+@pytest.mark.parametrize("ts", [
+    datetime(2024, 6, 30, 23, 59, 59),
+    datetime(2024, 6, 30, 23, 59, 59, 123456, tzinfo=timezone.utc),
+    datetime(2024, 1, 1, tzinfo=timezone(timedelta(hours=7))),
+])
+def test_cursor_round_trips(ts):
+    cursor = encode_cursor(ts, 42)
+    assert "=" not in cursor and "/" not in cursor and "+" not in cursor
+    assert decode_cursor(cursor) == (ts, 42)
+
+@pytest.mark.parametrize("cursor", ["", "not-base64!", "bm9waXBl", encode_cursor(datetime(2024, 1, 1), 1)[:-3]])
+def test_malformed_cursor_raises_value_error(cursor):
+    with pytest.raises(ValueError, match="Invalid cursor"):
+        decode_cursor(cursor)
+
+def rows(count):
+    start = datetime(2024, 1, 1)
+    return [SimpleNamespace(id=i, date=start - timedelta(days=i)) for i in range(count)]
+
+def test_split_page_returns_a_cursor_at_the_last_row():
+    page, cursor = split_page(rows(4), 3)
+    assert [row.id for row in page] == [0, 1, 2]
+    assert decode_cursor(cursor) == (page[-1].date, 2)
+
+def test_split_page_without_extra_row_is_the_last_page():
+    page, cursor = split_page(rows(3), 3)
+    assert len(page) == 3 and cursor is None
@@ -0,0 +1,25 @@
+import pytest
+
+from app.services.portfolio import value_lots
+
+def test_lots_are_valued_at_the_quote_per_code():
+    result = value_lots(
+        ["VNM", "FPT", "VNM"], [100, 10, 50], [10.0, 100.0, 12.0], [5.0, 0.0, 0.0],
+        {"VNM": {"price": 15.0, "change_24h": 50.0}, "FPT": {"price": 90.0}},
+        cash=1000.0
+    )
+    vnm = next(p for p in result["positions"] if p["code"] == "VNM")
+    assert vnm["lots"] == 2 and vnm["volume"] == 150
+    assert vnm["cost"] == 1605.0 and vnm["value"] == 2250.0 and vnm["pnl"] == 645.0
+    assert vnm["day_change"] == pytest.approx(750.0)
+    assert result["totals"]["value"] == 3150.0
+    assert result["totals"]["net_asset_value"] == 4150.0
+    assert result["unpriced"] == []
+
+def test_unpriced_lots_are_valued_at_cost_with_no_pnl():
+    result = value_lots(["XYZ"], [100], [10.0], [25.0], {"XYZ": None})
+    (position,) = result["positions"]
+    assert position["price"] is None
+    assert position["value"] == position["cost"] == 1025.0
+    assert position["pnl"] == 0.0 and position["day_change"] == 0.0
+    assert result["unpriced"] == ["XYZ"]
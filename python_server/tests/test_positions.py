@@ -0,0 +1,87 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+
+from app.db_models import StockDB
+from app.services import positions
+from app.services.positions import LotBook, remaining, unit_cost
+
+def lot(id, volume, price, day, margin=0.0, remaining_volume=None, is_holding=True, code="VNM"):
+    return StockDB(
+        id=id, wallet_id=1, code=code, volume=volume, start_price=price, margin=margin,
+        start_date=datetime(2024, 1, day), remaining_volume=volume if remaining_volume is None else remaining_volume,
+        is_holding=is_holding
+    )
+
+def test_match_takes_the_oldest_lots_first():
+    newer, older, oldest = lot(3, 100, 12.0, 3), lot(2, 100, 11.0, 2), lot(1, 100, 10.0, 1)
+    book = LotBook([newer, older, oldest])
+    assert book.volume("VNM") == 300
+    assert book.match("VNM", 150) == [(oldest, 100), (older, 50)]
+
+def test_match_uses_the_open_shares_of_partly_sold_lots():
+    partly_sold = lot(1, 100, 10.0, 1, remaining_volume=30)
+    book = LotBook([partly_sold, lot(2, 100, 11.0, 2)])
+    (first, shares), (second, rest) = book.match("VNM", 50)
+    assert (first.id, shares, second.id, rest) == (1, 30, 2, 20)
+
+def test_closed_and_legacy_lots():
+    closed = lot(1, 100, 10.0, 1, remaining_volume=0, is_holding=False)
+    legacy = lot(2, 100, 10.0, 2)
+    legacy.remaining_volume = None  # Lots from before partial sells
+    book = LotBook([closed, legacy])
+    assert remaining(legacy) == 100
+    assert book.match("VNM", 100) == [(legacy, 100)]
+
+def test_ties_on_date_are_matched_by_id():
+    second, first = lot(8, 10, 10.0, 1), lot(7, 10, 10.0, 1)
+    assert [l.id for l, _ in LotBook([second, first]).match("VNM", 15)] == [7, 8]
+
+def test_selling_more_than_held_raises():
+    book = LotBook([lot(1, 100, 10.0, 1), lot(2, 5, 10.0, 1, code="FPT")])
+    with pytest.raises(ValueError, match="Only 100 share"):
+        book.match("VNM", 101)
+    with pytest.raises(ValueError):
+        book.match("HPG", 1)
+
+def test_unit_cost_spreads_the_buy_fee():
+    assert unit_cost(lot(1, 100, 10.0, 1, margin=50.0)) == 10.5
+
+class FakeSession:
+    def __init__(self):
+        self.added = []
+
+    def add(self, row):
+        self.added.append(row)
+
+async def noop(*args, **kwargs):
+    pass
+
+def test_close_books_fifo_realized_pnl(monkeypatch):
+    monkeypatch.setattr(positions.balances, "apply_deltas", noop)
+    monkeypatch.setattr(positions.ledger, "write", noop)
+    recorded = {}
+    monkeypatch.setattr(positions, "apply", lambda db, deltas: recorded.update(deltas) or noop())
+
+    first, second = lot(1, 100, 10.0, 1, margin=100.0), lot(2, 100, 20.0, 2)
+    book = LotBook([first, second])
+    db = FakeSession()
+    trade = asyncio.run(positions.close(db, 1, "VNM", book.match("VNM", 150), 30.0, 150.0, datetime(2024, 2, 1)))
+
+    # Net price 29: 100 shares at cost 11 and 50 at cost 20
+    assert trade.realized_pnl == pytest.approx(100 * 18 + 50 * 9)
+    assert (first.remaining_volume, first.is_holding, first.sell_price) == (0.0, False, 29.0)
+    assert (second.remaining_volume, second.is_holding) == (50, True)
+    assert recorded[(1, "VNM")] == pytest.approx([-150, -(100 * 11 + 50 * 20), 2250])
+    assert db.added == [trade]
+
+def test_lot_effects_add_up_to_what_reconciliation_expects():
+    sold_part = lot(1, 100, 10.0, 1, margin=50.0, remaining_volume=40)
+    sold_part.sell_price = 15.0
+    bought, sold = positions.buy_effect(sold_part), positions.sell_effect(sold_part)
+    assert bought == {"cash": -1050.0, "investment_value": 1000.0}
+    assert sold == {"cash": 900.0, "investment_value": -600.0}
+    # -(volume * start_price + margin) + sold * sell_price, open volume * start_price
+    assert bought["cash"] + sold["cash"] == -150.0
+    assert bought["investment_value"] + sold["investment_value"] == 400.0
@@ -0,0 +1,101 @@
+import asyncio
+
+from app.services.quote_cache import QuoteCache
+
+class Upstream:
+    """Fetcher returning an increasing price per call, optionally slow or failing"""
+
+    def __init__(self, delay: float = 0.0, fail: bool = False):
+        self.calls = 0
+        self.delay = delay
+        self.fail = fail
+
+    async def __call__(self):
+        self.calls += 1
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError("upstream down")
+        return {"price": float(self.calls)}
+
+def age(cache: QuoteCache, source: str, symbol: str, seconds: float):
+    cache.peek(source, symbol).fetched_at -= seconds
+
+def test_fresh_quote_is_served_from_cache():
+    async def run():
+        cache, upstream = QuoteCache(ttl=30, stale_ttl=300), Upstream()
+        first = await cache.get("crypto", "btc", upstream)
+        second = await cache.get("crypto", "BTC", upstream)
+        return cache, upstream, first, second
+
+    cache, upstream, first, second = asyncio.run(run())
+    assert first == second == {"price": 1.0}
+    assert upstream.calls == 1
+    assert cache.counters["misses"] == 1 and cache.counters["hits"] == 1
+
+def test_stale_quote_is_served_while_revalidating():
+    async def run():
+        cache, upstream = QuoteCache(ttl=30, stale_ttl=300), Upstream()
+        await cache.get("crypto", "BTC", upstream)
+        age(cache, "crypto", "BTC", 60)
+        stale = await cache.get("crypto", "BTC", upstream)
+        await asyncio.sleep(0.01)  # Let the background revalidation finish
+        return cache, upstream, stale
+
+    cache, upstream, stale = asyncio.run(run())
+    assert stale == {"price": 1.0}
+    assert upstream.calls == 2
+    assert cache.peek("crypto", "BTC").value == {"price": 2.0}
+    assert cache.counters["stale_hits"] == 1
+
+def test_quote_past_the_stale_window_is_a_miss():
+    async def run():
+        cache, upstream = QuoteCache(ttl=30, stale_ttl=300), Upstream()
+        await cache.get("crypto", "BTC", upstream)
+        age(cache, "crypto", "BTC", 400)
+        return cache, await cache.get("crypto", "BTC", upstream)
+
+    cache, quote = asyncio.run(run())
+    assert quote == {"price": 2.0}
+    assert cache.counters["misses"] == 2
+
+def test_concurrent_misses_share_one_fetch():
+    async def run():
+        cache, upstream = QuoteCache(ttl=30, stale_ttl=300), Upstream(delay=0.01)
+        quotes = await asyncio.gather(*[cache.get("gold", "GOLD", upstream) for _ in range(10)])
+        return cache, upstream, quotes
+
+    cache, upstream, quotes = asyncio.run(run())
+    assert upstream.calls == 1
+    assert all(quote == {"price": 1.0} for quote in quotes)
+    assert cache.counters["coalesced"] == 9
+
+def test_failed_refresh_keeps_the_last_quote():
+    async def run():
+        cache = QuoteCache(ttl=30, stale_ttl=300)
+        await cache.get("stock", "VNM", Upstream())
+        age(cache, "stock", "VNM", 400)
+        return cache, await cache.get("stock", "VNM", Upstream(fail=True))
+
+    cache, quote = asyncio.run(run())
+    assert quote == {"price": 1.0}
+    assert cache.counters["upstream_errors"] == 1
+
+def test_get_many_batches_misses_and_counts_generations():
+    batches = []
+
+    async def batch_fetcher(keys):
+        batches.append(sorted(keys))
+        return {key: {"price": 1.0} for key in keys if key != ("stock", "NONE")}
+
+    async def run():
+        cache = QuoteCache(ttl=30, stale_ttl=300)
+        cache.put("crypto", "BTC", {"price": 5.0})
+        generation = cache.generation
+        quotes = await cache.get_many([("crypto", "BTC"), ("crypto", "ETH"), ("stock", "NONE")], batch_fetcher)
+        return cache, generation, quotes
+
+    cache, generation, quotes = asyncio.run(run())
+    assert batches == [[("crypto", "ETH"), ("stock", "NONE")]]
+    assert quotes == {("crypto", "BTC"): {"price": 5.0}, ("crypto", "ETH"): {"price": 1.0}, ("stock", "NONE"): None}
+    assert cache.generation == generation + 1
@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+
+from app.services.returns import twr, xirr
+
+def test_twr_ignores_flows():
+    # 100 grows 10%, 50 is deposited, then the 160 grows 5%
+    values = np.array([100.0, 110.0, 168.0])
+    flows = np.array([0.0, 0.0, 50.0])
+    total, series = twr(values, flows)
+    assert total == pytest.approx(1.10 * 1.05 - 1)
+    assert series == pytest.approx([0.0, 0.10, 1.10 * 1.05 - 1])
+
+def test_twr_skips_days_with_nothing_invested():
+    values = np.array([0.0, 0.0, 100.0, 120.0])
+    flows = np.array([0.0, 0.0, 100.0, 0.0])
+    total, _ = twr(values, flows)
+    assert total == pytest.approx(0.20)
+
+def test_xirr_of_a_one_year_deposit():
+    assert xirr(np.array([-1000.0, 1100.0]), np.array([0.0, 1.0])) == pytest.approx(0.10)
+
+@pytest.mark.parametrize("rate", [-0.95, -0.3, 0.0, 0.07, 2.5, 40.0])
+def test_xirr_converges_across_rates(rate):
+    years = np.array([0.0, 0.25, 0.9, 1.5, 2.0])
+    amounts = np.array([-500.0, -200.0, 100.0, -50.0, 0.0])
+    amounts[-1] = -(amounts[:-1] * (1 + rate) ** -years[:-1]).sum() * (1 + rate) ** years[-1]
+    result = xirr(amounts, years)
+    assert result == pytest.approx(rate, rel=1e-6, abs=1e-8)
+    assert abs((amounts * (1 + result) ** -years).sum()) < 1e-6 * np.abs(amounts).sum()
+
+@pytest.mark.parametrize("amounts, years", [
+    ([-100.0], [0.0]),                          # A single flow
+    ([-100.0, -50.0], [0.0, 1.0]),              # No inflow
+    ([100.0, 50.0], [0.0, 1.0]),                # No outflow
+    ([-100.0, 110.0], [0.0, 0.0]),              # All at once
+    ([-100.0, 100.0, -100.0], [0.0, 1.0, 2.0]), # Negative at every rate
+])
+def test_xirr_without_a_root_is_none(amounts, years):
+    assert xirr(np.array(amounts), np.array(years)) is None
@@ -0,0 +1,35 @@
+import time
+from datetime import date, datetime, timedelta, timezone
+
+import pytest
+
+from app.services.net_worth import day_of
+from app.services.rollups import month_start
+from app.services.timestamps import utc
+
+@pytest.fixture(autouse=True)
+def far_from_utc(monkeypatch):
+    """Run on a host clock far ahead of UTC, where local and UTC days differ"""
+    monkeypatch.setenv("TZ", "Pacific/Kiritimati")  # UTC+14
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+def test_naive_values_are_utc_not_local():
+    naive = datetime(2024, 1, 31, 20, 0)
+    assert utc(naive) == datetime(2024, 1, 31, 20, 0, tzinfo=timezone.utc)
+    assert utc(naive) == utc(naive.replace(tzinfo=timezone.utc))
+
+def test_aware_values_are_converted():
+    hanoi = timezone(timedelta(hours=7))
+    assert utc(datetime(2024, 2, 1, 3, 0, tzinfo=hanoi)) == datetime(2024, 1, 31, 20, 0, tzinfo=timezone.utc)
+
+@pytest.mark.parametrize("value", [
+    datetime(2024, 1, 31, 20, 0),
+    datetime(2024, 1, 31, 20, 0, tzinfo=timezone.utc),
+    datetime(2024, 2, 1, 3, 0, tzinfo=timezone(timedelta(hours=7))),
+])
+def test_day_and_month_agree_for_naive_and_aware_values(value):
+    assert day_of(value) == date(2024, 1, 31)
+    assert month_start(value) == date(2024, 1, 1)
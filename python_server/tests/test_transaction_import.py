@@ -0,0 +1,65 @@
+import asyncio
+
+from app.db_models import WalletType
+from app.services import transaction_import
+
+CSV = b"""type,amount,description,category,date,wallet_id
+expense,10,"Lunch, with team",Food,2025-01-01,1
+income,oops,Salary,Work,2025-01-02,1
+expense,5,"Two
+lines",Food,2025-01-03,
+expense,7,Bus,Transport,2025-01-04,1
+expense,8,Taxi,Transport,2025-01-05,2
+"""
+
+class Result:
+    def all(self):
+        return [(1, WalletType.bank)]
+
+class StubSession:
+    def __init__(self):
+        self.commits = 0
+        self.rollbacks = 0
+
+    async def execute(self, stmt):
+        return Result()
+
+    async def commit(self):
+        self.commits += 1
+
+    async def rollback(self):
+        self.rollbacks += 1
+
+async def chunks(data: bytes, size: int = 7):
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+
+def run_import(monkeypatch, fail_batches=()):
+    inserted = []
+
+    async def insert(db, batch, wallet_types):
+        if len(inserted) + 1 in fail_batches:
+            inserted.append(None)
+            raise RuntimeError("deadlock detected")
+        inserted.append([row["description"] for row in batch])
+
+    monkeypatch.setattr(transaction_import, "_insert", insert)
+    db = StubSession()
+    report = asyncio.run(transaction_import.import_transactions(db, chunks(CSV), "csv", batch_size=2))
+    return db, inserted, report
+
+def test_rows_are_parsed_across_chunks_and_validated(monkeypatch):
+    db, inserted, report = run_import(monkeypatch)
+    assert inserted == [["Lunch, with team", "Two\nlines"], ["Bus"]]
+    assert report["rows"] == 5 and report["inserted"] == 3 and report["batches"] == 2
+    assert [error["row"] for error in report["errors"]] == [2, 5]
+    assert "Wallet 2 not found" in report["errors"][1]["error"]
+    assert db.commits == 2 and db.rollbacks == 0
+
+def test_a_failed_batch_is_reported_and_the_others_kept(monkeypatch):
+    db, inserted, report = run_import(monkeypatch, fail_batches={1})
+    assert inserted == [None, ["Bus"]]
+    assert report["inserted"] == 1 and report["batches"] == 1 and report["failed_batches"] == 1
+    assert [error["row"] for error in report["errors"]] == [1, 2, 3, 5]
+    assert "deadlock detected" in report["errors"][0]["error"]
+    assert db.commits == 1 and db.rollbacks == 1
@@ -0,0 +1,76 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import httpx
+from fastapi import FastAPI
+
+from app.database import get_async_db
+from app.db_models import TransactionDB, TransactionType
+from app.routers import transactions
+from app.services.pagination import decode_cursor
+
+class Result:
+    def __init__(self, rows):
+        self._rows = rows
+
+    def scalars(self):
+        return self
+
+    def all(self):
+        return self._rows
+
+class StubSession:
+    """Answers every query with the given rows (or raises), keeping the statements"""
+
+    def __init__(self, rows=(), error=None):
+        self.rows = list(rows)
+        self.error = error
+        self.statements = []
+
+    async def execute(self, stmt):
+        self.statements.append(stmt)
+        if self.error:
+            raise self.error
+        return Result(self.rows[:stmt._limit])
+
+def rows(count):
+    start = datetime(2025, 1, 1)
+    return [
+        TransactionDB(
+            id=count - i, type=TransactionType.expense, amount=1.0, description="", category="Food",
+            date=start - timedelta(days=i), created_at=start
+        )
+        for i in range(count)
+    ]
+
+def get(session, url):
+    app = FastAPI()
+    app.include_router(transactions.router)
+    app.dependency_overrides[get_async_db] = lambda: session
+
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.get(url)
+
+    return asyncio.run(run())
+
+def test_plain_listing_returns_the_first_page():
+    session = StubSession(rows(120))
+    response = get(session, "/api/transactions")
+    assert response.status_code == 200
+    assert len(response.json()) == transactions.DEFAULT_PAGE_SIZE
+    assert session.statements[0]._limit == transactions.DEFAULT_PAGE_SIZE + 1
+    assert decode_cursor(response.headers["X-Next-Cursor"])[1] == response.json()[-1]["id"]
+
+def test_last_page_has_no_cursor():
+    response = get(StubSession(rows(3)), "/api/transactions?limit=5")
+    assert len(response.json()) == 3
+    assert "X-Next-Cursor" not in response.headers
+
+def test_database_failure_is_503_not_an_empty_page():
+    response = get(StubSession(error=RuntimeError("connection refused")), "/api/transactions")
+    assert response.status_code == 503
+
+def test_malformed_cursor_is_400():
+    assert get(StubSession(), "/api/transactions?cursor=nope").status_code == 400